@@ -0,0 +1,123 @@
+#! /usr/bin/env python
+"""Measure the cold start time of the nagios plugin scripts.
+
+Each script is loaded in a new interpreter, as nagios runs it, without
+running its main function, so this measures the interpreter startup and
+the imports done before the script can do any work.
+Run from the root of the repository:
+    python benchmarks/cold_start.py [--runs N] [script ...]
+Exits with a non zero status if any script takes longer than its budget.
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGIN_DIR = os.path.join(REPO_DIR, 'managed_nagios_plugin')
+SCRIPTS_DIR = os.path.join(PLUGIN_DIR, 'resources', 'scripts')
+
+# Milliseconds allowed for the imports of each script, on top of the
+# interpreter's own startup time
+IMPORT_BUDGETS = {
+    'check_group_aggregate': 40,
+    'check_group_meta_aggregate': 40,
+    'check_monitoring_health': 40,
+    'check_nagios_command_file': 20,
+    'check_snmp_aggregate': 40,
+    'check_snmp_numeric': 30,
+    'check_snmptrap_checks': 30,
+    'cloudify_nagios_snmp_trap_handler': 20,
+    'evaluate_group_checks': 50,
+    'notify_cloudify': 40,
+}
+# Modules which are slow to import and are not needed by every run of the
+# scripts, so should only be imported when they are used
+HEAVY_MODULES = ('jinja2', 'requests', 'sqlite3', 'logging.config')
+
+# The scripts and their libraries are deployed in the same directory, and
+# the plugin libraries are found in the package directory here
+LOADER = '''
+import imp
+import sys
+sys.path[0:0] = [{scripts_dir!r}, {plugin_dir!r}]
+imp.load_source('cold_start_script', sys.argv[1])
+sys.stdout.write(' '.join(
+    name for name in {heavy!r} if name in sys.modules
+))
+'''.format(scripts_dir=SCRIPTS_DIR, plugin_dir=PLUGIN_DIR,
+           heavy=HEAVY_MODULES)
+
+
+def time_command(command, runs):
+    timings = []
+    output = None
+    for _ in range(runs):
+        start = time.time()
+        output = subprocess.check_output(command)
+        timings.append((time.time() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2], output
+
+
+def main(args):
+    parser = argparse.ArgumentParser(
+        description='Measure the cold start time of the plugin scripts',
+    )
+    parser.add_argument(
+        'scripts',
+        nargs='*',
+        default=sorted(IMPORT_BUDGETS),
+        help='Scripts to measure. Defaults to all check and handler scripts.',
+    )
+    parser.add_argument(
+        '--runs',
+        type=int,
+        default=10,
+        help='Number of runs of each script. The median is reported.',
+    )
+    args = parser.parse_args(args)
+
+    baseline, _ = time_command([sys.executable, '-c', 'pass'], args.runs)
+    print('Interpreter startup: {baseline:.1f}ms'.format(baseline=baseline))
+    print('{script:<36}{total:>9}{imports:>9}{budget:>9}  heavy imports'
+          .format(script='script', total='total', imports='imports',
+                  budget='budget'))
+
+    over_budget = []
+    for script in args.scripts:
+        try:
+            total, heavy = time_command(
+                [sys.executable, '-c', LOADER,
+                 os.path.join(SCRIPTS_DIR, script)],
+                args.runs,
+            )
+        except subprocess.CalledProcessError:
+            # e.g. selinux bindings are only available on the nagios server
+            print('{script:<36}could not be loaded'.format(script=script))
+            continue
+        imports = total - baseline
+        budget = IMPORT_BUDGETS.get(script)
+        if budget is not None and imports > budget:
+            over_budget.append(script)
+        print('{script:<36}{total:>7.1f}ms{imports:>7.1f}ms{budget:>9}  '
+              '{heavy}'.format(
+                  script=script,
+                  total=total,
+                  imports=imports,
+                  budget='{0}ms'.format(budget) if budget else '-',
+                  heavy=heavy or '-',
+              ))
+
+    if over_budget:
+        print('Over budget: {scripts}'.format(
+            scripts=', '.join(over_budget),
+        ))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
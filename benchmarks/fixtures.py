@@ -0,0 +1,325 @@
+"""Synthetic nagios data for the benchmarks.
+
+Hosts are instances of the 'server' node, with HOSTS_PER_DEPLOYMENT
+instances in each deployment of a single tenant. Each instance has an SNMP
+value check and an SNMP trap check, and each node has an aggregate check.
+The nodes are split between GROUP_INSTANCES instances of a group type,
+which a meta group aggregates.
+"""
+import hashlib
+import json
+import os
+import stat
+
+TENANT = 'bench'
+TARGET_TYPE = 'bench_type'
+GROUP_TYPE = 'bench_group'
+NODE = 'server'
+HOSTS_PER_DEPLOYMENT = 10
+GROUP_INSTANCES = 10
+VALUE_CHECK = 'cpu'
+AGGREGATE_CHECK = 'cpu_total'
+TRAP_OID = '.1.3.6.1.4.1.52312.900.0.0.1'
+TRAP_NAME = 'benchTrap'
+# Normalised names of the OIDs in the fake traps, as snmptranslate would
+# give them
+OID_LOOKUPS = {
+    '.1.3.6.1.6.3.1.1.4.1.0': 'snmpTrapOID.0',
+    'snmp.1.1.4.1.0': 'snmpTrapOID.0',
+    'system.sysUpTime.0': 'sysUpTime.0',
+    TRAP_OID: TRAP_NAME,
+}
+FAKE_CHECK_SNMP = (
+    '#! /bin/sh\n'
+    'echo \'SNMP OK - 42 | iso.3.6.1.2.1.1.3.0=42\'\n'
+)
+# Logging as deployed with the default component_log_level, but without
+# needing syslog
+LOGGING_CONFIG = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'null': {
+            'class': 'logging.NullHandler',
+            'level': 'WARNING',
+        },
+    },
+    'loggers': {
+        '': {
+            'handlers': ['null'],
+            'level': 'WARNING',
+        },
+    },
+}
+
+
+def get_instance_name(number):
+    return '{node}_{number:06x}'.format(node=NODE, number=number)
+
+
+def get_instance_address(number):
+    return '10.{0}.{1}.{2}'.format(
+        number >> 16 & 255, number >> 8 & 255, number & 255,
+    )
+
+
+def get_deployment_name(number):
+    return 'dep{number}'.format(number=number // HOSTS_PER_DEPLOYMENT)
+
+
+def get_node_host_name(deployment):
+    return 'tenant:{tenant}/deployment:{deployment}/node:{node}'.format(
+        tenant=TENANT,
+        deployment=deployment,
+        node=NODE,
+    )
+
+
+def get_group_name(number):
+    return 'group{number}'.format(number=number)
+
+
+def get_group_pseudo_host_name():
+    # As group_check_utils.get_pseudo_host_name
+    return 'tenant:{tenant}/group_type:{group_type}'.format(
+        tenant=TENANT,
+        group_type=GROUP_TYPE,
+    )
+
+
+def get_group_service_description(group_name):
+    # As group_check_utils.get_group_instance_service_description
+    return 'Instance {group_name} of group {group_type} for tenant ' \
+        '{tenant}'.format(
+            group_name=group_name,
+            group_type=GROUP_TYPE,
+            tenant=TENANT,
+        )
+
+
+def get_deployments(hosts):
+    deployments = {}
+    for number in range(hosts):
+        deployments.setdefault(get_deployment_name(number), []).append(
+            get_instance_name(number),
+        )
+    return deployments
+
+
+def _write_section(handle, section, entries, separator):
+    handle.write('{section} {{\n'.format(section=section))
+    for key, value in entries:
+        handle.write('\t{key}{separator}{value}\n'.format(
+            key=key,
+            separator=separator,
+            value=value,
+        ))
+    handle.write('\t}\n\n')
+
+
+def write_objects_cache(path, hosts):
+    deployments = get_deployments(hosts)
+    with open(path, 'w') as cache_handle:
+        for number in range(hosts):
+            _write_section(cache_handle, 'define host', [
+                ('host_name', get_instance_name(number)),
+                ('address', get_instance_address(number)),
+            ], '\t')
+        for deployment, instances in sorted(deployments.items()):
+            _write_section(cache_handle, 'define host', [
+                ('host_name', get_node_host_name(deployment)),
+            ], '\t')
+            _write_section(cache_handle, 'define hostgroup', [
+                ('hostgroup_name', 'tenant:{tenant}/deployment:{dep}'.format(
+                    tenant=TENANT,
+                    dep=deployment,
+                )),
+                ('members', ','.join(instances)),
+            ], '\t')
+        _write_section(cache_handle, 'define hostgroup', [
+            ('hostgroup_name', 'target_type:{target_type}'.format(
+                target_type=TARGET_TYPE,
+            )),
+            ('members', ','.join(
+                get_instance_name(number) for number in range(hosts)
+            )),
+        ], '\t')
+        for number in range(hosts):
+            _write_section(cache_handle, 'define service', [
+                ('host_name', get_instance_name(number)),
+                ('service_description', '{target_type}_instances:'
+                 'SNMPTRAP {trap}'.format(target_type=TARGET_TYPE,
+                                          trap=TRAP_NAME)),
+                ('check_command', 'no_check'),
+                ('active_checks_enabled', '0'),
+            ], '\t')
+
+
+def write_status(path, hosts):
+    deployments = get_deployments(hosts)
+    with open(path, 'w') as status_handle:
+        _write_section(status_handle, 'info', [('version', '4.3.4')], '=')
+        for number in range(hosts):
+            host_name = get_instance_name(number)
+            _write_section(status_handle, 'hoststatus', [
+                ('host_name', host_name),
+                ('current_state', '0'),
+            ], '=')
+            _write_section(status_handle, 'servicestatus', [
+                ('host_name', host_name),
+                ('service_description', '{target_type}_instances:'
+                 '{check}'.format(target_type=TARGET_TYPE,
+                                  check=VALUE_CHECK)),
+                ('current_state', '0'),
+                ('plugin_output', 'SNMP OK - 42'),
+                ('performance_data', 'iso.3.6.1.2.1.1.3.0=42'),
+            ], '=')
+            _write_section(status_handle, 'servicestatus', [
+                ('host_name', host_name),
+                ('service_description', '{target_type}_instances:'
+                 'SNMPTRAP {trap}'.format(target_type=TARGET_TYPE,
+                                          trap=TRAP_NAME)),
+                ('current_state', '0'),
+                ('plugin_output', 'No traps received'),
+                ('performance_data', ''),
+            ], '=')
+        for deployment in sorted(deployments):
+            _write_section(status_handle, 'servicestatus', [
+                ('host_name', get_node_host_name(deployment)),
+                ('service_description', '{target_type}_nodes:'
+                 '{check}'.format(target_type=TARGET_TYPE,
+                                  check=AGGREGATE_CHECK)),
+                ('current_state', '0'),
+                ('plugin_output', 'SNMP OK - 420'),
+                ('performance_data', 'sum({check})=420'.format(
+                    check=VALUE_CHECK,
+                )),
+            ], '=')
+        for group in range(GROUP_INSTANCES):
+            _write_section(status_handle, 'servicestatus', [
+                ('host_name', get_group_pseudo_host_name()),
+                ('service_description', get_group_service_description(
+                    get_group_name(group),
+                )),
+                ('current_state', '0'),
+                ('plugin_output', 'OK'),
+                ('performance_data', 'sum({group_type}/{group})=4200'.format(
+                    group_type=GROUP_TYPE,
+                    group=get_group_name(group),
+                )),
+            ], '=')
+
+
+def write_group_index(path, hosts):
+    # As group_index keeps it, see group_index.get_group_index_path
+    nodes = sorted(get_node_host_name(deployment)
+                   for deployment in get_deployments(hosts))
+    members = dict(
+        (get_group_name(group), nodes[group::GROUP_INSTANCES])
+        for group in range(GROUP_INSTANCES)
+    )
+    index_path = os.path.join(
+        path,
+        hashlib.md5(TENANT).hexdigest(),
+        '{group_type}.json'.format(
+            group_type=hashlib.md5(GROUP_TYPE).hexdigest(),
+        ),
+    )
+    os.makedirs(os.path.dirname(index_path))
+    with open(index_path, 'w') as index_handle:
+        json.dump({
+            'members': members,
+            'names': sorted(members),
+            'children': {},
+            'parents': {},
+        }, index_handle)
+
+
+def write_target_configurations(path, hosts):
+    # One configuration file per instance, as nagiosrest deploys them
+    os.makedirs(path)
+    for number in range(hosts):
+        instance = get_instance_name(number)
+        with open(os.path.join(path, instance + '.cfg'), 'w') as handle:
+            handle.write(
+                'define host {{\n'
+                '  host_name {instance}\n'
+                '  address {address}\n'
+                '  hostgroups tenant:{tenant}/deployment:{deployment}\n'
+                '}}\n'.format(
+                    instance=instance,
+                    address=get_instance_address(number),
+                    tenant=TENANT,
+                    deployment=get_deployment_name(number),
+                )
+            )
+
+
+def write_fake_check_snmp(path):
+    with open(path, 'w') as script_handle:
+        script_handle.write(FAKE_CHECK_SNMP)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+
+
+def get_trap_input(hosts):
+    # As snmptrapd passes a trap to its handler, for a trap from the last
+    # host so that finding the host scans all of them
+    address = get_instance_address(hosts - 1)
+    return [
+        'monitored-host\n',
+        'UDP: [{address}]:58628->[192.0.2.214]:162\n'.format(
+            address=address,
+        ),
+        'system.sysUpTime.0 1234\n',
+        'snmp.1.1.4.1.0 {oid}\n'.format(oid=TRAP_OID),
+    ]
+
+
+def create_fixtures(base_dir, hosts):
+    """Create the nagios data files for a number of hosts in base_dir,
+    returning a dict of the paths of the files.
+    """
+    paths = {
+        'objects_cache': os.path.join(base_dir, 'objects.cache'),
+        'status': os.path.join(base_dir, 'status.dat'),
+        'command_file': os.path.join(base_dir, 'nagios.cmd'),
+        'logging_config': os.path.join(base_dir, 'logging.cfg'),
+        'plugins_dir': os.path.join(base_dir, 'plugins'),
+        'target_types_dir': os.path.join(base_dir, 'target_types'),
+        'traps_dir': os.path.join(base_dir, 'snmp_traps'),
+        'group_index_dir': os.path.join(base_dir, 'groups', 'index'),
+        'group_checks': os.path.join(base_dir, 'groups', 'checks.json'),
+        'targets_dir': os.path.join(base_dir, 'objects', 'targets'),
+        'objects_dir': os.path.join(base_dir, 'objects'),
+    }
+    write_objects_cache(paths['objects_cache'], hosts)
+    write_status(paths['status'], hosts)
+    open(paths['command_file'], 'w').close()
+    with open(paths['logging_config'], 'w') as logging_handle:
+        json.dump(LOGGING_CONFIG, logging_handle)
+
+    os.makedirs(paths['plugins_dir'])
+    write_fake_check_snmp(os.path.join(paths['plugins_dir'], 'check_snmp'))
+
+    os.makedirs(paths['target_types_dir'])
+    target_type_hash = hashlib.md5(TARGET_TYPE).hexdigest()
+    open(os.path.join(paths['target_types_dir'],
+                      target_type_hash + '.ini'), 'w').close()
+    with open(os.path.join(paths['target_types_dir'],
+                           target_type_hash + '.json'), 'w') as handle:
+        json.dump({'traps': {TRAP_NAME: {'workflow': 'heal'}}}, handle)
+    with open(os.path.join(paths['target_types_dir'],
+                           'registered_types.json'), 'w') as handle:
+        json.dump([TARGET_TYPE], handle)
+
+    os.makedirs(paths['traps_dir'])
+    with open(os.path.join(paths['traps_dir'],
+                           TRAP_NAME + '.json'), 'w') as handle:
+        json.dump({}, handle)
+
+    write_group_index(paths['group_index_dir'], hosts)
+    with open(paths['group_checks'], 'w') as checks_handle:
+        json.dump([AGGREGATE_CHECK], checks_handle)
+
+    write_target_configurations(paths['targets_dir'], hosts)
+    return paths
@@ -0,0 +1,379 @@
+#! /usr/bin/env python
+"""Time the plugin scripts and libraries against synthetic nagios data.
+
+Run from the root of the repository:
+    python benchmarks/run_benchmarks.py [--sizes 1000,10000] [benchmark ...]
+Each benchmark is run against generated status.dat and objects.cache files
+for each number of hosts, with the scripts' caches emptied before each run
+as each check runs in a new process. Results are appended to a history file
+and compared with the previous results for the same benchmark and size.
+The nagiosrest benchmarks need flask, so are skipped if it is not
+installed. Privileged operations, e.g. deploying configuration with sudo
+and reloading nagios, are not performed.
+"""
+from __future__ import print_function
+
+import argparse
+from contextlib import contextmanager
+import imp
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import mock
+
+import fixtures
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+PLUGIN_DIR = os.path.join(REPO_DIR, 'managed_nagios_plugin')
+SCRIPTS_DIR = os.path.join(PLUGIN_DIR, 'resources', 'scripts')
+sys.path[0:0] = [SCRIPTS_DIR, PLUGIN_DIR]
+
+import group_check_utils  # noqa
+import group_index  # noqa
+import logging_utils  # noqa
+import nagios_plugin_utils  # noqa
+import nagios_utils  # noqa
+import snmp_utils  # noqa
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_HISTORY_PATH = os.path.join(BENCHMARKS_DIR, 'history.jsonl')
+
+
+def load_script(name, directory=SCRIPTS_DIR):
+    return imp.load_source(
+        'benchmark_' + name,
+        os.path.join(directory, name),
+    )
+
+
+def run_script_main(main, *args):
+    # The scripts report their result by printing it and exiting
+    with open(os.devnull, 'w') as devnull:
+        stdout = sys.stdout
+        sys.stdout = devnull
+        try:
+            main(*args)
+        except SystemExit:
+            pass
+        finally:
+            sys.stdout = stdout
+
+
+@contextmanager
+def nagios_environment(paths):
+    # Point the libraries at the fixtures rather than the nagios server's
+    # files
+    patches = [
+        mock.patch.object(nagios_utils, 'NAGIOS_STATUS_FILE',
+                          paths['status']),
+        mock.patch.object(nagios_utils, 'NAGIOS_CONFIG_CACHE_FILE',
+                          paths['objects_cache']),
+        mock.patch.object(nagios_utils, 'NAGIOS_EXTERNAL_COMMAND_FILE',
+                          paths['command_file']),
+        mock.patch.object(nagios_plugin_utils, 'TARGET_TYPE_BASE_PATH',
+                          paths['target_types_dir']),
+        mock.patch.dict(nagios_utils.TYPE_PATHS,
+                        {'target': paths['target_types_dir']}),
+        mock.patch.object(group_index, 'GROUP_INDEX_DIR',
+                          paths['group_index_dir']),
+        mock.patch.object(group_check_utils, 'GROUP_CHECKS_PATH',
+                          paths['group_checks']),
+        mock.patch.object(
+            logging_utils, 'Logger',
+            LoggerFactory(logging_utils.Logger, paths['logging_config']),
+        ),
+    ]
+    for patch in patches:
+        patch.start()
+    try:
+        yield
+    finally:
+        for patch in patches:
+            patch.stop()
+
+
+class LoggerFactory(object):
+    # Loggers configured from the fixtures' logging configuration
+    def __init__(self, logger_class, config_location):
+        self.logger_class = logger_class
+        self.config_location = config_location
+
+    def __call__(self, name):
+        return self.logger_class(name, config_location=self.config_location)
+
+
+def reset_caches():
+    nagios_utils.NAGIOS_CONFIGURATION = None
+    nagios_utils.INSTANCE_DETAILS_CACHE.clear()
+
+
+def bench_parse_status(paths):
+    nagios_utils.parse_nagios_data_file(paths['status'], '=')
+
+
+def bench_parse_objects_cache(paths):
+    nagios_utils.parse_nagios_data_file(paths['objects_cache'], '\t')
+
+
+def bench_check_snmp_aggregate(paths):
+    # run_check finds check_snmp next to the script, so this is run from a
+    # copy of the script alongside the fake check_snmp
+    script = load_script('check_snmp_aggregate', paths['plugins_dir'])
+    run_script_main(script.main, [
+        '--node={node}'.format(
+            node=fixtures.get_node_host_name(fixtures.get_deployment_name(0)),
+        ),
+        '--target-type={target_type}'.format(
+            target_type=fixtures.TARGET_TYPE,
+        ),
+        '--unknown=abort',
+        '--approach=arithmetic_mean',
+        '--oids=sysUpTime.0',
+    ])
+
+
+def bench_check_group_aggregate(paths):
+    script = load_script('check_group_aggregate')
+    run_script_main(script.main, [
+        '--group-type={group_type}'.format(group_type=fixtures.GROUP_TYPE),
+        '--group-instance={group}'.format(group=fixtures.get_group_name(0)),
+        '--tenant={tenant}'.format(tenant=fixtures.TENANT),
+        '--unknown=abort',
+        '--approach=sum',
+    ])
+
+
+def bench_check_group_meta_aggregate(paths):
+    script = load_script('check_group_meta_aggregate')
+    run_script_main(script.main, [
+        '--group-type={group_type}'.format(group_type=fixtures.GROUP_TYPE),
+        '--group-instance-prefix=group',
+        '--tenant={tenant}'.format(tenant=fixtures.TENANT),
+        '--unknown=abort',
+        '--approach=sum',
+    ])
+
+
+def bench_trap_handler(paths):
+    script = load_script('cloudify_nagios_snmp_trap_handler')
+    script.TRAP_CONFIG_PATH = os.path.join(paths['traps_dir'],
+                                           '{oid}.json')
+    script.REACTION_CONFIG_PATH = os.path.join(paths['target_types_dir'],
+                                               '{target_type}.json')
+    # snmptranslate is not run for the OIDs in the fake traps
+    snmp_utils.OIDLookup._normalised_oids.update(fixtures.OID_LOOKUPS)
+    stdin = sys.stdin
+    sys.stdin = FakeTrapInput(fixtures.get_trap_input(paths['hosts']))
+    try:
+        run_script_main(script.main)
+    finally:
+        sys.stdin = stdin
+
+
+class FakeTrapInput(object):
+    def __init__(self, lines):
+        self._lines = list(lines)
+
+    def readline(self):
+        return self._lines.pop(0)
+
+    def readlines(self):
+        lines = self._lines
+        self._lines = []
+        return lines
+
+
+@contextmanager
+def nagiosrest_client(paths):
+    import nagiosrest
+    patches = [
+        mock.patch.object(nagiosrest, 'BASE_OBJECTS_DIR',
+                          paths['objects_dir']),
+        mock.patch.object(nagiosrest, 'create_target'),
+        mock.patch.object(nagiosrest, 'remove_configuration_file'),
+        mock.patch.object(nagiosrest, 'run'),
+        mock.patch.object(nagiosrest, 'trigger_nagios_reload'),
+        mock.patch.object(nagiosrest.rate_store, 'purge'),
+    ]
+    for patch in patches:
+        patch.start()
+    try:
+        yield nagiosrest.application.test_client()
+    finally:
+        for patch in patches:
+            patch.stop()
+
+
+def get_target_url(paths):
+    number = paths['hosts'] - 1
+    return '/targets/{tenant}/{deployment}/{instance}'.format(
+        tenant=fixtures.TENANT,
+        deployment=fixtures.get_deployment_name(number),
+        instance=fixtures.get_instance_name(number),
+    )
+
+
+def bench_nagiosrest_create_target(paths):
+    number = paths['hosts'] - 1
+    with nagiosrest_client(paths) as client:
+        client.put(
+            get_target_url(paths),
+            data=json.dumps({
+                'instance_ip': fixtures.get_instance_address(number),
+                'target_type': fixtures.TARGET_TYPE,
+            }),
+            content_type='application/json',
+        )
+
+
+def bench_nagiosrest_delete_target(paths):
+    with nagiosrest_client(paths) as client:
+        client.delete(get_target_url(paths))
+
+
+def flask_available():
+    try:
+        imp.find_module('flask')
+    except ImportError:
+        return False
+    return True
+
+
+BENCHMARKS = [
+    ('parse_status', bench_parse_status, None),
+    ('parse_objects_cache', bench_parse_objects_cache, None),
+    ('check_snmp_aggregate', bench_check_snmp_aggregate, None),
+    ('check_group_aggregate', bench_check_group_aggregate, None),
+    ('check_group_meta_aggregate', bench_check_group_meta_aggregate, None),
+    ('trap_handler', bench_trap_handler, None),
+    ('nagiosrest_create_target', bench_nagiosrest_create_target,
+     flask_available),
+    ('nagiosrest_delete_target', bench_nagiosrest_delete_target,
+     flask_available),
+]
+
+
+def run_benchmark(function, paths, runs):
+    timings = []
+    for _ in range(runs):
+        reset_caches()
+        start = time.time()
+        function(paths)
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def get_revision():
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=REPO_DIR, stderr=devnull,
+            ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_previous_results(history_path):
+    previous = {}
+    if not os.path.exists(history_path):
+        return previous
+    with open(history_path) as history_handle:
+        for line in history_handle:
+            entry = json.loads(line)
+            for result in entry['results']:
+                previous[(result['benchmark'], result['hosts'])] = (
+                    result['seconds']
+                )
+    return previous
+
+
+def main(args):
+    parser = argparse.ArgumentParser(
+        description='Time the plugin scripts against synthetic nagios data',
+    )
+    parser.add_argument(
+        'benchmarks',
+        nargs='*',
+        default=[name for name, _, _ in BENCHMARKS],
+        help='Benchmarks to run. Defaults to all of them.',
+    )
+    parser.add_argument(
+        '--sizes',
+        type=lambda sizes: [int(size) for size in sizes.split(',')],
+        default=DEFAULT_SIZES,
+        help='Comma separated numbers of hosts to generate data for.',
+    )
+    parser.add_argument(
+        '--runs',
+        type=int,
+        default=3,
+        help='Number of runs of each benchmark. The fastest is reported.',
+    )
+    parser.add_argument(
+        '--history',
+        default=DEFAULT_HISTORY_PATH,
+        help='File to record the results in, and compare them with.',
+    )
+    args = parser.parse_args(args)
+
+    previous = load_previous_results(args.history)
+    benchmarks = [
+        benchmark for benchmark in BENCHMARKS
+        if benchmark[0] in args.benchmarks
+    ]
+    results = []
+    print('{name:<30}{hosts:>8}{seconds:>11}{change:>9}'.format(
+        name='benchmark', hosts='hosts', seconds='seconds', change='change',
+    ))
+    for hosts in args.sizes:
+        base_dir = tempfile.mkdtemp(prefix='nagios_benchmark')
+        try:
+            paths = fixtures.create_fixtures(base_dir, hosts)
+            paths['hosts'] = hosts
+            shutil.copy(os.path.join(SCRIPTS_DIR, 'check_snmp_aggregate'),
+                        paths['plugins_dir'])
+            with nagios_environment(paths):
+                for name, function, available in benchmarks:
+                    if available and not available():
+                        print('{name:<30}{hosts:>8}    skipped'.format(
+                            name=name, hosts=hosts,
+                        ))
+                        continue
+                    seconds = run_benchmark(function, paths, args.runs)
+                    results.append({
+                        'benchmark': name,
+                        'hosts': hosts,
+                        'seconds': seconds,
+                    })
+                    last = previous.get((name, hosts))
+                    print('{name:<30}{hosts:>8}{seconds:>11.4f}{change:>9}'
+                          .format(
+                              name=name,
+                              hosts=hosts,
+                              seconds=seconds,
+                              change='{0:+.1%}'.format(
+                                  seconds / last - 1
+                              ) if last else '-',
+                          ))
+        finally:
+            shutil.rmtree(base_dir)
+
+    with open(args.history, 'a') as history_handle:
+        history_handle.write(json.dumps({
+            'time': time.time(),
+            'revision': get_revision(),
+            'python': sys.version.split()[0],
+            'runs': args.runs,
+            'results': results,
+        }) + '\n')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,214 @@
+from array import array
+import argparse
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Aggregation approaches shared by the aggregate and group checks.
+# Approaches that can be calculated in one pass accept any iterable, so that
+# callers may stream values rather than building lists of them. Approaches
+# that need all values (median and percentiles) keep them in a compact array
+# of doubles rather than a list of float objects, and use numpy if it is
+# available.
+# Some approaches take a parameter, given after a colon, e.g. count_over:100
+
+
+class AggregationError(ValueError):
+    pass
+
+
+def calculate_mean(values):
+    count = 0
+    total = 0.0
+    for value in values:
+        count += 1
+        total += value
+    return total / count
+
+
+def calculate_sum(values):
+    return sum(values)
+
+
+def calculate_min(values):
+    return min(values)
+
+
+def calculate_max(values):
+    return max(values)
+
+
+def calculate_stddev(values):
+    # Population standard deviation, using Welford's method for numerical
+    # stability in a single pass
+    count = 0
+    mean = 0.0
+    squared_distances = 0.0
+    for value in values:
+        count += 1
+        delta = value - mean
+        mean += delta / count
+        squared_distances += delta * (value - mean)
+    return math.sqrt(squared_distances / count)
+
+
+def calculate_percentile(values, percentile):
+    values = array('d', values)
+    if numpy is not None:
+        return float(numpy.percentile(numpy.frombuffer(values), percentile))
+
+    # Linear interpolation between the closest ranks, as numpy does
+    values = sorted(values)
+    position = (len(values) - 1) * percentile / 100.0
+    lower = int(math.floor(position))
+    upper = int(math.ceil(position))
+    return values[lower] + (values[upper] - values[lower]) * (
+        position - lower
+    )
+
+
+def calculate_median(values):
+    return calculate_percentile(values, 50)
+
+
+def calculate_count_over(values, threshold):
+    return float(sum(1 for value in values if value > threshold))
+
+
+def calculate_weighted_mean(values, weights):
+    total = 0.0
+    total_weight = 0.0
+    for value, weight in zip(values, weights):
+        total += value * weight
+        total_weight += weight
+    if total_weight == 0:
+        # e.g. when weighting by request counts and there were no requests
+        raise AggregationError(
+            'The total weight of the values was 0, so a weighted mean '
+            'could not be calculated'
+        )
+    return total / total_weight
+
+
+APPROACHES = {
+    'arithmetic_mean': calculate_mean,
+    'sum': calculate_sum,
+    'min': calculate_min,
+    'max': calculate_max,
+    'median': calculate_median,
+    'p90': lambda values: calculate_percentile(values, 90),
+    'p95': lambda values: calculate_percentile(values, 95),
+    'p99': lambda values: calculate_percentile(values, 99),
+    'stddev': calculate_stddev,
+}
+PARAMETERISED_APPROACHES = {
+    'count_over': calculate_count_over,
+}
+WEIGHTED_APPROACHES = {
+    'weighted_mean': calculate_weighted_mean,
+}
+
+
+def parse_approach(approach, allow_weighted=True):
+    name, _, parameter = approach.partition(':')
+    if name in PARAMETERISED_APPROACHES:
+        try:
+            return name, float(parameter)
+        except ValueError:
+            raise ValueError(
+                'Approach {name} requires a numeric parameter, e.g. '
+                '{name}:100'.format(name=name)
+            )
+    if parameter:
+        raise ValueError(
+            'Approach {name} does not take a parameter'.format(name=name)
+        )
+    if name in APPROACHES or (allow_weighted and name in WEIGHTED_APPROACHES):
+        return name, None
+    raise ValueError(
+        'Unknown approach {approach}. Valid approaches are: '
+        '{approaches}'.format(
+            approach=approach,
+            approaches=', '.join(
+                get_approach_names(allow_weighted=allow_weighted),
+            ),
+        )
+    )
+
+
+def validate_window(window, window_approach, window_samples):
+    """Check the settings for aggregating results within a window, returning
+    the window in seconds and the number of samples as numbers.
+    Raises ValueError if they are not valid.
+    """
+    try:
+        window = float(window)
+    except (TypeError, ValueError):
+        raise ValueError(
+            'window must be a number of seconds, but was {window}'.format(
+                window=window,
+            )
+        )
+    if window < 0:
+        raise ValueError(
+            'window must not be negative, but was {window}'.format(
+                window=window,
+            )
+        )
+    # Windows are aggregated without weights
+    parse_approach(window_approach, allow_weighted=False)
+    try:
+        samples = int(window_samples)
+    except (TypeError, ValueError):
+        samples = None
+    if samples is None or samples < 1:
+        raise ValueError(
+            'window_samples must be at least 1, but was {samples}'.format(
+                samples=window_samples,
+            )
+        )
+    return window, samples
+
+
+def get_approach_names(allow_weighted=True):
+    names = list(APPROACHES)
+    names.extend(
+        '{name}:<threshold>'.format(name=name)
+        for name in PARAMETERISED_APPROACHES
+    )
+    if allow_weighted:
+        names.extend(WEIGHTED_APPROACHES)
+    return sorted(names)
+
+
+def is_weighted(approach):
+    return parse_approach(approach)[0] in WEIGHTED_APPROACHES
+
+
+def aggregate(approach, values, weights=None):
+    name, parameter = parse_approach(approach)
+    if name in WEIGHTED_APPROACHES:
+        return WEIGHTED_APPROACHES[name](values, weights)
+    elif name in PARAMETERISED_APPROACHES:
+        return PARAMETERISED_APPROACHES[name](values, parameter)
+    else:
+        return APPROACHES[name](values)
+
+
+def approach_argument(approach):
+    try:
+        parse_approach(approach)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(str(err))
+    return approach
+
+
+def unweighted_approach_argument(approach):
+    try:
+        parse_approach(approach, allow_weighted=False)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(str(err))
+    return approach
@@ -1,6 +1,9 @@
 import hashlib
 import os
 
+from cloudify.exceptions import NonRecoverableError
+
+from managed_nagios_plugin.aggregation import validate_window
 from managed_nagios_plugin.cloudify_utils import (
     get_relationship_target,
 )
@@ -25,6 +28,24 @@ def get_check_basedir(target_type):
                         hashlib.md5(target_type).hexdigest())
 
 
+def get_window_arguments(props):
+    if not props['window']:
+        return ''
+    try:
+        validate_window(props['window'], props['window_approach'],
+                        props['window_samples'])
+    except ValueError as err:
+        raise NonRecoverableError(str(err))
+    return (
+        '--window={window} --window-approach={approach} '
+        '--window-samples={samples}'.format(
+            window=props['window'],
+            approach=props['window_approach'],
+            samples=props['window_samples'],
+        )
+    )
+
+
 def create_check(logger, check_type, target_type, name, params):
     check_path = get_check_configuration_destination(target_type, name)
     check_basedir = os.path.dirname(check_path)
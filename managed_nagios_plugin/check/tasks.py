@@ -5,6 +5,8 @@ import os
 from cloudify.decorators import operation
 from cloudify.exceptions import NonRecoverableError
 
+from managed_nagios_plugin.aggregation import parse_approach
+from managed_nagios_plugin.check import get_window_arguments
 from managed_nagios_plugin.cloudify_utils import (
     get_all_relationship_targets,
 )
@@ -14,8 +16,10 @@ from managed_nagios_plugin.constants import (
 from managed_nagios_plugin.utils import (
     deploy_configuration_file,
     deploy_file,
+    get_evaluation_parameters,
     make_config_subdir,
     run,
+    update_type_registry,
 )
 
 
@@ -29,6 +33,19 @@ def create_group(ctx):
             'Group names must not contain : or /.'
         )
 
+    try:
+        # Group checks have no weights for their members' values
+        parse_approach(props['aggregation_type'], allow_weighted=False)
+    except ValueError as err:
+        raise NonRecoverableError(str(err))
+
+    try:
+        evaluation_parameters = get_evaluation_parameters(
+            props['evaluation'], props['check_interval'],
+        )
+    except ValueError as err:
+        raise NonRecoverableError(str(err))
+
     ctx.logger.info('Getting related checks')
     check_relationships = get_all_relationship_targets(
         ctx=ctx,
@@ -74,8 +91,10 @@ def create_group(ctx):
             "low_critical_threshold": props["low_critical_threshold"],
             "high_warning_threshold": props["high_warning_threshold"],
             "high_critical_threshold": props["high_critical_threshold"],
+            "extra_arguments": get_window_arguments(props),
         },
     }
+    configuration['check_configuration'].update(evaluation_parameters)
     for level in 'low', 'high':
         action_name = 'action_on_{level}_threshold'.format(level=level)
         if props[action_name]['workflow_id']:
@@ -129,6 +148,7 @@ def create_group(ctx):
         reload_service=True,
         sudo=True,
     )
+    update_type_registry(ctx.logger, 'group')
 
 
 @operation
@@ -171,3 +191,4 @@ def delete_group(ctx):
             name=hashlib.md5(name).hexdigest(),
         )
         run(['rm', '-f', group_conf_path], sudo=True)
+    update_type_registry(ctx.logger, 'group')
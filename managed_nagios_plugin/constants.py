@@ -9,3 +9,16 @@ RATE_NODE_BASE_PATH = RATE_BASE_PATH + '/rates/nodes/{node}'
 RATE_INSTANCE_BASE_PATH = RATE_BASE_PATH + '/rates/instances/{instance}'
 RATE_NODE_PATH = RATE_NODE_BASE_PATH + '/{check}'
 RATE_INSTANCE_PATH = RATE_INSTANCE_BASE_PATH + '/{check}'
+HISTORY_GROUP_PATH = (
+    RATE_BASE_PATH + '/rates/groups/{tenant}/{group_type}/{group}'
+)
+HISTORY_META_GROUP_PATH = (
+    RATE_BASE_PATH + '/rates/metagroups/{tenant}/{group_type}/{prefix}'
+)
+RATE_STORE_PATH = RATE_BASE_PATH + '/rates/rates.db'
+REACTION_LOCK_BASE_PATH = RATE_BASE_PATH + '/cloudifyreaction'
+GROUP_EVALUATION_STATE_PATH = RATE_BASE_PATH + '/rates/group_evaluation.json'
+TIMING_CONFIG_PATH = '/etc/nagios/cloudify_components_timing.json'
+TIMING_SUMMARY_PATH = RATE_BASE_PATH + '/rates/timing.json'
+NAGIOSREST_JOBS_PATH = RATE_BASE_PATH + '/rates/nagiosrest_jobs'
+NAGIOS_STATUS_SNAPSHOT_PATH = RATE_BASE_PATH + '/rates/status_snapshot.json'
@@ -0,0 +1,309 @@
+import bisect
+from contextlib import contextmanager
+import errno
+import fcntl
+import hashlib
+import json
+import os
+
+from constants import (
+    BASE_OBJECTS_DIR,
+    OBJECT_DIR_PERMISSIONS,
+    OBJECT_PERMISSIONS,
+)
+import timing
+
+# The members of each group instance are indexed in one JSON file per tenant
+# and group type, mapping group instance names to the host names of their
+# member nodes. This lets group checks find their members with one read
+# rather than by walking the members directory tree.
+# The index also keeps the sorted names of the group instances, so that
+# meta groups can find the instances matching their prefix by bisection.
+# Group instances may also be members of other group instances, forming a
+# hierarchy, e.g. region -> cluster -> service. The index keeps the
+# [group type, group name] of the children and parents of each of these.
+# If there is no index yet, e.g. after an upgrade, it is built from the
+# members and children directory trees.
+GROUP_INDEX_DIR = os.path.join(BASE_OBJECTS_DIR, 'groups/index')
+GROUP_MEMBERS_DIR = os.path.join(BASE_OBJECTS_DIR, 'groups/members')
+GROUP_CHILDREN_DIR = os.path.join(BASE_OBJECTS_DIR, 'groups/children')
+MEMBER_NAME_TEMPLATE = 'tenant:{tenant}/deployment:{deployment}/node:{node}'
+REACTION_TARGET_SUFFIX = '_target'
+META_GROUP_DIR = 'meta'
+
+
+def get_group_index_path(tenant, group_type):
+    return os.path.join(
+        GROUP_INDEX_DIR,
+        hashlib.md5(tenant).hexdigest(),
+        '{group_type}.json'.format(
+            group_type=hashlib.md5(group_type).hexdigest(),
+        ),
+    )
+
+
+def load_group_index(tenant, group_type):
+    try:
+        with open(get_group_index_path(tenant, group_type)) as index_handle:
+            index = json.load(index_handle)
+    except (IOError, ValueError):
+        return build_group_index_from_directory(tenant, group_type)
+    # Indexes written before nested groups existed have no hierarchy
+    index.setdefault('children', {})
+    index.setdefault('parents', {})
+    return index
+
+
+def get_group_members(tenant, group_type, group_name, index=None):
+    """Get the set of host names of the members of a group instance.
+    index may be given if it has already been loaded for the tenant and
+    group type, e.g. when checking several of its groups.
+    Returns None if no node has been associated with the group instance.
+    """
+    if index is None:
+        index = load_group_index(tenant, group_type)
+    members = index['members'].get(group_name)
+    if not members:
+        return None
+    return set(members)
+
+
+def get_group_names(tenant, group_type, prefix='', index=None):
+    """Get the names of the group instances starting with prefix, in
+    order.
+    """
+    if index is None:
+        index = load_group_index(tenant, group_type)
+    names = index['names']
+    # Names with the prefix are together in the sorted list, starting at
+    # the first name not before the prefix
+    position = bisect.bisect_left(names, prefix)
+    matching = []
+    while position < len(names) and names[position].startswith(prefix):
+        matching.append(names[position])
+        position += 1
+    return matching
+
+
+def get_group_children(tenant, group_type, group_name, index=None):
+    """Get the [group type, group name] of each child group instance."""
+    if index is None:
+        index = load_group_index(tenant, group_type)
+    return index['children'].get(group_name, [])
+
+
+def get_group_parents(tenant, group_type, group_name, index=None):
+    """Get the [group type, group name] of each parent group instance."""
+    if index is None:
+        index = load_group_index(tenant, group_type)
+    return index['parents'].get(group_name, [])
+
+
+def is_group_descendant(tenant, group_type, group_name,
+                        ancestor_type, ancestor_name):
+    # Walk up from the group, as each group has few parents
+    to_visit = [[group_type, group_name]]
+    visited = []
+    while to_visit:
+        current = to_visit.pop()
+        if current == [ancestor_type, ancestor_name]:
+            return True
+        if current in visited:
+            continue
+        visited.append(current)
+        to_visit.extend(get_group_parents(tenant, *current))
+    return False
+
+
+def find_group_members_in_directory(tenant, group_type, group_name):
+    group_path = os.path.join(GROUP_MEMBERS_DIR, tenant, group_type,
+                              group_name)
+    if not os.path.isdir(group_path):
+        return None
+    members = set()
+    for deployment in os.listdir(group_path):
+        deployment_dir = os.path.join(group_path, deployment)
+        for node in os.listdir(deployment_dir):
+            members.add(MEMBER_NAME_TEMPLATE.format(
+                tenant=tenant,
+                deployment=deployment,
+                node=node,
+            ))
+    return members
+
+
+def build_group_index_from_directory(tenant, group_type):
+    # Each group instance has a reaction target file, and a directory once
+    # it has members. Meta groups are kept in their own directory.
+    group_type_path = os.path.join(GROUP_MEMBERS_DIR, tenant, group_type)
+    names = set()
+    if os.path.isdir(group_type_path):
+        for entry in os.listdir(group_type_path):
+            if entry.endswith(REACTION_TARGET_SUFFIX):
+                names.add(entry[:-len(REACTION_TARGET_SUFFIX)])
+            elif (
+                entry != META_GROUP_DIR
+                and os.path.isdir(os.path.join(group_type_path, entry))
+            ):
+                names.add(entry)
+
+    members = {}
+    for name in names:
+        members[name] = sorted(
+            find_group_members_in_directory(tenant, group_type, name)
+            or []
+        )
+
+    # Children are kept as
+    # groups/children/<tenant>/<parent type>/<parent>/<child type>/<child>
+    children = {}
+    parents = {}
+    tenant_children_path = os.path.join(GROUP_CHILDREN_DIR, tenant)
+    for parent_type, parent_name, child_type, child_name in _walk_depth(
+        tenant_children_path, 4,
+    ):
+        if parent_type == group_type:
+            children.setdefault(parent_name, []).append(
+                [child_type, child_name],
+            )
+        if child_type == group_type:
+            parents.setdefault(child_name, []).append(
+                [parent_type, parent_name],
+            )
+
+    return {
+        'members': members,
+        'names': sorted(names),
+        'children': children,
+        'parents': parents,
+    }
+
+
+def _walk_depth(path, depth):
+    if not os.path.isdir(path):
+        return
+    for entry in sorted(os.listdir(path)):
+        if depth == 1:
+            yield (entry,)
+        else:
+            for rest in _walk_depth(os.path.join(path, entry), depth - 1):
+                yield (entry,) + rest
+
+
+def add_group(tenant, group_type, group_name):
+    with _locked_group_index(tenant, group_type) as index:
+        _add_name(index, group_name)
+
+
+def add_group_member(tenant, group_type, group_name, deployment, node):
+    update_group_members(tenant, group_type,
+                         added=[(group_name, deployment, node)])
+
+
+def update_group_members(tenant, group_type, added=(), removed=()):
+    """Add and remove many members of the group instances of a group type
+    with one rewrite of its index.
+    added and removed are (group name, deployment, node) tuples.
+    """
+    with _locked_group_index(tenant, group_type) as index:
+        changed = {}
+        for group_name, deployment, node in added:
+            _add_name(index, group_name)
+            changed.setdefault(
+                group_name, set(index['members'][group_name]),
+            ).add(MEMBER_NAME_TEMPLATE.format(
+                tenant=tenant,
+                deployment=deployment,
+                node=node,
+            ))
+        for group_name, deployment, node in removed:
+            if group_name not in index['members']:
+                continue
+            changed.setdefault(
+                group_name, set(index['members'][group_name]),
+            ).discard(MEMBER_NAME_TEMPLATE.format(
+                tenant=tenant,
+                deployment=deployment,
+                node=node,
+            ))
+        for group_name, members in changed.items():
+            index['members'][group_name] = sorted(members)
+
+
+def add_group_child(tenant, parent_type, parent_name,
+                    child_type, child_name):
+    with _locked_group_index(tenant, parent_type) as index:
+        _add_name(index, parent_name)
+        children = index['children'].setdefault(parent_name, [])
+        if [child_type, child_name] not in children:
+            children.append([child_type, child_name])
+    with _locked_group_index(tenant, child_type) as index:
+        _add_name(index, child_name)
+        parents = index['parents'].setdefault(child_name, [])
+        if [parent_type, parent_name] not in parents:
+            parents.append([parent_type, parent_name])
+
+
+def remove_group(tenant, group_type, group_name):
+    with _locked_group_index(tenant, group_type) as index:
+        if index['members'].pop(group_name, None) is not None:
+            index['names'].remove(group_name)
+        children = index['children'].pop(group_name, [])
+        parents = index['parents'].pop(group_name, [])
+
+    # Remove the group from the other side of its relationships
+    for child_type, child_name in children:
+        with _locked_group_index(tenant, child_type) as index:
+            _remove_relation(index['parents'], child_name,
+                             [group_type, group_name])
+    for parent_type, parent_name in parents:
+        with _locked_group_index(tenant, parent_type) as index:
+            _remove_relation(index['children'], parent_name,
+                             [group_type, group_name])
+
+
+def _remove_relation(relations, group_name, related):
+    if related in relations.get(group_name, []):
+        relations[group_name].remove(related)
+        if not relations[group_name]:
+            del relations[group_name]
+
+
+def _add_name(index, group_name):
+    if group_name not in index['members']:
+        index['members'][group_name] = []
+        bisect.insort(index['names'], group_name)
+
+
+@contextmanager
+def _locked_group_index(tenant, group_type):
+    # Hold an exclusive lock while reading and rewriting the index, and
+    # replace it atomically so that checks never read a partial index.
+    # tempfile is imported here as the group checks only read the index.
+    import tempfile
+
+    index_path = get_group_index_path(tenant, group_type)
+    index_dir = os.path.dirname(index_path)
+    try:
+        os.makedirs(index_dir, int(OBJECT_DIR_PERMISSIONS, 8))
+    except OSError as err:
+        if err.errno != errno.EEXIST:
+            raise
+
+    with open(index_path + '.lock', 'a') as lock_handle:
+        with timing.span('lock_wait'):
+            fcntl.flock(lock_handle, fcntl.LOCK_EX)
+        try:
+            index = load_group_index(tenant, group_type)
+            yield index
+            temp_handle, temp_path = tempfile.mkstemp(dir=index_dir)
+            try:
+                with os.fdopen(temp_handle, 'w') as index_handle:
+                    json.dump(index, index_handle)
+                os.chmod(temp_path, int(OBJECT_PERMISSIONS, 8))
+                os.rename(temp_path, index_path)
+            except Exception:
+                os.unlink(temp_path)
+                raise
+        finally:
+            fcntl.flock(lock_handle, fcntl.LOCK_UN)
@@ -1,9 +1,11 @@
 import grp
 import json
 import logging
+from multiprocessing.pool import ThreadPool
 import os
 import pkgutil
 import tempfile
+import time
 
 from cloudify.decorators import operation
 from cloudify.exceptions import NonRecoverableError
@@ -13,9 +15,12 @@ from managed_nagios_plugin.constants import (
     OBJECT_DIR_PERMISSIONS,
     OBJECT_OWNERSHIP,
     RATE_BASE_PATH,
+    TIMING_CONFIG_PATH,
 )
 from managed_nagios_plugin.rest_utils import (
     get_entities,
+    iter_entities,
+    RateLimiter,
     run_workflow,
     StartWorkflowFailed,
 )
@@ -39,6 +44,10 @@ SSL_CERT_PATH = '/etc/nagios/ssl.crt'
 BLUEPRINT_SSL_KEY_PATH = 'ssl/{key_file}'
 BLUEPRINT_SSL_CERT_PATH = 'ssl/{cert_file}'
 NAGIOSREST_SERVICES = ['nagiosrest-gunicorn', 'httpd']
+RECONCILE_DEFAULT_CONCURRENCY = 10
+RECONCILE_DEFAULT_RATE = 20
+RECONCILE_PROGRESS_INTERVAL = 50
+RECONCILE_CHECKPOINT_PROPERTY = 'reconcile_monitoring_checkpoint'
 
 @operation
 def create(ctx):
@@ -98,11 +107,17 @@ def create(ctx):
 
     ctx.logger.info('Deploying nagios plugins and SNMP trap handler')
     for supporting_lib in ('constants.py',
+                           'aggregation.py',
+                           'perfdata.py',
                            'utils.py',
                            'snmp_utils.py',
                            'nagios_utils.py',
                            'rest_utils.py',
+                           'rate_store.py',
+                           'group_index.py',
+                           'timing.py',
                            'resources/scripts/nagios_plugin_utils.py',
+                           'resources/scripts/group_check_utils.py',
                            'resources/scripts/logging_utils.py'):
         if supporting_lib.startswith('resources/scripts/'):
             destination_filename = supporting_lib[len('resources/scripts/'):]
@@ -125,7 +140,9 @@ def create(ctx):
                    'cloudify_nagios_snmp_trap_handler',
                    'notify_cloudify',
                    'check_nagios_command_file',
-                   'check_snmptrap_checks'):
+                   'check_snmptrap_checks',
+                   'check_monitoring_health',
+                   'evaluate_group_checks'):
         source = os.path.join('resources/scripts/', script)
         script_content = pkgutil.get_data('managed_nagios_plugin', source)
         destination = os.path.join('/usr/lib64/nagios/plugins', script)
@@ -140,6 +157,7 @@ def create(ctx):
     run(['mkdir', '-p', '/usr/local/www/nagiosrest'], sudo=True)
     for nagiosrest_file in ('nagiosrest.py',
                             'nagiosrest_group.py',
+                            'nagiosrest_jobs.py',
                             'nagiosrest_target.py',
                             'nagiosrest_tenant.py',
                             'logging_utils.py'):
@@ -155,6 +173,9 @@ def create(ctx):
         )
     for supporting_lib in ('nagios_utils.py',
                            'utils.py',
+                           'rate_store.py',
+                           'group_index.py',
+                           'timing.py',
                            'constants.py'):
         deploy_file(
             data=pkgutil.get_data(
@@ -228,7 +249,8 @@ def create(ctx):
     ctx.logger.info(
         'Creating directory structure for storing temporary rate data'
     )
-    for rate_dir in ('nodes', 'instances'):
+    for rate_dir in ('rates', 'rates/nodes', 'rates/instances',
+                     'rates/nagiosrest_jobs'):
         rate_storage_path = os.path.join(RATE_BASE_PATH, rate_dir)
         run(['mkdir', '-p', rate_storage_path], sudo=True)
         run(['chown', 'nagios.', rate_storage_path], sudo=True)
@@ -366,7 +388,12 @@ def configure(ctx):
          'commands/check_group_meta_aggregate.cfg', {}),
         ('command_snmptrap_checks.cfg',
          'commands/check_snmptrap_checks.cfg', {}),
-        ('notification.cfg', 'commands/notify_automation.cfg', {}),
+        ('command_check_monitoring_health.cfg',
+         'commands/check_monitoring_health.cfg', {}),
+        ('command_evaluate_group_checks.cfg',
+         'commands/evaluate_group_checks.cfg', {}),
+        ('notification.cfg', 'commands/notify_automation.cfg',
+         {'coalesce_window': props['reaction_coalesce_window']}),
         ('contact.cfg', 'contacts/automation.cfg', {}),
         ('template_generic_service.cfg', 'templates/generic_service.cfg', {}),
         ('template_generic_host.cfg', 'templates/generic_host.cfg', {}),
@@ -507,36 +534,17 @@ def configure(ctx):
     ctx.logger.info('Deploying logging configuration')
     level = props['component_log_level'].upper()
     validate_level = logging.getLevelName(level)
-    if not isinstance(validate_level, int):
+    if level != 'NONE' and not isinstance(validate_level, int):
         raise NonRecoverableError(
             '{level} is not a valid logging level. '
             'It is recommended that component_log_level be set to one of '
-            'DEBUG, INFO, WARNING, ERROR'.format(level=level)
+            'DEBUG, INFO, WARNING, ERROR, NONE'.format(level=level)
         )
-    component_logging_config = {
-        'version': 1,
-        'disable_existing_loggers': False,
-        'formatters': {
-            'default': {
-                'format': '%(name)s(%(process)s) [%(levelname)s]: %(message)s',
-            },
-        },
-        'handlers': {
-            'syslog': {
-                'formatter': 'default',
-                'level': level,
-                'class': 'logging.handlers.SysLogHandler',
-                'address': '/dev/log',
-            },
-        },
-        'loggers': {
-            '': {
-                'handlers': ['syslog'],
-                'level': level,
-                'propagate': True,
-            },
-        },
-    }
+    if level == 'NONE':
+        # The components will not configure logging at all
+        component_logging_config = {'disabled': True}
+    else:
+        component_logging_config = get_component_logging_config(level)
     deploy_file(
         data=json.dumps(component_logging_config),
         destination='/etc/nagios/cloudify_components_logging.cfg',
@@ -544,6 +552,19 @@ def configure(ctx):
         permissions='440',
         sudo=True,
     )
+    if props['component_timing']:
+        ctx.logger.info('Deploying timing configuration')
+        deploy_file(
+            data=json.dumps({
+                'summary_interval': props['component_timing_interval'],
+            }),
+            destination=TIMING_CONFIG_PATH,
+            ownership='root.nagios',
+            permissions='440',
+            sudo=True,
+        )
+    else:
+        run(['rm', '-f', TIMING_CONFIG_PATH], sudo=True)
     deploy_file(
         data=pkgutil.get_data(
             'managed_nagios_plugin',
@@ -620,93 +641,191 @@ def _node_has_nagiosrest_properties(node):
     return 'nagiosrest_monitoring' in node.get('properties', {})
 
 
+def _get_monitored_deployments(tenant, only_deployments, logger,
+                               rate_limiter):
+    filters = None
+    if only_deployments:
+        filters = {'deployment_id': only_deployments}
+    deployments = {}
+    for node in iter_entities(
+        entity_type='nodes',
+        tenant=tenant,
+        properties=['deployment_id', 'id'],
+        logger=logger,
+        include=_node_has_nagiosrest_properties,
+        rate_limiter=rate_limiter,
+        # The manager can only project and filter on whole node fields, not
+        # on keys within properties, so all of each node's properties must
+        # be fetched to find the monitored nodes here. Only the other fields
+        # which are not needed are left out.
+        include_fields=['deployment_id', 'id', 'properties'],
+        filters=filters,
+    ):
+        deployments.setdefault(node['deployment_id'], []).append(node['id'])
+    return tenant, deployments
+
+
+def _start_deployment_monitoring(target, logger, rate_limiter):
+    tenant, deployment, nodes = target
+    try:
+        run_workflow(
+            tenant=tenant,
+            deployment=deployment,
+            workflow_id='execute_operation',
+            parameters={
+                "node_ids": nodes,
+                "operation": (
+                    "cloudify.interfaces.monitoring.start"
+                ),
+            },
+            allow_custom_parameters=False,
+            force=False,
+            logger=logger,
+            rate_limiter=rate_limiter,
+        )
+    except StartWorkflowFailed as err:
+        return target, str(err)
+    return target, None
+
+
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '{hours}h{minutes:02d}m{seconds:02d}s'.format(
+        hours=hours,
+        minutes=minutes,
+        seconds=seconds,
+    )
+
+
 @operation
-def reconcile_monitoring(ctx, only_deployments=None, only_tenants=None):
+def reconcile_monitoring(ctx, only_deployments=None, only_tenants=None,
+                         concurrency=RECONCILE_DEFAULT_CONCURRENCY,
+                         requests_per_second=RECONCILE_DEFAULT_RATE,
+                         resume=False):
     if not only_deployments:
         only_deployments = []
     if not only_tenants:
         only_tenants = []
-    ctx.logger.info('Getting tenant list')
-    tenants = [
-        tenant['name']
-        for tenant in get_entities(
-            entity_type='tenants',
-            tenant='default_tenant',
-            properties=['name'],
-            logger=ctx.logger,
-        )
-    ]
+    concurrency = max(1, concurrency)
+    rate_limiter = RateLimiter(requests_per_second)
+
+    # Deployments which have already had monitoring started, so that a
+    # partially failed reconcile can be resumed
+    checkpoint = ctx.instance.runtime_properties.get(
+        RECONCILE_CHECKPOINT_PROPERTY, {},
+    )
+    if checkpoint and not resume:
+        ctx.logger.info('Ignoring checkpoint from previous reconcile as '
+                        'resume was not set')
+        checkpoint = {}
 
-    problem_deployments = {}
-    targets = None
-    for tenant in tenants:
-        if only_tenants and tenant not in only_tenants:
+    ctx.logger.info('Getting tenant list')
+    tenants = []
+    for tenant in get_entities(
+        entity_type='tenants',
+        tenant='default_tenant',
+        properties=['name'],
+        logger=ctx.logger,
+        rate_limiter=rate_limiter,
+    ):
+        if only_tenants and tenant['name'] not in only_tenants:
             ctx.logger.info('Skipping tenant {tenant}'.format(
-                tenant=tenant,
+                tenant=tenant['name'],
             ))
-            continue
-        ctx.logger.info('Checking deployments for tenant {tenant}'.format(
-            tenant=tenant,
-        ))
-        targets = {}
-        interesting_nodes = get_entities(
-            entity_type='nodes',
-            tenant=tenant,
-            properties=['deployment_id', 'id'],
-            logger=ctx.logger,
-            include=_node_has_nagiosrest_properties,
-        )
+        else:
+            tenants.append(tenant['name'])
+
+    pool = ThreadPool(concurrency)
+    finished = False
+    try:
         ctx.logger.info(
-            'Found {num} nodes with monitoring configuration'.format(
-                num=len(interesting_nodes),
+            'Checking deployments for {num} tenants with up to {concurrency} '
+            'concurrent requests'.format(
+                num=len(tenants),
+                concurrency=concurrency,
             )
         )
-        notified_skipped_deployments = []
-        for node in interesting_nodes:
-            dep_id = node['deployment_id']
-            if only_deployments and dep_id not in only_deployments:
-                if dep_id not in notified_skipped_deployments:
-                    ctx.logger.info('Skipping deployment {dep}'.format(
-                        dep=dep_id,
-                    ))
-                    notified_skipped_deployments.append(dep_id)
-                continue
-            if dep_id not in targets:
-                targets[dep_id] = []
-            targets[dep_id].append(node['id'])
-
-        if targets:
-            for deployment, nodes in targets.items():
-                ctx.logger.info(
-                    'Starting monitoring for deployment {deployment}'.format(
-                        deployment=deployment,
-                    )
+        targets = []
+        for tenant, deployments in pool.imap_unordered(
+            lambda tenant: _get_monitored_deployments(tenant,
+                                                      only_deployments,
+                                                      ctx.logger,
+                                                      rate_limiter),
+            tenants,
+        ):
+            ctx.logger.info(
+                'Found {num} deployments with monitoring configuration for '
+                'tenant {tenant}'.format(
+                    num=len(deployments),
+                    tenant=tenant,
                 )
-                try:
-                    run_workflow(
-                        tenant=tenant,
+            )
+            targets.extend(
+                (tenant, deployment, nodes)
+                for deployment, nodes in deployments.items()
+                if deployment not in checkpoint.get(tenant, [])
+            )
+
+        if checkpoint:
+            ctx.logger.info(
+                'Resuming reconcile, skipping {num} deployments which were '
+                'already started'.format(
+                    num=sum(len(deps) for deps in checkpoint.values()),
+                )
+            )
+
+        problem_deployments = {}
+        start_time = time.time()
+        for position, (target, error) in enumerate(pool.imap_unordered(
+            lambda target: _start_deployment_monitoring(target, ctx.logger,
+                                                        rate_limiter),
+            targets,
+        ), 1):
+            tenant, deployment, _ = target
+            if error:
+                ctx.logger.error(
+                    '{deployment} failed to start workflow: {err}'.format(
                         deployment=deployment,
-                        workflow_id='execute_operation',
-                        parameters={
-                            "node_ids": nodes,
-                            "operation": (
-                                "cloudify.interfaces.monitoring.start"
-                            ),
-                        },
-                        allow_custom_parameters=False,
-                        force=False,
-                        logger=ctx.logger,
+                        err=error,
                     )
-                except StartWorkflowFailed as err:
-                    ctx.logger.error(
-                        '{deployment} failed to start workflow: {err}'.format(
-                            deployment=deployment,
-                            err=str(err),
-                        )
+                )
+                problem_deployments.setdefault(tenant, []).append(deployment)
+            else:
+                checkpoint.setdefault(tenant, []).append(deployment)
+
+            if position % RECONCILE_PROGRESS_INTERVAL == 0 or (
+                position == len(targets)
+            ):
+                elapsed = time.time() - start_time
+                remaining = elapsed / position * (len(targets) - position)
+                ctx.logger.info(
+                    'Started monitoring for {done}/{total} deployments '
+                    '({percent}%), elapsed {elapsed}, ETA {eta}'.format(
+                        done=position,
+                        total=len(targets),
+                        percent=position * 100 // len(targets),
+                        elapsed=_format_duration(elapsed),
+                        eta=_format_duration(remaining),
                     )
-                    if tenant not in problem_deployments:
-                        problem_deployments[tenant] = []
-                    problem_deployments[tenant].append(deployment)
+                )
+                ctx.instance.runtime_properties[
+                    RECONCILE_CHECKPOINT_PROPERTY] = checkpoint
+                ctx.instance.update()
+        finished = not problem_deployments
+    finally:
+        pool.close()
+        pool.join()
+        # Saved even if the reconcile failed part way through, so that a
+        # resumed reconcile skips every deployment which was started
+        if finished:
+            ctx.instance.runtime_properties.pop(
+                RECONCILE_CHECKPOINT_PROPERTY, None,
+            )
+        else:
+            ctx.instance.runtime_properties[
+                RECONCILE_CHECKPOINT_PROPERTY] = checkpoint
+        ctx.instance.update()
 
     if targets:
         ctx.logger.info('All monitored instances not listed as problems '
@@ -718,7 +837,8 @@ def reconcile_monitoring(ctx, only_deployments=None, only_tenants=None):
                         'and list which deployments had these problems. '
                         'If any of these appear you can re-run just those '
                         'deployments by using the only_deployments '
-                        'argument.')
+                        'argument, or re-run with resume set to skip '
+                        'deployments which were already started.')
 
         if problem_deployments:
             for tenant in problem_deployments:
@@ -744,4 +864,31 @@ def start_nagiosrest(ctx):
     services = ['httpd', 'nagiosrest-gunicorn']
     for service in services:
         enable_service(service)
-        start_service(service)
\ No newline at end of file
+        start_service(service)
+
+
+def get_component_logging_config(level):
+    return {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'formatters': {
+            'default': {
+                'format': '%(name)s(%(process)s) [%(levelname)s]: %(message)s',
+            },
+        },
+        'handlers': {
+            'syslog': {
+                'formatter': 'default',
+                'level': level,
+                'class': 'logging.handlers.SysLogHandler',
+                'address': '/dev/log',
+            },
+        },
+        'loggers': {
+            '': {
+                'handlers': ['syslog'],
+                'level': level,
+                'propagate': True,
+            },
+        },
+    }
@@ -1,10 +1,14 @@
 #! /usr/bin/env python
+import json
 import os
 import re
 import time
 
-from constants import TENANT_DEPLOYMENT_HOSTGROUP
-from utils import get_node_id
+from constants import (
+    NAGIOS_STATUS_SNAPSHOT_PATH,
+    TENANT_DEPLOYMENT_HOSTGROUP,
+)
+import timing
 
 NAGIOS_EXTERNAL_COMMAND_FILE = '/var/spool/nagios/cmd/nagios.cmd'
 NAGIOS_STATUS_FILE = '/var/log/nagios/status.dat'
@@ -26,6 +30,19 @@ NODE_DETAILS_FINDER = re.compile(
 # This will be populated once, whereas the cache will be retrieved each time
 # it is needed (as status check results may change)
 NAGIOS_CONFIGURATION = None
+# Results of instance lookups against the loaded configuration, cleared
+# whenever the configuration is reloaded
+INSTANCE_DETAILS_CACHE = {}
+TYPE_PATHS = {
+    'group': '/etc/nagios/objects/groups/types',
+    'target': '/etc/nagios/objects/target_types',
+}
+# Names of the types of each kind, kept in the kind's directory when types
+# are created or deleted so that they need not be found in each type's
+# configuration
+TYPE_REGISTRY_FILE = 'registered_types.json'
+# Loaded type registries, keyed by path, with the mtime they were loaded at
+TYPE_REGISTRY_CACHE = {}
 
 
 class DeploymentGroupNotFound(Exception):
@@ -65,25 +82,183 @@ def parse_nagios_data_file(data_file_path, separator):
     return sections
 
 
+def iter_nagios_data_sections(data_file_path, separator, section_name,
+                              host_names=None, service_descriptions=None):
+    # Stream the sections of one type from a nagios data file, without
+    # building the others. If host_names or service_descriptions are given
+    # then sections for other hosts or services are skipped as soon as
+    # their host_name or service_description is read, which are the first
+    # entries in each status section.
+    filters = {}
+    if host_names is not None:
+        filters['host_name'] = host_names
+    if service_descriptions is not None:
+        filters['service_description'] = service_descriptions
+    conf_cache_prefix = 'define '
+    section_contents = None
+    with open(data_file_path) as fh:
+        for line in fh:
+            line = line.strip()
+            if line.endswith('{'):
+                if line.startswith(conf_cache_prefix):
+                    line = line[len(conf_cache_prefix):]
+                if line.split(' ')[0] == section_name:
+                    section_contents = {}
+            elif line == '}':
+                if section_contents is not None:
+                    yield section_contents
+                section_contents = None
+            elif section_contents is not None and line:
+                key, value = line.split(separator, 1)
+                value = value.lstrip()
+                if key in filters and value not in filters[key]:
+                    section_contents = None
+                else:
+                    section_contents[key] = value
+
+
+class NagiosDataWatcher(object):
+    # Follows a nagios data file (e.g. status.dat), only parsing it again
+    # when nagios has rewritten it, so that several waiters can share one
+    # parse of the file.
+    # Each notify_cloudify is a separate process with its own watcher, so if
+    # a snapshot_path is given then each parse is also saved there along
+    # with the data file's mtime, and other processes load that snapshot
+    # rather than parsing the same version of the data file again.
+    def __init__(self, data_file_path, separator, poll_interval=1,
+                 span='status_parse', snapshot_path=None):
+        self.data_file_path = data_file_path
+        self.separator = separator
+        self.poll_interval = poll_interval
+        self.span = span
+        self.snapshot_path = snapshot_path
+        self.data = None
+        self._mtime = None
+
+    def refresh(self):
+        mtime = os.stat(self.data_file_path).st_mtime
+        if mtime == self._mtime:
+            return False
+        data = self._load_snapshot(mtime)
+        if data is None:
+            with timing.span(self.span):
+                data = parse_nagios_data_file(self.data_file_path,
+                                              self.separator)
+            self._save_snapshot(mtime, data)
+        self.data = data
+        self._mtime = mtime
+        return True
+
+    def _load_snapshot(self, mtime):
+        if not self.snapshot_path:
+            return None
+        try:
+            with open(self.snapshot_path) as snapshot_handle:
+                snapshot = json.load(snapshot_handle)
+        except (IOError, ValueError):
+            # Missing, or being replaced without an atomic rename
+            return None
+        if snapshot.get('mtime') != mtime:
+            return None
+        return snapshot['data']
+
+    def _save_snapshot(self, mtime, data):
+        if not self.snapshot_path:
+            return
+        # Written to a temporary file and renamed so that other processes
+        # never load a partial snapshot
+        temp_path = '{path}.{pid}.tmp'.format(path=self.snapshot_path,
+                                              pid=os.getpid())
+        try:
+            with open(temp_path, 'w') as snapshot_handle:
+                json.dump({'mtime': mtime, 'data': data}, snapshot_handle)
+            os.rename(temp_path, self.snapshot_path)
+        except (IOError, OSError):
+            # The snapshot only saves other processes from parsing
+            pass
+
+    def wait_for_change(self, timeout):
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            time.sleep(min(self.poll_interval, remaining))
+            if self.refresh():
+                return True
+
+
+def get_nagios_status_watcher():
+    return NagiosDataWatcher(NAGIOS_STATUS_FILE, separator='=',
+                             snapshot_path=NAGIOS_STATUS_SNAPSHOT_PATH)
+
+
+def wait_for_host_configuration(host_name, timeout, poll_interval=0.2):
+    """Wait for nagios to have loaded a host, e.g. after a reload, then use
+    the configuration that it was loaded in. Returns whether the host was
+    loaded within timeout seconds.
+    """
+    global NAGIOS_CONFIGURATION
+    # Nagios rewrites objects.cache when it loads its configuration, which
+    # is well before the next status.dat update
+    watcher = NagiosDataWatcher(NAGIOS_CONFIG_CACHE_FILE, separator='\t',
+                                poll_interval=poll_interval,
+                                span='config_parse')
+    deadline = time.time() + timeout
+    watcher.refresh()
+    while not any(
+        host['host_name'] == host_name
+        for host in watcher.data.get('host', [])
+    ):
+        if not watcher.wait_for_change(deadline - time.time()):
+            return False
+    INSTANCE_DETAILS_CACHE.clear()
+    NAGIOS_CONFIGURATION = watcher.data
+    return True
+
+
+def get_configured_services_for_host(host_name):
+    load_nagios_configuration()
+    return [
+        service for service in NAGIOS_CONFIGURATION.get('service', [])
+        if service['host_name'] == host_name
+    ]
+
+
 def send_nagios_command(command):
+    send_nagios_commands([command])
+
+
+def send_nagios_commands(commands):
+    # Submit all commands with a single write to the command pipe
+    if not commands:
+        return
+    now = time.time()
     with open(NAGIOS_EXTERNAL_COMMAND_FILE, 'w') as command_handle:
-        command_handle.write('[{time}] {command}\n'.format(
-            command=command,
-            time=time.time(),
+        command_handle.write(''.join(
+            '[{time}] {command}\n'.format(
+                command=command,
+                time=now,
+            )
+            for command in commands
         ))
 
 
 def submit_passive_check_result(host, service, status, output):
+    send_nagios_command(
+        get_passive_check_result_command(host, service, status, output)
+    )
+
+
+def get_passive_check_result_command(host, service, status, output):
     command = (
         'PROCESS_SERVICE_CHECK_RESULT;{host};{service};{status};{output}'
     )
-    send_nagios_command(
-        command.format(
-            host=host,
-            service=service,
-            status=status,
-            output=output,
-        )
+    return command.format(
+        host=host,
+        service=service,
+        status=status,
+        output=output,
     )
 
 
@@ -132,23 +307,31 @@ def send_host_notification(host, comment):
 
 
 def schedule_immediate_service_check(host_name, service_check_description):
-    command = 'SCHEDULE_SVC_CHECK;{host};{service};{check_time}'
     send_nagios_command(
-        command.format(
-            host=host_name,
-            service=service_check_description,
-            check_time=int(time.time()) + 3,
-        )
+        get_immediate_service_check_command(host_name,
+                                            service_check_description)
+    )
+
+
+def get_immediate_service_check_command(host_name,
+                                        service_check_description):
+    command = 'SCHEDULE_SVC_CHECK;{host};{service};{check_time}'
+    return command.format(
+        host=host_name,
+        service=service_check_description,
+        check_time=int(time.time()) + 3,
     )
 
 
 def schedule_immediate_host_check(host_name):
+    send_nagios_command(get_immediate_host_check_command(host_name))
+
+
+def get_immediate_host_check_command(host_name):
     command = 'SCHEDULE_HOST_CHECK;{host};{check_time}'
-    send_nagios_command(
-        command.format(
-            host=host_name,
-            check_time=int(time.time()) + 3,
-        )
+    return command.format(
+        host=host_name,
+        check_time=int(time.time()) + 3,
     )
 
 
@@ -168,13 +351,13 @@ def delete_old_host_comments(max_age, nagios_status_dict):
 
 def get_status_for_hostgroup(hostgroup_name,
                              nagios_status_dict):
-    hosts = {}
     for hostgroup in NAGIOS_CONFIGURATION['hostgroup']:
         if hostgroup['hostgroup_name'] == hostgroup_name:
             break
-    for host in hostgroup.get('members', '').split(','):
-        hosts[host] = get_host_status_with_services(host, nagios_status_dict)
-    return hosts
+    return get_host_statuses_with_services(
+        hostgroup.get('members', '').split(','),
+        nagios_status_dict,
+    )
 
 
 def get_host_status_with_services(host_name, nagios_status_dict):
@@ -195,6 +378,31 @@ def get_host_status_with_services(host_name, nagios_status_dict):
     return results
 
 
+def get_host_statuses_with_services(host_names, nagios_status_dict):
+    # As get_host_status_with_services, but for several hosts with a single
+    # pass over the status
+    results = {
+        host_name: {
+            'host_state': None,
+            'healthy': [],
+            'failing': [],
+        }
+        for host_name in host_names
+    }
+    for host in nagios_status_dict['hoststatus']:
+        if host['host_name'] in results:
+            results[host['host_name']]['host_state'] = host['current_state']
+    for service in nagios_status_dict['servicestatus']:
+        host_results = results.get(service['host_name'])
+        if host_results is None:
+            continue
+        if service['current_state'] == '0':
+            host_results['healthy'].append(service['service_description'])
+        else:
+            host_results['failing'].append(service['service_description'])
+    return results
+
+
 def get_services_for_host(host_name, nagios_status_dict):
     services = []
     for svc in nagios_status_dict['servicestatus']:
@@ -203,14 +411,30 @@ def get_services_for_host(host_name, nagios_status_dict):
     return services
 
 
-def recheck_all_failing_checks_for_host(host_name, host_status):
+def get_recheck_commands_for_host(host_name, host_status):
+    commands = []
     if host_status['host_state'] != '0':
-        schedule_immediate_host_check(host_name)
+        commands.append(get_immediate_host_check_command(host_name))
     for service in host_status['failing']:
-        schedule_immediate_service_check(
+        commands.append(get_immediate_service_check_command(
             host_name=host_name,
             service_check_description=service,
-        )
+        ))
+    return commands
+
+
+def recheck_all_failing_checks_for_host(host_name, host_status):
+    send_nagios_commands(
+        get_recheck_commands_for_host(host_name, host_status)
+    )
+
+
+def recheck_all_failing_checks_for_hosts(host_statuses):
+    commands = []
+    for host_name, host_status in host_statuses.items():
+        commands.extend(get_recheck_commands_for_host(host_name,
+                                                      host_status))
+    send_nagios_commands(commands)
 
 
 def recheck_all_failing_checks_for_hostgroup(hostgroup_name,
@@ -220,8 +444,15 @@ def recheck_all_failing_checks_for_hostgroup(hostgroup_name,
         hostgroup_name,
         nagios_status_dict,
     )
-    for host_name, host_status in hostgroup_state.items():
-        recheck_all_failing_checks_for_host(host_name, host_status)
+    recheck_all_failing_checks_for_hosts(hostgroup_state)
+
+
+def get_node_id(instance_id):
+    if instance_id.startswith('tenant:'):
+        # This is actually a node
+        return instance_id.split('node:')[1]
+    else:
+        return instance_id.rsplit('_', 1)[0]
 
 
 def get_node_instances(tenant, deployment, node, logger):
@@ -230,9 +461,7 @@ def get_node_instances(tenant, deployment, node, logger):
         tenant=tenant,
         deployment=deployment,
     )
-    logger.debug('Looking for target group: {group}'.format(
-        group=target_group,
-    ))
+    logger.debug('Looking for target group: %s', target_group)
     deployment_group = None
     for hostgroup in NAGIOS_CONFIGURATION['hostgroup']:
         if hostgroup['hostgroup_name'] == target_group:
@@ -245,60 +474,51 @@ def get_node_instances(tenant, deployment, node, logger):
             group=target_group,
         ))
         raise DeploymentGroupNotFound(target_group)
-    logger.debug('Found target group: {details}'.format(
-        details=deployment_group,
-    ))
+    logger.debug('Found target group: %s', deployment_group)
 
     all_instances = deployment_group['members'].split(',')
-    logger.debug('Group members: {members}'.format(
-        members=all_instances,
-    ))
+    logger.debug('Group members: %s', all_instances)
     target_instances = []
     for instance in all_instances:
-        logger.debug(
-            'Checking whether {instance} is part of node {node}'.format(
-                instance=instance,
-                node=node,
-            )
-        )
+        logger.debug('Checking whether %s is part of node %s', instance, node)
         instance_node_id = get_node_id(instance)
-        logger.debug('Instance node is {node_id}'.format(
-            node_id=instance_node_id,
-        ))
+        logger.debug('Instance node is %s', instance_node_id)
         if instance_node_id == node:
             logger.debug('Added instance to target instances')
             target_instances.append(instance)
         else:
             logger.debug('Skipping instance')
 
-    logger.debug('Target instances: {targets}'.format(
-        targets=target_instances,
-    ))
+    logger.debug('Target instances: %s', target_instances)
     return target_instances
 
 
 def get_host_address(host_name, logger):
     load_nagios_configuration()
 
-    logger.debug('Finding host IP for {name}'.format(
-        name=host_name,
-    ))
+    logger.debug('Finding host IP for %s', host_name)
     if 'node:' in host_name:
         logger.warn('Only instances have addresses, nodes do not')
         # A node is not a real host, it has no address
         return None
 
     for host in NAGIOS_CONFIGURATION['host']:
-        logger.debug('Checking host {host}'.format(host=host['host_name']))
         if host['host_name'] == host_name:
-            logger.debug('Found host. Address found: {addr}'.format(
-                addr=host['address'],
-            ))
+            logger.debug('Found host. Address found: %s', host['address'])
             return host['address']
 
 
 def _get_details_for_instance(instance_id, finder_regex):
     load_nagios_configuration()
+    cache_key = (instance_id, finder_regex.pattern)
+    if cache_key not in INSTANCE_DETAILS_CACHE:
+        INSTANCE_DETAILS_CACHE[cache_key] = _find_details_for_instance(
+            instance_id, finder_regex,
+        )
+    return INSTANCE_DETAILS_CACHE[cache_key]
+
+
+def _find_details_for_instance(instance_id, finder_regex):
     for hostgroup in NAGIOS_CONFIGURATION['hostgroup']:
         result = finder_regex.match(
             hostgroup['hostgroup_name']
@@ -378,51 +598,84 @@ def load_nagios_configuration(force=False):
     global NAGIOS_CONFIGURATION
     if NAGIOS_CONFIGURATION and not force:
         return
-    NAGIOS_CONFIGURATION = parse_nagios_data_file(NAGIOS_CONFIG_CACHE_FILE,
-                                                  separator='\t')
+    INSTANCE_DETAILS_CACHE.clear()
+    with timing.span('config_parse'):
+        NAGIOS_CONFIGURATION = parse_nagios_data_file(
+            NAGIOS_CONFIG_CACHE_FILE, separator='\t',
+        )
 
 
 def get_nagios_status():
-    return parse_nagios_data_file(
-        NAGIOS_STATUS_FILE, separator='=',
-    )
+    with timing.span('status_parse'):
+        return parse_nagios_data_file(
+            NAGIOS_STATUS_FILE, separator='=',
+        )
+
+
+def get_service_statuses_for_hosts(host_names, service_descriptions=None):
+    with timing.span('status_parse'):
+        return list(iter_nagios_data_sections(
+            NAGIOS_STATUS_FILE, separator='=', section_name='servicestatus',
+            host_names=host_names, service_descriptions=service_descriptions,
+        ))
 
 
 def get_types(which_type, logger):
-    types_path = {
-        'group': '/etc/nagios/objects/groups/types',
-        'target': '/etc/nagios/objects/target_types',
-    }[which_type]
+    return sorted(_load_types(which_type, logger))
+
+
+def type_exists(which_type, name, logger):
+    return name in _load_types(which_type, logger)
 
+
+def get_type_registry_path(which_type):
+    return os.path.join(TYPE_PATHS[which_type], TYPE_REGISTRY_FILE)
+
+
+def _load_types(which_type, logger):
+    registry_path = get_type_registry_path(which_type)
+    try:
+        mtime = os.stat(registry_path).st_mtime
+    except OSError:
+        # Types created before the registry was, so they must be found
+        logger.debug('No type registry found at %s', registry_path)
+        return frozenset(_find_types(which_type, logger))
+    cached = TYPE_REGISTRY_CACHE.get(registry_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(registry_path) as registry_handle:
+        types = frozenset(json.load(registry_handle))
+    TYPE_REGISTRY_CACHE[registry_path] = (mtime, types)
+    return types
+
+
+def _find_types(which_type, logger):
+    types_path = TYPE_PATHS[which_type]
     type_files = [
         filename
         for filename in os.listdir(types_path)
         if filename.endswith('.cfg')
     ]
-    logger.debug('Checking type files: {files}'.format(
-        files=', '.join(type_files),
-    ))
+    logger.debug('Checking type files: %s', ', '.join(type_files))
 
     found_types = []
     for type_file in type_files:
-        logger.debug('Checking file: {path}'.format(path=type_file))
         with open(os.path.join(types_path, type_file)) as type_handle:
-            type_content = type_handle.readlines()
+            found_types.extend(
+                get_types_from_configuration(which_type, type_handle)
+            )
+    logger.debug('Found types: %s', found_types)
+    return found_types
 
-        for line in type_content:
-            line = line.strip()
-            logger.debug('Checking line: {line}'.format(line=line))
-            if which_type == 'group':
-                if line.startswith('hostgroup_name '):
-                    group = line.split('group_type:', 1)[1]
-                    logger.debug('Found group: {group}'.format(group=group))
-                    found_types.append(group)
-            elif which_type == 'target':
-                if 'target_type:' in line:
-                    target_type = line.split('target_type:', 1)[1]
-                    logger.debug('Found target type: {target_type}'.format(
-                        target_type=target_type,
-                    ))
-                    found_types.append(target_type)
 
+def get_types_from_configuration(which_type, lines):
+    found_types = []
+    for line in lines:
+        line = line.strip()
+        if which_type == 'group':
+            if line.startswith('hostgroup_name '):
+                found_types.append(line.split('group_type:', 1)[1])
+        elif which_type == 'target':
+            if 'target_type:' in line:
+                found_types.append(line.split('target_type:', 1)[1])
     return found_types
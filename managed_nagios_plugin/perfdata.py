@@ -0,0 +1,104 @@
+from collections import namedtuple
+import re
+
+# Parser for nagios plugin performance data, in the form:
+#   'label'=value[UOM];[warn];[crit];[min];[max]
+# with entries separated by whitespace. Labels containing spaces or = must
+# be quoted, with a literal quote written as two quotes. A value of U means
+# that the value could not be determined. Values of nan and inf, as written
+# by python for some aggregates, are also accepted. warn and crit are
+# ranges, e.g. 10, 10:, ~:10, @10:20, and are kept as strings.
+PERFDATA_ENTRY = re.compile(
+    r"\s*"
+    r"(?:'(?P<quoted>(?:[^']|'')+)'|(?P<label>[^'=\s][^=\s]*))"
+    r"="
+    r"(?P<value>U|[-+]?(?:"
+    r"(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+)(?:[eE][-+]?[0-9]+)?"
+    r"|[iI][nN][fF]|[nN][aA][nN]"
+    r"))"
+    r"(?P<uom>[a-zA-Z%]*)"
+    r"(?:;(?P<warn>[^;\s]*))?"
+    r"(?:;(?P<crit>[^;\s]*))?"
+    r"(?:;(?P<min>[^;\s]*))?"
+    r"(?:;(?P<max>[^;\s]*))?"
+    r"(?=\s|$)"
+)
+TRAILING_WHITESPACE = re.compile(r"\s*$")
+
+PerfdataEntry = namedtuple(
+    'PerfdataEntry',
+    ('label', 'value', 'uom', 'warn', 'crit', 'min', 'max'),
+)
+
+
+class PerfdataError(ValueError):
+    pass
+
+
+def parse_perfdata(perfdata):
+    """Parse a perfdata string into a list of PerfdataEntry tuples.
+    Values are floats, or None if they were U. warn and crit are range
+    strings, min and max are floats; any of these that were not given are
+    None.
+    Raises PerfdataError if the perfdata is malformed.
+    """
+    entries = []
+    position = 0
+    end = len(perfdata)
+    while position < end:
+        match = PERFDATA_ENTRY.match(perfdata, position)
+        if not match:
+            if TRAILING_WHITESPACE.match(perfdata, position):
+                break
+            raise PerfdataError(
+                'Could not parse perfdata at: {remaining}'.format(
+                    remaining=perfdata[position:],
+                )
+            )
+        entry = match.groupdict()
+        if entry['quoted'] is not None:
+            label = entry['quoted'].replace("''", "'")
+        else:
+            label = entry['label']
+        entries.append(PerfdataEntry(
+            label,
+            _float_or_none(entry['value']),
+            entry['uom'],
+            entry['warn'] or None,
+            entry['crit'] or None,
+            _float_or_none(entry['min']),
+            _float_or_none(entry['max']),
+        ))
+        position = match.end()
+    return entries
+
+
+def quote_label(label):
+    """Quote a label so that it may contain spaces, = and quotes."""
+    return "'{label}'".format(label=label.replace("'", "''"))
+
+
+def get_last_value(perfdata):
+    """Get the value of the last entry in perfdata, as the aggregate and
+    group checks report their result there.
+    Raises PerfdataError if there is no value.
+    """
+    entries = parse_perfdata(perfdata)
+    if not entries or entries[-1].value is None:
+        raise PerfdataError(
+            'No value found in perfdata: {perfdata}'.format(
+                perfdata=perfdata,
+            )
+        )
+    return entries[-1].value
+
+
+def _float_or_none(value):
+    if value in (None, '', 'U'):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise PerfdataError('Invalid number in perfdata: {value}'.format(
+            value=value,
+        ))
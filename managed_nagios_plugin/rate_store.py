@@ -0,0 +1,273 @@
+from array import array
+import json
+import os
+
+from constants import RATE_STORE_PATH
+
+# Rate data is kept in a single sqlite database rather than in one small
+# file per counter. Entries are keyed by what used to be the path of the
+# file for that counter, so instance and node data can still be purged by
+# the old base paths, and old files can be migrated as they are found.
+# The same database keeps a short history of recent samples for checks that
+# evaluate their thresholds over a time window.
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS rates ('
+    'key TEXT PRIMARY KEY, '
+    'timestamp REAL NOT NULL, '
+    'value REAL NOT NULL, '
+    'smoothed REAL'
+    ')'
+)
+HISTORY_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS history ('
+    'key TEXT PRIMARY KEY, '
+    'position INTEGER NOT NULL, '
+    'count INTEGER NOT NULL, '
+    'timestamps BLOB NOT NULL, '
+    'samples BLOB NOT NULL'
+    ')'
+)
+# Version 2 added the smoothed rate, version 3 added the history
+SCHEMA_VERSION = 3
+BUSY_TIMEOUT = 10
+
+
+def connect(db_path=RATE_STORE_PATH):
+    # sqlite3 is only imported when it is used, as most checks do not keep
+    # rates and are run often enough for its import time to matter
+    import sqlite3
+    # Autocommit mode, so that transactions can be explicitly started with
+    # BEGIN IMMEDIATE, taking the write lock before reading
+    connection = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT,
+                                 isolation_level=None)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.execute(SCHEMA)
+    connection.execute(HISTORY_SCHEMA)
+    if connection.execute('PRAGMA user_version').fetchone()[0] < (
+        SCHEMA_VERSION
+    ):
+        _upgrade_schema(connection)
+    return connection
+
+
+def _upgrade_schema(connection):
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        columns = [
+            column[1]
+            for column in connection.execute('PRAGMA table_info(rates)')
+        ]
+        if 'smoothed' not in columns:
+            connection.execute('ALTER TABLE rates ADD COLUMN smoothed REAL')
+        connection.execute(
+            'PRAGMA user_version = {version}'.format(version=SCHEMA_VERSION)
+        )
+        connection.execute('COMMIT')
+    except Exception:
+        connection.execute('ROLLBACK')
+        raise
+
+
+def update_value(key, update, db_path=RATE_STORE_PATH):
+    """Atomically replace the stored entry for key.
+    update is called with the previous entry (a dict with timestamp, result
+    and smoothed, or None if there was no previous entry) and must return a
+    tuple of the new entry and an outcome, which is returned.
+    """
+    return update_values({key: update}, db_path)[key]
+
+
+def update_values(updates, db_path=RATE_STORE_PATH, stale_prefix=None):
+    """Atomically replace the stored entries for several keys at once.
+    updates maps keys to update functions, as for update_value.
+    If stale_prefix is set, any entries under that prefix which are not
+    being updated are removed in the same transaction.
+    Returns a dict mapping keys to the outcomes of their updates.
+    """
+    connection = connect(db_path)
+    outcomes = {}
+    migrated = []
+    try:
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            for key, update in updates.items():
+                row = connection.execute(
+                    'SELECT timestamp, value, smoothed FROM rates '
+                    'WHERE key = ?',
+                    (key,),
+                ).fetchone()
+                if row:
+                    previous = {
+                        'timestamp': row[0],
+                        'result': row[1],
+                        'smoothed': row[2],
+                    }
+                else:
+                    previous = _load_legacy_file(key)
+                    migrated.append(key)
+                new_entry, outcomes[key] = update(previous)
+                connection.execute(
+                    'INSERT OR REPLACE INTO rates '
+                    '(key, timestamp, value, smoothed) VALUES (?, ?, ?, ?)',
+                    (key, new_entry['timestamp'], new_entry['result'],
+                     new_entry.get('smoothed')),
+                )
+            if stale_prefix:
+                stale = [
+                    stored[0] for stored in connection.execute(
+                        'SELECT key FROM rates WHERE key >= ? AND key < ?',
+                        _prefix_range(stale_prefix),
+                    )
+                    if stored[0] not in updates
+                ]
+                connection.executemany(
+                    'DELETE FROM rates WHERE key = ?',
+                    [(key,) for key in stale],
+                )
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+    finally:
+        connection.close()
+
+    for key in migrated:
+        _remove_legacy_file(key)
+    return outcomes
+
+
+def purge(key_prefix, db_path=RATE_STORE_PATH):
+    """Remove the stored values for the given key and all keys under it,
+    e.g. all checks for one instance or node.
+    Returns the number of entries removed.
+    """
+    connection = connect(db_path)
+    try:
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            removed = connection.execute(
+                'DELETE FROM rates WHERE key = ? OR (key >= ? AND key < ?)',
+                (key_prefix.rstrip('/'),) + _prefix_range(key_prefix),
+            ).rowcount
+            removed += connection.execute(
+                'DELETE FROM history WHERE key = ? OR (key >= ? AND key < ?)',
+                (key_prefix.rstrip('/'),) + _prefix_range(key_prefix),
+            ).rowcount
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return removed
+    finally:
+        connection.close()
+
+
+class SampleRing(object):
+    """The most recent samples for one key, oldest first.
+    Samples are kept in fixed size arrays of doubles, with the position of
+    the next write, so that each one is stored as two small blobs and
+    appending does not need to move the existing samples.
+    """
+    def __init__(self, capacity, position=0, count=0, timestamps=None,
+                 samples=None):
+        self.capacity = capacity
+        self.position = position
+        self.count = count
+        self.timestamps = timestamps or array('d', [0.0]) * capacity
+        self.samples = samples or array('d', [0.0]) * capacity
+
+    def append(self, timestamp, value):
+        self.timestamps[self.position] = timestamp
+        self.samples[self.position] = value
+        self.position = (self.position + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def __iter__(self):
+        start = (self.position - self.count) % self.capacity
+        for offset in range(self.count):
+            index = (start + offset) % self.capacity
+            yield self.timestamps[index], self.samples[index]
+
+    def __len__(self):
+        return self.count
+
+    def values_since(self, earliest):
+        return [value for timestamp, value in self if timestamp >= earliest]
+
+    def resized(self, capacity):
+        ring = SampleRing(capacity)
+        for timestamp, value in self:
+            ring.append(timestamp, value)
+        return ring
+
+
+def append_sample(key, timestamp, value, capacity, db_path=RATE_STORE_PATH):
+    """Add a sample to the history for key, keeping at most capacity
+    samples. Returns the resulting SampleRing.
+    """
+    connection = connect(db_path)
+    try:
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT position, count, timestamps, samples FROM history '
+                'WHERE key = ?',
+                (key,),
+            ).fetchone()
+            if row:
+                timestamps = array('d')
+                timestamps.fromstring(bytes(row[2]))
+                samples = array('d')
+                samples.fromstring(bytes(row[3]))
+                ring = SampleRing(len(samples), row[0], row[1], timestamps,
+                                  samples)
+                if ring.capacity != capacity:
+                    ring = ring.resized(capacity)
+            else:
+                ring = SampleRing(capacity)
+            ring.append(timestamp, value)
+            connection.execute(
+                'INSERT OR REPLACE INTO history '
+                '(key, position, count, timestamps, samples) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, ring.position, ring.count,
+                 buffer(ring.timestamps.tostring()),
+                 buffer(ring.samples.tostring())),
+            )
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+    finally:
+        connection.close()
+    return ring
+
+
+def _prefix_range(key_prefix):
+    # Range query rather than LIKE so that the primary key index is used and
+    # no escaping of the prefix is required. '0' sorts directly after '/'.
+    key_prefix = key_prefix.rstrip('/')
+    return key_prefix + '/', key_prefix + '0'
+
+
+def _load_legacy_file(key):
+    # Before the rate store existed the key was the path of a JSON file
+    # holding the last value. This is used the first time a key is seen,
+    # then removed.
+    try:
+        with open(key) as data_handle:
+            previous = json.load(data_handle)
+    except (IOError, ValueError):
+        return None
+    if isinstance(previous, dict):
+        previous.setdefault('smoothed', None)
+        return previous
+    return None
+
+
+def _remove_legacy_file(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
@@ -0,0 +1,262 @@
+import json
+import shlex
+
+from aggregation import (
+    aggregate,
+    unweighted_approach_argument,
+)
+from constants import (
+    BASE_OBJECTS_DIR,
+    HISTORY_GROUP_PATH,
+    HISTORY_META_GROUP_PATH,
+)
+from group_index import get_group_children, get_group_names
+from nagios_plugin_utils import (
+    apply_window,
+    get_argument_parser,
+)
+from perfdata import get_last_value, PerfdataError, quote_label
+
+# Shared by the group check scripts and by the group evaluation engine, so
+# these report problems by raising GroupCheckUnknown rather than exiting.
+GROUP_CHECK_COMMAND = 'check_group_aggregate'
+META_GROUP_CHECK_COMMAND = 'check_group_meta_aggregate'
+GROUP_CHECKS_PATH = BASE_OBJECTS_DIR + '/groups/checks/{group_type}.json'
+# Positional arguments of the check commands, in the order they are given
+# in the service check_command (see command_group_*.cfg)
+GROUP_CHECK_ARGUMENTS = (
+    '--group-type', '--group-instance', '--tenant', '--unknown',
+    '--approach', '--low-warning', '--low-critical', '--high-warning',
+    '--high-critical',
+)
+META_GROUP_CHECK_ARGUMENTS = (
+    '--group-type', '--group-instance-prefix', '--tenant', '--unknown',
+    '--approach', '--low-warning', '--low-critical', '--high-warning',
+    '--high-critical',
+)
+
+
+class GroupCheckUnknown(Exception):
+    pass
+
+
+def get_group_check_argument_parser(meta=False):
+    if meta:
+        description = 'Check all instances of a group with appropriate prefix'
+    else:
+        description = 'Wrapper to check all instances belonging to a node'
+    parser = get_argument_parser(
+        description=description,
+        group=True,
+        allow_rate=False,
+    )
+
+    parser.add_argument(
+        '--tenant',
+        help=(
+            "Name of tenant for this group instance."
+        ),
+        required=True,
+    )
+    if meta:
+        parser.add_argument(
+            '--group-instance-prefix',
+            help=(
+                "Prefix of group instances to include."
+            ),
+            required=True,
+        )
+    else:
+        parser.add_argument(
+            '--group-instance',
+            help=(
+                "Name of group instance to check."
+            ),
+            required=True,
+        )
+    parser.add_argument(
+        '-a', '--approach',
+        help=(
+            "Approach to take when aggregating results."
+        ),
+        type=unweighted_approach_argument,
+        required=True,
+    )
+    parser.add_argument(
+        '-u', '--unknown',
+        help=(
+            "Action taken for unknown (e.g. unreachable) instances."
+        ),
+        choices=('ignore', 'abort'),
+        required=True,
+    )
+    return parser
+
+
+def get_check_command_arguments(check_command):
+    """Get the arguments the group check script would be run with for a
+    service's check_command, e.g. as found in the nagios objects cache.
+    Returns None if the check_command is not for a group check.
+    """
+    command_parts = check_command.split('!')
+    command = command_parts[0]
+    if command == GROUP_CHECK_COMMAND:
+        names = GROUP_CHECK_ARGUMENTS
+    elif command == META_GROUP_CHECK_COMMAND:
+        names = META_GROUP_CHECK_ARGUMENTS
+    else:
+        return None
+    values = command_parts[1:]
+    arguments = [
+        '{name}={value}'.format(name=name, value=value)
+        for name, value in zip(names, values)
+    ]
+    # Anything after the fixed arguments is passed through as options
+    for extra_arguments in values[len(names):]:
+        arguments.extend(shlex.split(extra_arguments))
+    return command, arguments
+
+
+def get_pseudo_host_name(tenant, group_type):
+    return 'tenant:{tenant}/group_type:{group_type}'.format(
+        tenant=tenant,
+        group_type=group_type,
+    )
+
+
+def load_group_checks(group_type):
+    checks_path = GROUP_CHECKS_PATH.format(group_type=group_type)
+    with open(checks_path) as checks_handle:
+        return set(json.load(checks_handle))
+
+
+def is_group_member_check(check, group_members, checks):
+    return (
+        check['host_name'] in group_members
+        and check['service_description'].split(':')[1] in checks
+    )
+
+
+def get_group_instance_service_description(tenant, group_type, group_name):
+    # As in group_check.template
+    return (
+        'Instance {group_name} of group {group_type} for tenant {tenant}'
+    ).format(
+        group_name=group_name,
+        group_type=group_type,
+        tenant=tenant,
+    )
+
+
+def get_child_group_services(tenant, group_type, group_name, index=None):
+    """Get the (host name, service description) of the services of the
+    child group instances of a group instance.
+    """
+    return set(
+        (
+            get_pseudo_host_name(tenant, child_type),
+            get_group_instance_service_description(tenant, child_type,
+                                                   child_name),
+        )
+        for child_type, child_name in get_group_children(
+            tenant, group_type, group_name, index=index,
+        )
+    )
+
+
+def is_group_input_check(check, group_members, checks, child_services):
+    # Group instances aggregate their members' checks and the results of
+    # their child group instances
+    return (
+        (check['host_name'], check['service_description']) in child_services
+        or is_group_member_check(check, group_members, checks)
+    )
+
+
+def get_meta_group_service_descriptions(tenant, group_type,
+                                        group_instance_prefix, index=None):
+    return set(
+        get_group_instance_service_description(tenant, group_type, name)
+        for name in get_group_names(tenant, group_type,
+                                    group_instance_prefix, index=index)
+    )
+
+
+def get_check_values(logger, checks, ignore_unknown):
+    all_values = []
+    for check in checks:
+        logger.debug('Found check: %s', check)
+        if check['current_state'] == '3' or not check['performance_data']:
+            if not ignore_unknown:
+                raise GroupCheckUnknown(
+                    'Current check state for {dep} - {chk} was unknown.'
+                    .format(
+                        dep=check['host_name'],
+                        chk=check['service_description'],
+                    )
+                )
+        else:
+            result = check['performance_data']
+            try:
+                all_values.append(get_last_value(result))
+            except PerfdataError:
+                raise GroupCheckUnknown(
+                    'Could not parse result for {dep} - {chk}. '
+                    'Previous performance data was {data}'.format(
+                        dep=check['host_name'],
+                        chk=check['service_description'],
+                        data=check['performance_data'],
+                    )
+                )
+
+    if not all_values:
+        raise GroupCheckUnknown('No results found for group checks.')
+    return all_values
+
+
+def calculate_group_value(logger, args, values, meta=False):
+    logger.debug('Calculating aggregate using approach: %s', args.approach)
+    value = aggregate(args.approach, values)
+    logger.info('Aggregate value was %s', value)
+
+    if args.window:
+        logger.info('Aggregating results within window')
+        if meta:
+            history_key = HISTORY_META_GROUP_PATH.format(
+                tenant=args.tenant,
+                group_type=args.group_type,
+                prefix=args.group_instance_prefix,
+            )
+        else:
+            history_key = HISTORY_GROUP_PATH.format(
+                tenant=args.tenant,
+                group_type=args.group_type,
+                group=args.group_instance,
+            )
+        value = apply_window(
+            logger, value, history_key,
+            args.window, args.window_approach, args.window_samples,
+        )
+    return value
+
+
+def generate_perfdata(check_identifier, value):
+    # Group names come from the request URL, so may contain spaces or quotes
+    return ' {check_identifier}={value}'.format(
+        check_identifier=quote_label(check_identifier),
+        value=value,
+    )
+
+
+def generate_check_identifier(args, meta=False):
+    if meta:
+        return '{approach}({group_type}/{group_instance_prefix}*)'.format(
+            approach=args.approach,
+            group_type=args.group_type,
+            group_instance_prefix=args.group_instance_prefix,
+        )
+    return '{approach}({group_type}/{group_instance})'.format(
+        approach=args.approach,
+        group_type=args.group_type,
+        group_instance=args.group_instance,
+    )
@@ -1,30 +1,67 @@
 import json
 import logging
-import logging.config
+import os
 
 
 LOGGING_CONFIG_LOCATION = '/etc/nagios/cloudify_components_logging.cfg'
 
+# Modification times of the configurations which have been applied in this
+# process, so that creating further loggers (e.g. for each request handled
+# by nagiosrest) does not read and apply the configuration again unless it
+# has been changed.
+_APPLIED_CONFIGURATIONS = {}
+
+
+def configure(config_location=LOGGING_CONFIG_LOCATION):
+    modified = os.stat(config_location).st_mtime
+    if _APPLIED_CONFIGURATIONS.get(config_location) == modified:
+        return
+
+    with open(config_location) as config_handle:
+        config = json.load(config_handle)
+    if config.get('disabled'):
+        # No logging at all, e.g. when the component log level is NONE.
+        # Every logging call then returns after one comparison.
+        logging.disable(logging.CRITICAL)
+    else:
+        # logging.config imports the handlers and their dependencies, so is
+        # left until it is needed
+        from logging.config import dictConfig
+        logging.disable(logging.NOTSET)
+        dictConfig(config)
+    _APPLIED_CONFIGURATIONS[config_location] = modified
+
 
 class Logger(object):
+    # Messages may be given with %-style arguments, which are only
+    # formatted if the message will be logged, e.g.
+    #   logger.debug('Checking host %s', host_name)
     def __init__(self, name, config_location=LOGGING_CONFIG_LOCATION):
         self._logger = logging.getLogger(name)
 
         if config_location:
-            with open(config_location) as config_handle:
-                logging.config.dictConfig(json.load(config_handle))
+            configure(config_location)
+
+    def is_debug_enabled(self):
+        # For guarding debug output which is costly to prepare
+        return self._logger.isEnabledFor(logging.DEBUG)
 
-    def debug(self, message):
-        self._logger.debug(message)
+    def debug(self, message, *args):
+        if self._logger.isEnabledFor(logging.DEBUG):
+            self._logger.debug(message, *args)
 
-    def info(self, message):
-        self._logger.info(message)
+    def info(self, message, *args):
+        if self._logger.isEnabledFor(logging.INFO):
+            self._logger.info(message, *args)
 
-    def warn(self, message):
-        self._logger.warn(message)
+    def warn(self, message, *args):
+        if self._logger.isEnabledFor(logging.WARNING):
+            self._logger.warn(message, *args)
 
-    def error(self, message):
-        self._logger.error(message)
+    def error(self, message, *args):
+        if self._logger.isEnabledFor(logging.ERROR):
+            self._logger.error(message, *args)
 
-    def exception(self, message):
-        self._logger.exception(message)
+    def exception(self, message, *args):
+        if self._logger.isEnabledFor(logging.ERROR):
+            self._logger.exception(message, *args)
@@ -3,16 +3,18 @@ from __future__ import print_function
 
 import argparse
 import hashlib
-import json
 import os
 import re
 from subprocess import check_output, CalledProcessError
 import sys
 import time
 
+from aggregation import aggregate, unweighted_approach_argument
 from constants import RATE_NODE_PATH, RATE_INSTANCE_PATH
 from nagios_utils import get_types
-from utils import run
+from perfdata import parse_perfdata, PerfdataError
+import rate_store
+import timing
 
 
 STATUS_OK = 0
@@ -27,9 +29,29 @@ STATUS_DETAILS = {
 }
 TARGET_TYPE_BASE_PATH = '/etc/nagios/objects/target_types'
 RESULT_REGEX_BASE = '^SNMP (?:RATE )?OK - "?({val_string})"?.*'
+RESULT_FLOATS_FINDER = re.compile(RESULT_REGEX_BASE.format(
+    val_string='[0-9. ]+',
+))
+RESULT_FLOAT_FINDER = re.compile(RESULT_REGEX_BASE.format(
+    val_string='[0-9.]+',
+))
+DEFAULT_WINDOW_SAMPLES = 60
+# Counter width to be found from the values, see get_auto_counter_bits
+AUTO_COUNTER_BITS = 'auto'
 
 
 def output_and_exit(value, perfdata, state, level, rate_check, group=False):
+    # Timings go first, as the value of the last perfdata entry is the
+    # result of the check, e.g. for the group checks
+    perfdata = timing.get_perfdata() + perfdata
+    exit_status, output = format_output(value, perfdata, state, level,
+                                        rate_check, group)
+    timing.write_summary(os.path.basename(sys.argv[0]))
+    print(output)
+    sys.exit(exit_status)
+
+
+def format_output(value, perfdata, state, level, rate_check, group=False):
     exit_status, value_delimiters = STATUS_DETAILS.get(
         state,
         STATUS_DETAILS['UNKNOWN'],
@@ -42,14 +64,14 @@ def output_and_exit(value, perfdata, state, level, rate_check, group=False):
         prefix = 'SNMP'
     if rate_check:
         prefix += ' RATE'
-    print('{prefix} {state} - {delim}{value}{delim} |{perfdata}'.format(
+    output = '{prefix} {state} - {delim}{value}{delim} |{perfdata}'.format(
         prefix=prefix,
         state=state,
         value=value,
         delim=value_delimiters,
         perfdata=perfdata,
-    ))
-    sys.exit(exit_status)
+    )
+    return exit_status, output
 
 
 def float_or_empty(value):
@@ -123,6 +145,54 @@ def get_argument_parser(description, group=False, allow_rate=True):
             default=False,
             action="store_true",
         )
+        parser.add_argument(
+            '--counter-bits',
+            help=(
+                "Width of the counter(s) used for rate checks, so that "
+                "counter wraps and resets can be recognised. 'auto' treats "
+                "values as counters if the SNMP type is a counter, 'none' "
+                "reports any change, even negative, as a rate."
+            ),
+            choices=['auto', 'none', '32', '64'],
+            default='auto',
+        )
+        parser.add_argument(
+            '--rate-smoothing',
+            help=(
+                "Weight given to the newest rate when smoothing rates with "
+                "an exponentially weighted moving average. 0 to disable "
+                "smoothing."
+            ),
+            default=0.0,
+            type=float,
+        )
+
+    parser.add_argument(
+        '--window',
+        help=(
+            "Check thresholds against an aggregate of the results from this "
+            "many seconds, rather than only the latest result. 0 to only "
+            "use the latest result."
+        ),
+        default=0.0,
+        type=float,
+    )
+    parser.add_argument(
+        '--window-approach',
+        help=(
+            "Approach to take when aggregating results within the window."
+        ),
+        default='arithmetic_mean',
+        type=unweighted_approach_argument,
+    )
+    parser.add_argument(
+        '--window-samples',
+        help=(
+            "Maximum amount of results to keep for the window."
+        ),
+        default=DEFAULT_WINDOW_SAMPLES,
+        type=int,
+    )
 
     return parser
 
@@ -132,24 +202,37 @@ def validate_and_structure_thresholds(low_warning,
                                       high_warning,
                                       high_critical,
                                       logger):
+    try:
+        return structure_thresholds(low_warning, low_critical,
+                                    high_warning, high_critical, logger)
+    except ValueError as err:
+        logger.error(str(err))
+        print(str(err))
+        sys.exit(STATUS_UNKNOWN)
+
+
+def structure_thresholds(low_warning,
+                         low_critical,
+                         high_warning,
+                         high_critical,
+                         logger):
     high_thresholds = [
         threshold for threshold in high_warning, high_critical
         if threshold != ""
     ]
-    logger.debug('High thresholds: {high}'.format(high=high_thresholds))
+    logger.debug('High thresholds: %s', high_thresholds)
     low_thresholds = [
         threshold for threshold in low_warning, low_critical
         if threshold != ""
     ]
-    logger.debug('Low thresholds: {low}'.format(low=low_thresholds))
+    logger.debug('Low thresholds: %s', low_thresholds)
     if (
         low_thresholds and high_thresholds
         and max(low_thresholds) >= min(high_thresholds)
     ):
-        message = 'High thresholds must be higher than low thresholds'
-        logger.error(message)
-        print(message)
-        sys.exit(STATUS_UNKNOWN)
+        raise ValueError(
+            'High thresholds must be higher than low thresholds'
+        )
 
     return {
         'low': {
@@ -170,9 +253,8 @@ def run_check(script_path, target_type, hostname, oid, logger,
         base=TARGET_TYPE_BASE_PATH,
         target_type=hashlib.md5(target_type).hexdigest(),
     )
-    logger.debug('Using target type configuration from: {path}'.format(
-        path=target_type_ini_path,
-    ))
+    logger.debug('Using target type configuration from: %s',
+                 target_type_ini_path)
     if not os.path.exists(target_type_ini_path):
         valid = get_types('target', logger)
         valid_string = ','.join(valid) if valid else 'None'
@@ -198,9 +280,7 @@ def run_check(script_path, target_type, hostname, oid, logger,
         this_dir,
         check_snmp_script_name,
     )
-    logger.debug('Using check_snmp script at: {path}'.format(
-        path=check_snmp_location,
-    ))
+    logger.debug('Using check_snmp script at: %s', check_snmp_location)
     if not os.path.isfile(check_snmp_location):
         logger.error('check_snmp script not found')
         print(
@@ -226,15 +306,12 @@ def run_check(script_path, target_type, hostname, oid, logger,
         '--oid={oid}'.format(oid=oid),
         '--timeout=2:3',  # Time-out after 2 seconds as unknown(3)
     ]
-    logger.debug(
-        'Executing command {raw_command}'.format(
-            raw_command=command,
-        )
-    )
+    logger.debug('Executing command %s', command)
 
     result = None
     try:
-        result = check_output(command)
+        with timing.span('snmp_call'):
+            result = check_output(command)
     except CalledProcessError as err:
         if ignore_unknown and err.returncode == 3:
             logger.warn('Command returned unknown state, ignoring.')
@@ -259,8 +336,7 @@ def get_perfdata(result):
 
 
 def get_floats_from_result(result):
-    search_expression = RESULT_REGEX_BASE.format(val_string='[0-9. ]+')
-    values = re.findall(search_expression, result)
+    values = RESULT_FLOATS_FINDER.findall(result)
     if values:
         values = values[0].split(' ')
         try:
@@ -272,8 +348,7 @@ def get_floats_from_result(result):
 
 
 def get_single_float_from_result(result):
-    search_expression = RESULT_REGEX_BASE.format(val_string='[0-9.]+')
-    value = re.findall(search_expression, result)
+    value = RESULT_FLOAT_FINDER.findall(result)
     if not value:
         print('Value not found in output: {output}'.format(output=result))
         sys.exit(STATUS_UNKNOWN)
@@ -293,22 +368,25 @@ def _fail_float_conversion(value):
 
 def check_thresholds_and_exit(value, thresholds, perfdata, rate_check,
                               group=False):
+    state, level = get_threshold_state(value, thresholds)
+    output_and_exit(value, perfdata, state, level, rate_check, group)
+
+
+def get_threshold_state(value, thresholds):
     for level in 'low', 'high':
-        # We check critical before warning so that we exit correctly on a
-        # critical state, rather than having already exited on a warning
-        # because a critical state also breaches the warning threshold.
+        # We check critical before warning so that we report a critical
+        # state, rather than a warning because a critical state also
+        # breaches the warning threshold.
         for state in 'critical', 'warning':
             threshold = thresholds[level][state]
             if threshold == "":
                 continue
             elif level == 'low' and value <= threshold:
-                output_and_exit(value, perfdata, state.upper(), level.upper(),
-                                rate_check, group)
+                return state.upper(), level.upper()
             elif level == 'high' and value >= threshold:
-                output_and_exit(value, perfdata, state.upper(), level.upper(),
-                                rate_check, group)
+                return state.upper(), level.upper()
 
-    output_and_exit(value, perfdata, 'OK', None, rate_check, group)
+    return 'OK', None
 
 
 def get_instance_rate_storage_path(hostname, check):
@@ -325,77 +403,185 @@ def get_node_rate_storage_path(node, check):
     )
 
 
-def store_value_and_calculate_rate(logger, value, path):
-    logger.debug(
-        'Attempting to store value ({value}) and calculate rate with data '
-        'from {path}'.format(
-            value=value,
-            path=path,
-        )
-    )
-    current_time = int(time.time())
-    logger.debug('Current time: {current_time}'.format(
-        current_time=current_time,
-    ))
+class RateUnavailable(Exception):
+    pass
 
-    old_results = None
-    logger.debug('Attempting to load old results')
+
+def result_is_counter(result):
+    # check_snmp marks counter values (Counter32/Counter64) in its perfdata
+    # with a UOM of 'c'
+    if '|' not in result:
+        return False
     try:
-        with open(path) as data_handle:
-            old_results = json.load(data_handle)
-    except IOError:
-        logger.debug('Previous results not found.')
-        print("Could not open previous data to calculate rate.")
-        sys.exit(STATUS_UNKNOWN)
-    except ValueError:
-        logger.warn('Previous data in {path} was in unknown format'.format(
-            path=path,
-        ))
-        print(
-            "Previous data was in an unknown format, cannot calculate rate."
+        entries = parse_perfdata(get_perfdata(result))
+    except PerfdataError:
+        return False
+    return bool(entries) and all(entry.uom == 'c' for entry in entries)
+
+
+def get_counter_bits(setting, is_counter):
+    # None means the value is not a counter, 0 means it is a counter of
+    # unknown width, so any decrease is treated as a reset.
+    # check_snmp marks both Counter32 and Counter64 values in the same way,
+    # so in auto mode the width is found from the values when calculating
+    # the rate.
+    if setting == 'none':
+        return None
+    elif setting == 'auto':
+        if not is_counter:
+            return None
+        return AUTO_COUNTER_BITS
+    else:
+        return int(setting)
+
+
+def get_auto_counter_bits(previous_value, value):
+    # Values seen at or above the 32 bit range must be from a 64 bit
+    # counter. Otherwise the counter is treated as 32 bit, so a 64 bit
+    # counter which is reset while below 2^32 will be taken to have wrapped
+    # if it had moved less than half of the 32 bit range from zero, giving
+    # one implausibly high rate. Set the width if this matters.
+    if max(previous_value, value) >= 2 ** 32:
+        return 64
+    return 32
+
+
+def calculate_counter_rate(previous, timestamp, value, counter_bits=None):
+    interval = timestamp - previous['timestamp']
+    if interval <= 0:
+        raise RateUnavailable(
+            "Previous data was collected too recently, cannot calculate "
+            "rate."
         )
-        sys.exit(STATUS_UNKNOWN)
-    finally:
-        logger.debug('Storing data')
-        run(['mkdir', '-p', os.path.dirname(path)])
-        with open(path, 'w') as save_handle:
-            json.dump(
-                obj={
-                    'timestamp': current_time,
-                    'result': value,
-                },
-                fp=save_handle,
-            )
-        logger.debug('Old data stored')
-
-    logger.debug('Old results were: {old_results}'.format(
-        old_results=old_results,
-    ))
 
-    if 'timestamp' in old_results and 'result' in old_results:
-        logger.debug('Calculating rate')
-        old_time = old_results['timestamp']
-        interval = current_time - old_time
-        logger.debug('Interval was: {interval}'.format(interval=interval))
-        if interval < 1:
-            logger.warn(
-                'Previous data collection was too recent, cannot calculate '
-                'rate'
-            )
-            print(
-                "Previous data was collected too recently, cannot calculate "
+    if counter_bits == AUTO_COUNTER_BITS:
+        counter_bits = get_auto_counter_bits(previous['result'], value)
+    difference = value - previous['result']
+    if difference < 0 and counter_bits is not None:
+        counter_range = 2 ** counter_bits if counter_bits else 0
+        wrapped_difference = difference + counter_range
+        # A counter that wrapped will have moved forward by less than half
+        # of its range. Anything else means the counter was reset, e.g.
+        # because the agent restarted.
+        if counter_bits and 0 <= wrapped_difference < counter_range / 2:
+            difference = wrapped_difference
+        else:
+            raise RateUnavailable(
+                "Counter was reset since the last check, cannot calculate "
                 "rate."
             )
-            sys.exit(STATUS_UNKNOWN)
-        else:
-            difference = value - old_results['result']
-            logger.debug('Difference was: {diff}'.format(diff=difference))
-            return float(difference)/interval
-    else:
-        logger.warn(
-            'Old data in {path} was incomplete, cannot calculate rate'.format(
-                path=path,
+    return float(difference) / interval
+
+
+def smooth_rate(rate, previous_smoothed, smoothing):
+    # Exponentially weighted moving average, with smoothing being the
+    # weight given to the newest rate
+    if not smoothing or previous_smoothed is None:
+        return rate
+    return smoothing * rate + (1 - smoothing) * previous_smoothed
+
+
+def get_rate_updater(logger, path, value, current_time, counter_bits=None,
+                     smoothing=0):
+    # Returns a function for the rate store to update the value and
+    # calculate the rate using the previous value, in one transaction
+    def update(old_results):
+        new_results = {
+            'timestamp': current_time,
+            'result': value,
+            'smoothed': None,
+        }
+        logger.debug('Old results for %s were: %s', path, old_results)
+        if old_results is None:
+            logger.debug('Previous results not found.')
+            return new_results, RateUnavailable(
+                "Could not open previous data to calculate rate."
+            )
+        if 'timestamp' not in old_results or 'result' not in old_results:
+            logger.warn(
+                'Old data in {path} was incomplete, cannot calculate '
+                'rate'.format(path=path)
+            )
+            return new_results, RateUnavailable(
+                "Previous data was incomplete, cannot calculate rate."
             )
+
+        logger.debug('Calculating rate')
+        try:
+            rate = calculate_counter_rate(old_results, current_time, value,
+                                          counter_bits)
+        except RateUnavailable as err:
+            logger.warn('{path}: {err}'.format(path=path, err=str(err)))
+            return new_results, err
+        if smoothing:
+            rate = smooth_rate(rate, old_results.get('smoothed'), smoothing)
+            new_results['smoothed'] = rate
+        return new_results, rate
+    return update
+
+
+def store_value_and_calculate_rate(logger, value, path, counter_bits=None,
+                                   smoothing=0):
+    logger.debug(
+        'Attempting to store value (%s) and calculate rate with data from %s',
+        value,
+        path,
+    )
+    current_time = time.time()
+    logger.debug('Current time: %s', current_time)
+
+    logger.debug('Storing data and retrieving old results')
+    with timing.span('rate_store'):
+        rate = rate_store.update_value(
+            path,
+            get_rate_updater(logger, path, value, current_time, counter_bits,
+                             smoothing),
         )
-        print("Previous data was incomplete, cannot calculate rate.")
+    if isinstance(rate, RateUnavailable):
+        print(str(rate))
         sys.exit(STATUS_UNKNOWN)
+    return rate
+
+
+def store_values_and_calculate_rates(logger, values, stale_prefix=None,
+                                     smoothing=0):
+    """Store several values and calculate their rates in one transaction.
+    values maps rate storage paths to tuples of (value, counter_bits).
+    Any stored values under stale_prefix that are not in values are
+    removed.
+    Returns a dict of paths to rates, only for the values for which a rate
+    could be calculated.
+    """
+    logger.debug('Attempting to store %s values and calculate rates',
+                 len(values))
+    current_time = time.time()
+    with timing.span('rate_store'):
+        rates = rate_store.update_values(
+            {
+                path: get_rate_updater(logger, path, value, current_time,
+                                       counter_bits, smoothing)
+                for path, (value, counter_bits) in values.items()
+            },
+            stale_prefix=stale_prefix,
+        )
+    return {
+        path: rate for path, rate in rates.items()
+        if not isinstance(rate, RateUnavailable)
+    }
+
+
+def apply_window(logger, value, key, window, approach,
+                 samples=DEFAULT_WINDOW_SAMPLES):
+    # Keep this result in the history for the check, then aggregate the
+    # results within the window
+    if not window:
+        return value
+    current_time = time.time()
+    with timing.span('rate_store'):
+        history = rate_store.append_sample(key, current_time, value,
+                                           max(samples, 1))
+    values = history.values_since(current_time - window)
+    logger.debug('Results within %s seconds were: %s', window, values)
+    value = aggregate(approach, values)
+    logger.debug('%s of results within window was: %s', approach, value)
+    return value
@@ -1,24 +1,33 @@
+from functools import partial
+import json
 import os
 from subprocess import CalledProcessError
-import time
 
 from flask import (
     Flask,
     request,
 )
 
+from aggregation import parse_approach, validate_window
+import group_index
 import logging_utils
 from nagiosrest_group import (
     create_group_instance,
     create_meta_group,
-    associate_node_with_group_instance,
+    associate_group_with_parent,
+    check_group_memberships,
+    check_group_pairs,
+    check_group_parents,
     get_group_check_configuration_destination,
     get_group_check_reaction_target_path,
     get_group_members_path,
     get_meta_group_configuration_destination,
     get_meta_group_reaction_configuration_path,
     get_meta_group_reaction_target_path,
+    remove_group_relations,
+    update_node_group_memberships,
 )
+from nagiosrest_jobs import JobQueue
 from nagiosrest_target import (
     create_target,
     get_node_configuration_destination,
@@ -31,15 +40,20 @@ from nagiosrest_tenant import (
 )
 from constants import (
     BASE_OBJECTS_DIR,
+    HISTORY_GROUP_PATH,
+    HISTORY_META_GROUP_PATH,
     RATE_INSTANCE_BASE_PATH,
     RATE_NODE_BASE_PATH,
     TENANT_DEPLOYMENT_HOSTGROUP,
 )
 import nagios_utils
+from nagios_utils import get_node_id
+import rate_store
+import timing
 from utils import (
+    get_evaluation_parameters,
     remove_configuration_file,
     trigger_nagios_reload,
-    get_node_id,
     run,
 )
 
@@ -56,6 +70,18 @@ OPTIONAL_TARGET_CREATE_ARGS = (
 REQUIRED_GROUP_CREATE_ARGS = (
     'reaction_target',
 )
+OPTIONAL_GROUP_CREATE_ARGS = (
+    'parents',
+)
+REQUIRED_GROUP_MEMBERS_ARGS = (
+    'members',
+)
+GROUP_MEMBER_KEYS = (
+    'deployment',
+    'node',
+    'group_type',
+    'group_name',
+)
 REQUIRED_META_GROUP_CREATE_ARGS = (
     'approach',
     'unknown',
@@ -69,7 +95,22 @@ OPTIONAL_META_GROUP_CREATE_ARGS = (
     'high_critical_threshold',
     'low_reaction',
     'high_reaction',
+    'window',
+    'window_approach',
+    'window_samples',
+    'evaluation',
 )
+META_GROUP_UNKNOWN_ACTIONS = (
+    'ignore',
+    'abort',
+)
+# Seconds that a request for a job's state may wait for it to finish, which
+# must be less than gunicorn's worker timeout
+MAX_JOB_WAIT = 25
+# Seconds to wait for nagios to load a new target after reloading
+TARGET_LOAD_TIMEOUT = 15
+
+JOBS = JobQueue()
 
 
 # Retrieved from flask.pocoo.org/snippets/69/
@@ -89,6 +130,12 @@ class RemoteUserMiddleware(object):
 application.wsgi_app = RemoteUserMiddleware(application.wsgi_app)
 
 
+@application.after_request
+def write_timing_summary(response):
+    timing.write_summary('nagiosrest')
+    return response
+
+
 def get_user():
     return request.environ.get('REMOTE_USER')
 
@@ -116,7 +163,7 @@ def check_request_json(logger, request, required_args):
             400
         )
     request_data = request.get_json()
-    if not all(
+    if not isinstance(request_data, dict) or not all(
         arg in request_data
         for arg in required_args
     ):
@@ -133,6 +180,41 @@ def check_request_json(logger, request, required_args):
     return request_data
 
 
+def is_async_request():
+    return request.args.get('async', '').lower() in ('true', 'yes', '1')
+
+
+def apply_change(description, apply, finish=None):
+    # Changes are applied in this request unless the caller asked for them
+    # to be queued (with ?async=true), in which case the caller is given a
+    # job ID to get the result from /jobs/<job_id>
+    if is_async_request():
+        job_id = JOBS.submit(description, apply, finish)
+        return (
+            json.dumps({'job_id': job_id}) + '\n',
+            202,
+            {'Content-Type': 'application/json'},
+        )
+    return JOBS.run_now(apply, finish)
+
+
+@application.route("/jobs/<job_id>", methods=['GET'])
+def jobs(job_id):
+    # Callers may wait for the job to finish with ?wait=<seconds>
+    try:
+        wait = min(float(request.args.get('wait', 0)), MAX_JOB_WAIT)
+    except ValueError:
+        return ('wait must be a number of seconds\n', 400)
+    job = JOBS.get(job_id, wait=wait)
+    if job is None:
+        return ('Job {job_id} not found\n'.format(job_id=job_id), 404)
+    return (
+        json.dumps(job) + '\n',
+        200,
+        {'Content-Type': 'application/json'},
+    )
+
+
 @application.route("/groups/<tenant>/<group_type>/<group_name>",
                    methods=['PUT', 'DELETE'])
 def groups(tenant, group_type, group_name):
@@ -150,83 +232,223 @@ def groups(tenant, group_type, group_name):
         logger.info('Creating group instance')
         request_data = check_request_json(logger, request,
                                           REQUIRED_GROUP_CREATE_ARGS)
+        if isinstance(request_data, tuple):
+            return request_data
 
-        logger.debug('Checking group type {group_type} exists'.format(
-            group_type=group_type,
-        ))
-        group_types = nagios_utils.get_types('group', logger)
-        logger.debug('Found group types: {group_types}'.format(
-            group_types=', '.join(group_types),
-        ))
-        if group_type not in group_types:
+        logger.debug('Checking group type %s exists', group_type)
+        if not nagios_utils.type_exists('group', group_type, logger):
             message = (
                 'Group type {group_type} was not valid. '
                 'Group instance will not be created. '
                 'Available group types are: {group_types}'.format(
-                    group_type=request_data['group_type'],
-                    group_types=', '.join(group_types),
+                    group_type=group_type,
+                    group_types=', '.join(
+                        nagios_utils.get_types('group', logger)
+                    ),
                 )
             )
             logger.error(message)
             return (message, 400)
 
+        # Parents are group instances that this one is rolled up into
+        parents = request_data.get('parents', [])
         try:
-            logger.debug('Attempting to add configuration')
-            create_group_instance(
-                logger,
-                group_name,
-                group_type,
-                tenant,
-                request_data['reaction_target'],
-            )
-            return 'Group instance {name} created\n'.format(name=group_name)
-        except Exception as err:
-            message = (
-                'Failed to apply configuration with error {err_type}: '
-                '{err_msg}'.format(
-                    err_type=str(type(err)),
-                    err_msg=str(err),
-                )
-            )
-            logger.error(message)
-            return (
-                message,
-                500
-            )
+            check_group_parents(tenant, group_type, group_name, parents)
+        except ValueError as err:
+            logger.error(str(err))
+            return (str(err), 400)
+
+        return apply_change(
+            'Create group instance {name} of {group_type} for '
+            '{tenant}'.format(
+                name=group_name,
+                group_type=group_type,
+                tenant=tenant,
+            ),
+            partial(apply_group_creation, logger, tenant, group_type,
+                    group_name, request_data['reaction_target'], parents),
+        )
     elif request.method == 'DELETE':
         logger.info('Deleting group instance')
-        logger.debug('Removing group configuration')
-        conf_path = get_group_check_configuration_destination(
-            group_type,
+        return apply_change(
+            'Delete group instance {name} of {group_type} for '
+            '{tenant}'.format(
+                name=group_name,
+                group_type=group_type,
+                tenant=tenant,
+            ),
+            partial(apply_group_deletion, logger, tenant, group_type,
+                    group_name),
+        )
+
+
+def apply_group_creation(logger, tenant, group_type, group_name,
+                         reaction_target, parents):
+    try:
+        logger.debug('Attempting to add configuration')
+        create_group_instance(
+            logger,
             group_name,
+            group_type,
             tenant,
+            reaction_target,
         )
-        remove_configuration_file(
-            logger,
-            conf_path,
+        for parent_type, parent_name in parents:
+            associate_group_with_parent(logger, tenant,
+                                        group_type, group_name,
+                                        parent_type, parent_name)
+        return 'Group instance {name} created\n'.format(name=group_name)
+    except Exception as err:
+        message = (
+            'Failed to apply configuration with error {err_type}: '
+            '{err_msg}'.format(
+                err_type=str(type(err)),
+                err_msg=str(err),
+            )
+        )
+        logger.error(message)
+        return (
+            message,
+            500
         )
 
-        logger.debug('Removing reaction target')
-        reaction_target_path = get_group_check_reaction_target_path(
-            group_type,
-            group_name,
-            tenant,
+
+def apply_group_deletion(logger, tenant, group_type, group_name):
+    logger.debug('Removing group configuration')
+    conf_path = get_group_check_configuration_destination(
+        group_type,
+        group_name,
+        tenant,
+    )
+    remove_configuration_file(
+        logger,
+        conf_path,
+    )
+
+    logger.debug('Removing reaction target')
+    reaction_target_path = get_group_check_reaction_target_path(
+        group_type,
+        group_name,
+        tenant,
+    )
+    os.unlink(reaction_target_path)
+
+    logger.debug('Removing group node listing')
+    group_members_path = get_group_members_path(
+        group_type,
+        group_name,
+        tenant,
+    )
+    run(['rm', '-rf', group_members_path])
+    remove_group_relations(tenant, group_type, group_name)
+
+    logger.debug('Removing any result history')
+    rate_store.purge(HISTORY_GROUP_PATH.format(
+        tenant=tenant,
+        group_type=group_type,
+        group=group_name,
+    ))
+
+    return '{group_name} of {group_type} for {tenant} deleted\n'.format(
+        group_name=group_name,
+        group_type=group_type,
+        tenant=tenant,
+    )
+
+
+@application.route("/groupmembers/<tenant>", methods=['PUT', 'DELETE'])
+def group_members(tenant):
+    # Adds (PUT) or removes (DELETE) the memberships of many nodes in group
+    # instances, given as a list of dicts with GROUP_MEMBER_KEYS
+    logger = logging_utils.Logger('nagiosrest')
+    logger.info(
+        'Group members: Processing {method} for tenant {tenant}'.format(
+            method=request.method,
+            tenant=tenant,
         )
-        os.unlink(reaction_target_path)
+    )
+    request_data = check_request_json(logger, request,
+                                      REQUIRED_GROUP_MEMBERS_ARGS)
+    if isinstance(request_data, tuple):
+        return request_data
 
-        logger.debug('Removing group node listing')
-        group_members_path = get_group_members_path(
-            group_type,
-            group_name,
-            tenant,
+    memberships = []
+    for member in request_data['members']:
+        if not isinstance(member, dict) or not all(
+            key in member for key in GROUP_MEMBER_KEYS
+        ):
+            message = (
+                'Each member must be a dict with the keys: {keys}\n'.format(
+                    keys=','.join(GROUP_MEMBER_KEYS),
+                )
+            )
+            logger.error(message)
+            return (message, 400)
+        memberships.append(tuple(member[key] for key in GROUP_MEMBER_KEYS))
+    try:
+        check_group_memberships(memberships)
+    except ValueError as err:
+        logger.error(str(err))
+        return (str(err) + '\n', 400)
+
+    if request.method == 'PUT':
+        # Removing a membership that does not exist is not an error, but
+        # adding one to a group instance that does not exist is
+        for group_type, group_name in sorted(set(
+            (group_type, group_name)
+            for _, _, group_type, group_name in memberships
+        )):
+            if group_name not in group_index.get_group_names(
+                tenant, group_type, group_name,
+            ):
+                message = (
+                    'Group instance {name} of {group_type} does not '
+                    'exist.\n'.format(
+                        name=group_name,
+                        group_type=group_type,
+                    )
+                )
+                logger.error(message)
+                return (message, 400)
+        return apply_change(
+            'Add {count} group members for {tenant}'.format(
+                count=len(memberships),
+                tenant=tenant,
+            ),
+            partial(apply_group_members_change, logger, tenant,
+                    added=memberships),
+        )
+    elif request.method == 'DELETE':
+        return apply_change(
+            'Remove {count} group members for {tenant}'.format(
+                count=len(memberships),
+                tenant=tenant,
+            ),
+            partial(apply_group_members_change, logger, tenant,
+                    removed=memberships),
         )
-        run(['rm', '-rf', group_members_path])
 
-        return '{group_name} of {group_type} for {tenant} deleted\n'.format(
-            group_name=group_name,
-            group_type=group_type,
-            tenant=tenant,
+
+def apply_group_members_change(logger, tenant, added=(), removed=()):
+    try:
+        update_node_group_memberships(logger, tenant, added, removed)
+    except Exception as err:
+        message = (
+            'Failed to apply configuration with error {err_type}: '
+            '{err_msg}'.format(
+                err_type=str(type(err)),
+                err_msg=str(err),
+            )
         )
+        logger.error(message)
+        return (
+            message,
+            500
+        )
+    return '{added} group members added and {removed} removed\n'.format(
+        added=len(added),
+        removed=len(removed),
+    )
 
 
 @application.route(
@@ -248,96 +470,180 @@ def meta_groups(tenant, group_type, group_instance_prefix):
         logger.info('Creating meta group')
         request_data = check_request_json(logger, request,
                                           REQUIRED_META_GROUP_CREATE_ARGS)
+        if isinstance(request_data, tuple):
+            return request_data
 
-        logger.debug('Checking group type {group_type} exists'.format(
-            group_type=group_type,
-        ))
-        group_types = nagios_utils.get_types('group', logger)
-        logger.debug('Found group types: {group_types}'.format(
-            group_types=', '.join(group_types),
-        ))
-        if group_type not in group_types:
+        logger.debug('Checking group type %s exists', group_type)
+        if not nagios_utils.type_exists('group', group_type, logger):
             message = (
                 'Group type {group_type} was not valid. '
                 'Group instance will not be created. '
                 'Available group types are: {group_types}'.format(
-                    group_type=request_data['group_type'],
-                    group_types=', '.join(group_types),
+                    group_type=group_type,
+                    group_types=', '.join(
+                        nagios_utils.get_types('group', logger)
+                    ),
                 )
             )
             logger.error(message)
             return (message, 400)
 
+        # Invalid settings would otherwise only be found when the change is
+        # applied, or by the check, which would then fail on every run
         try:
-            logger.debug('Attempting to add configuration')
-            create_meta_group(
-                logger,
-                group_instance_prefix,
-                group_type,
-                tenant,
-                request_data['approach'],
-                request_data['unknown'],
-                request_data.get('interval', 1),
-                request_data.get('low_warning_threshold', ""),
-                request_data.get('low_critical_threshold', ""),
-                request_data.get('high_warning_threshold', ""),
-                request_data.get('high_critical_threshold', ""),
-                request_data['target'],
-                request_data.get('low_reaction'),
-                request_data.get('high_reaction'),
-            )
-            return 'Meta group {name} created\n'.format(
-                name=group_instance_prefix
-            )
-        except Exception as err:
-            message = (
-                'Failed to apply configuration with error {err_type}: '
-                '{err_msg}'.format(
-                    err_type=str(type(err)),
-                    err_msg=str(err),
-                )
-            )
-            logger.error(message)
-            return (
-                message,
-                500
-            )
+            check_meta_group_settings(request_data)
+        except ValueError as err:
+            logger.error(str(err))
+            return (str(err) + '\n', 400)
+
+        return apply_change(
+            'Create meta group {name} of {group_type} for '
+            '{tenant}'.format(
+                name=group_instance_prefix,
+                group_type=group_type,
+                tenant=tenant,
+            ),
+            partial(apply_meta_group_creation, logger, tenant, group_type,
+                    group_instance_prefix, request_data),
+        )
     elif request.method == 'DELETE':
         logger.info('Deleting group instance')
-        logger.debug('Removing group configuration')
-        conf_path = get_meta_group_configuration_destination(
-            group_type,
-            group_instance_prefix,
-            tenant,
-        )
-        remove_configuration_file(
-            logger,
-            conf_path,
+        return apply_change(
+            'Delete meta group {name} of {group_type} for '
+            '{tenant}'.format(
+                name=group_instance_prefix,
+                group_type=group_type,
+                tenant=tenant,
+            ),
+            partial(apply_meta_group_deletion, logger, tenant, group_type,
+                    group_instance_prefix),
         )
 
-        logger.debug('Removing reaction configuration path')
-        reaction_conf_path = get_meta_group_reaction_configuration_path(
-            group_type,
-            group_instance_prefix,
-            tenant,
+
+def check_meta_group_settings(request_data):
+    parse_approach(request_data['approach'], allow_weighted=False)
+    if request_data['unknown'] not in META_GROUP_UNKNOWN_ACTIONS:
+        raise ValueError(
+            'unknown must be one of {actions}, but was {unknown}'.format(
+                actions=', '.join(META_GROUP_UNKNOWN_ACTIONS),
+                unknown=request_data['unknown'],
+            )
+        )
+    interval = request_data.get('interval', 1)
+    try:
+        float(interval)
+    except (TypeError, ValueError):
+        raise ValueError(
+            'interval must be a number of minutes, but was {interval}'.format(
+                interval=interval,
+            )
+        )
+    for threshold in ('low_warning_threshold', 'low_critical_threshold',
+                      'high_warning_threshold', 'high_critical_threshold'):
+        value = request_data.get(threshold, '')
+        try:
+            if value != '':
+                float(value)
+        except (TypeError, ValueError):
+            raise ValueError(
+                '{threshold} must be a number or empty, but was '
+                '{value}'.format(threshold=threshold, value=value)
+            )
+    get_evaluation_parameters(request_data.get('evaluation', 'active'),
+                              interval)
+    if request_data.get('window'):
+        validate_window(
+            request_data['window'],
+            request_data.get('window_approach', 'arithmetic_mean'),
+            request_data.get('window_samples', 60),
         )
-        os.unlink(reaction_conf_path)
 
-        logger.debug('Removing reaction target path')
-        reaction_target_path = get_meta_group_reaction_target_path(
-            group_type,
+
+def apply_meta_group_creation(logger, tenant, group_type,
+                              group_instance_prefix, request_data):
+    try:
+        logger.debug('Attempting to add configuration')
+        create_meta_group(
+            logger,
             group_instance_prefix,
+            group_type,
             tenant,
+            request_data['approach'],
+            request_data['unknown'],
+            request_data.get('interval', 1),
+            request_data.get('low_warning_threshold', ""),
+            request_data.get('low_critical_threshold', ""),
+            request_data.get('high_warning_threshold', ""),
+            request_data.get('high_critical_threshold', ""),
+            request_data['target'],
+            request_data.get('low_reaction'),
+            request_data.get('high_reaction'),
+            request_data.get('window', 0),
+            request_data.get('window_approach', 'arithmetic_mean'),
+            request_data.get('window_samples', 60),
+            request_data.get('evaluation', 'active'),
         )
-        os.unlink(reaction_target_path)
-
-        return '{group_prefix} of {group_type} for {tenant} deleted\n'.format(
-            group_prefix=group_instance_prefix,
-            group_type=group_type,
-            tenant=tenant,
+        return 'Meta group {name} created\n'.format(
+            name=group_instance_prefix
+        )
+    except Exception as err:
+        message = (
+            'Failed to apply configuration with error {err_type}: '
+            '{err_msg}'.format(
+                err_type=str(type(err)),
+                err_msg=str(err),
+            )
+        )
+        logger.error(message)
+        return (
+            message,
+            500
         )
 
 
+def apply_meta_group_deletion(logger, tenant, group_type,
+                              group_instance_prefix):
+    logger.debug('Removing group configuration')
+    conf_path = get_meta_group_configuration_destination(
+        group_type,
+        group_instance_prefix,
+        tenant,
+    )
+    remove_configuration_file(
+        logger,
+        conf_path,
+    )
+
+    logger.debug('Removing reaction configuration path')
+    reaction_conf_path = get_meta_group_reaction_configuration_path(
+        group_type,
+        group_instance_prefix,
+        tenant,
+    )
+    os.unlink(reaction_conf_path)
+
+    logger.debug('Removing reaction target path')
+    reaction_target_path = get_meta_group_reaction_target_path(
+        group_type,
+        group_instance_prefix,
+        tenant,
+    )
+    os.unlink(reaction_target_path)
+
+    logger.debug('Removing any result history')
+    rate_store.purge(HISTORY_META_GROUP_PATH.format(
+        tenant=tenant,
+        group_type=group_type,
+        prefix=group_instance_prefix,
+    ))
+
+    return '{group_prefix} of {group_type} for {tenant} deleted\n'.format(
+        group_prefix=group_instance_prefix,
+        group_type=group_type,
+        tenant=tenant,
+    )
+
+
 @application.route("/targets/<tenant>/<deployment>/<instance_id>",
                    methods=['PUT', 'DELETE'])
 def targets(tenant, deployment, instance_id):
@@ -357,358 +663,395 @@ def targets(tenant, deployment, instance_id):
         logger.info('Creating instance')
         request_data = check_request_json(logger, request,
                                           REQUIRED_TARGET_CREATE_ARGS)
+        if isinstance(request_data, tuple):
+            return request_data
 
-        logger.debug('Checking target type {name} exists'.format(
-            name=request_data['target_type'],
-        ))
-        target_types = nagios_utils.get_types('target', logger)
-        logger.debug('Found target types: {target_types}'.format(
-            target_types=', '.join(target_types),
-        ))
-        if request_data['target_type'] not in target_types:
+        target_type = request_data['target_type']
+        logger.debug('Checking target type %s exists', target_type)
+        if not nagios_utils.type_exists('target', target_type, logger):
             message = (
                 'Target type {target_type} was not valid. '
                 'Target will not be created. '
                 'Available target types are: {target_types}'.format(
-                    target_type=request_data['target_type'],
-                    target_types=', '.join(target_types),
+                    target_type=target_type,
+                    target_types=', '.join(
+                        nagios_utils.get_types('target', logger)
+                    ),
                 )
             )
             logger.error(message)
             return (message, 400)
 
+        # The groups are only applied once nagios has loaded the target, so
+        # are checked now
+        groups = request_data.get('groups', [])
         try:
-            logger.debug('Attempting to add configuration')
-            create_target(
-                logger,
-                instance_id,
-                request_data['instance_ip'],
-                tenant,
-                deployment,
-                request_data['target_type'],
-            )
-        except Exception as err:
-            message = (
-                'Failed to apply configuration with error {err_type}: '
-                '{err_msg}'.format(
-                    err_type=str(type(err)),
-                    err_msg=str(err),
-                )
-            )
-            logger.error(message)
-            return (
-                message,
-                500
-            )
-        logger.info(
-            'Created {instance_id} in deployment {deployment} on '
+            check_group_pairs(groups, 'Groups')
+            check_group_memberships([
+                (deployment, get_node_id(instance_id), group_type, group_name)
+                for group_type, group_name in groups
+            ])
+        except ValueError as err:
+            logger.error(str(err))
+            return (str(err) + '\n', 400)
+
+        return apply_change(
+            'Create target {instance_id} in deployment {deployment} on '
             'tenant {tenant}'.format(
-                method=request.method,
                 instance_id=instance_id,
                 deployment=deployment,
                 tenant=tenant,
+            ),
+            partial(apply_target_creation, logger, tenant, deployment,
+                    instance_id, request_data),
+            # The trap checks and groups can only be set up once nagios
+            # has loaded the new target
+            partial(finish_target_creation, logger, tenant, deployment,
+                    instance_id, request_data),
+        )
+    elif request.method == 'DELETE':
+        return apply_change(
+            'Delete target {instance_id} from deployment {deployment} on '
+            'tenant {tenant}'.format(
+                instance_id=instance_id,
+                deployment=deployment,
+                tenant=tenant,
+            ),
+            partial(apply_target_deletion, logger, tenant, deployment,
+                    instance_id),
+        )
+
+
+def apply_target_creation(logger, tenant, deployment, instance_id,
+                          request_data):
+    try:
+        logger.debug('Attempting to add configuration')
+        create_target(
+            logger,
+            instance_id,
+            request_data['instance_ip'],
+            tenant,
+            deployment,
+            request_data['target_type'],
+        )
+    except Exception as err:
+        message = (
+            'Failed to apply configuration with error {err_type}: '
+            '{err_msg}'.format(
+                err_type=str(type(err)),
+                err_msg=str(err),
             )
         )
+        logger.error(message)
+        return (
+            message,
+            500
+        )
+    logger.info(
+        'Created {instance_id} in deployment {deployment} on '
+        'tenant {tenant}'.format(
+            instance_id=instance_id,
+            deployment=deployment,
+            tenant=tenant,
+        )
+    )
+    return 'Configuration for {instance} applied\n'.format(
+        instance=instance_id,
+    )
+
+
+def finish_target_creation(logger, tenant, deployment, instance_id,
+                           request_data):
+    logger.debug('Waiting for nagios to load %s', instance_id)
+    if nagios_utils.wait_for_host_configuration(instance_id,
+                                                TARGET_LOAD_TIMEOUT):
         logger.debug('Setting state of trap checks to OK')
-        check = 0
-        max_attempts = 15
-        while check < max_attempts:
-            nagios_status_dict = nagios_utils.get_nagios_status()
-            logger.debug(
-                'Current status dict loaded, checking services for host'
+        commands = [
+            nagios_utils.get_passive_check_result_command(
+                host=instance_id,
+                service=service['service_description'],
+                status='0',
+                output='No traps received',
+            )
+            for service in nagios_utils.get_configured_services_for_host(
+                instance_id,
+            )
+            if service['service_description'].split(':', 1)[1].startswith(
+                'SNMPTRAP '
             )
+        ]
+        logger.debug('Submitting %s OK passive check results', len(commands))
+        nagios_utils.send_nagios_commands(commands)
+    else:
+        logger.warn(
+            'Nagios did not load %s within %s seconds, so its trap checks '
+            'will be pending until a trap is received',
+            instance_id, TARGET_LOAD_TIMEOUT,
+        )
 
-            try:
-                nagios_utils.get_target_type_for_instance(instance_id)
-                break
-            except TypeError:
-                logger.debug('Instance not defined yet, retrying...')
-                check += 1
-                time.sleep(1)
-                continue
+    if 'groups' in request_data:
+        logger.debug('Applying groups')
+        node = get_node_id(instance_id)
+        update_node_group_memberships(
+            logger,
+            tenant,
+            added=[
+                (deployment, node, group_type, group_name)
+                for group_type, group_name in request_data['groups']
+            ],
+        )
 
-        services = nagios_utils.get_services_for_host(instance_id,
-                                                      nagios_status_dict)
+    return '{instance} target created\n'.format(instance=instance_id)
 
-        if services:
-            logger.debug('Services found, looking for SNMPTRAP checks')
-            for service in services:
-                logger.debug('Checking service {name}'.format(
-                    name=service['service_description'],
-                ))
-                if service['service_description'].split(':', 1)[1].startswith(
-                    'SNMPTRAP '
-                ):
-                    logger.debug('Submitting OK passive check result')
-                    nagios_utils.submit_passive_check_result(
-                        host=instance_id,
-                        service=service['service_description'],
-                        status='0',
-                        output='No traps received'
-                    )
-        else:
-            logger.debug('Instance has no services')
-
-        if 'groups' in request_data:
-            logger.debug('Applying groups')
-            # TODO: More error checking and helpful feedback (earlier in call)
-            groups = request_data['groups']
-            for group_type, group_name in groups:
-                associate_node_with_group_instance(
-                    logger,
-                    tenant,
-                    deployment,
-                    get_node_id(instance_id),
-                    group_type,
-                    group_name,
-                )
 
-        return '{instance} target created\n'.format(instance=instance_id)
-    elif request.method == 'DELETE':
-        logger.info('Attempting to delete instance {instance_id}'.format(
-            instance_id=instance_id,
-        ))
-        target_path = get_target_configuration_destination(instance_id)
+def apply_target_deletion(logger, tenant, deployment, instance_id):
+    logger.info('Attempting to delete instance {instance_id}'.format(
+        instance_id=instance_id,
+    ))
+    target_path = get_target_configuration_destination(instance_id)
 
-        # Determine this before we delete the configuration
-        rate_instance_path = RATE_INSTANCE_BASE_PATH.format(
-            instance=nagios_utils.get_host_address(instance_id, logger),
-        )
+    # Determine this before we delete the configuration
+    rate_instance_path = RATE_INSTANCE_BASE_PATH.format(
+        instance=nagios_utils.get_host_address(instance_id, logger),
+    )
 
-        try:
-            logger.debug('Attempting to remove instance from {path}'.format(
-                path=target_path,
-            ))
-            remove_configuration_file(
-                logger,
-                target_path,
-                reload_service=False,
-            )
-        except CalledProcessError as err:
-            # Perform this check afterwards to avoid race conditions while
-            # providing some more accurate feedback
-            if not os.path.exists(target_path):
-                logger.warn(
-                    'Could not remove instance, as it did not exist'
-                )
-                return (
-                    'Target {name} does not exist.'.format(name=instance_id),
-                    404
-                )
-            else:
-                message = 'Failed to remove {name}. Error was: {err}'.format(
-                    name=instance_id,
-                    err=str(err),
-                )
-                logger.error(message)
-                return (
-                    message,
-                    500
-                )
-        logger.debug('Removing any rate data from {path}'.format(
-            path=rate_instance_path,
+    try:
+        logger.debug('Attempting to remove instance from {path}'.format(
+            path=target_path,
         ))
-        run(['rm', '-rf', rate_instance_path])
+        remove_configuration_file(
+            logger,
+            target_path,
+            reload_service=False,
+        )
+    except CalledProcessError as err:
+        # Perform this check afterwards to avoid race conditions while
+        # providing some more accurate feedback
+        if not os.path.exists(target_path):
+            logger.warn(
+                'Could not remove instance, as it did not exist'
+            )
+            return (
+                'Target {name} does not exist.'.format(name=instance_id),
+                404
+            )
+        else:
+            message = 'Failed to remove {name}. Error was: {err}'.format(
+                name=instance_id,
+                err=str(err),
+            )
+            logger.error(message)
+            return (
+                message,
+                500
+            )
+    logger.debug('Removing any rate data from {path}'.format(
+        path=rate_instance_path,
+    ))
+    rate_store.purge(rate_instance_path)
+    # Remove any data that was never migrated to the rate store
+    run(['rm', '-rf', rate_instance_path])
 
-        logger.debug('Determining related node and hostgroup names')
-        this_node = get_node_id(instance_id)
-        this_deployment_hostgroup = TENANT_DEPLOYMENT_HOSTGROUP.format(
-            tenant=tenant,
+    logger.debug('Determining related node and hostgroup names')
+    this_node = get_node_id(instance_id)
+    this_deployment_hostgroup = TENANT_DEPLOYMENT_HOSTGROUP.format(
+        tenant=tenant,
+        deployment=deployment,
+    )
+    this_tenant_hostgroup = 'tenant:{tenant}'.format(tenant=tenant)
+    tenant_target_type_prefix = 'tenant:{tenant}/target_type:'.format(
+        tenant=tenant,
+    )
+
+    logger.debug(
+        'Checking for remaining instances with same node as '
+        '{instance} in deployment {deployment} for tenant '
+        '{tenant}'.format(
+            instance=instance_id,
             deployment=deployment,
-        )
-        this_tenant_hostgroup = 'tenant:{tenant}'.format(tenant=tenant)
-        tenant_target_type_prefix = 'tenant:{tenant}/target_type:'.format(
             tenant=tenant,
-        )
-
+        ),
+    )
+    this_node_instances_found = False
+    targets_dir = os.path.join(BASE_OBJECTS_DIR, 'targets')
+    logger.debug('Looking for instances in {path}'.format(
+        path=targets_dir,
+    ))
+    for instance in os.listdir(targets_dir):
         logger.debug(
-            'Checking for remaining instances with same node as '
-            '{instance} in deployment {deployment} for tenant '
-            '{tenant}'.format(
-                instance=instance_id,
-                deployment=deployment,
-                tenant=tenant,
-            ),
+            'Checking whether {instance} config file is part of node for '
+            'deleted instance {deleted_instance}'.format(
+                instance=instance,
+                deleted_instance=instance_id,
+            )
         )
-        this_node_instances_found = False
-        targets_dir = os.path.join(BASE_OBJECTS_DIR, 'targets')
-        logger.debug('Looking for instances in {path}'.format(
-            path=targets_dir,
+        if not instance.endswith('.cfg'):
+            logger.debug('{conf} is not nagios config, ignoring'.format(
+                conf=instance,
+            ))
+            # Not nagios configuration, ignore it.
+            continue
+        instance_name = instance[:-4]
+        logger.debug('Instance name for config file is {name}'.format(
+            name=instance_name,
         ))
-        for instance in os.listdir(targets_dir):
+        if get_node_id(instance_name) == this_node:
             logger.debug(
-                'Checking whether {instance} config file is part of node for '
-                'deleted instance {deleted_instance}'.format(
-                    instance=instance,
-                    deleted_instance=instance_id,
+                'Instance {name} has same node ID as deleted instance '
+                '{deleted}'.format(
+                    name=instance_name,
+                    deleted=instance_id,
                 )
             )
-            if not instance.endswith('.cfg'):
-                logger.debug('{conf} is not nagios config, ignoring'.format(
-                    conf=instance,
+            # This instance belongs to a node with the same name
+            # Check whether it also belongs to the same deployment
+            try:
+                logger.debug('Attempting to read config {name}'.format(
+                    name=instance,
                 ))
-                # Not nagios configuration, ignore it.
-                continue
-            instance_name = instance[:-4]
-            logger.debug('Instance name for config file is {name}'.format(
-                name=instance_name,
-            ))
-            if get_node_id(instance_name) == this_node:
-                logger.debug(
-                    'Instance {name} has same node ID as deleted instance '
-                    '{deleted}'.format(
-                        name=instance_name,
-                        deleted=instance_id,
-                    )
-                )
-                # This instance belongs to a node with the same name
-                # Check whether it also belongs to the same deployment
-                try:
-                    logger.debug('Attempting to read config {name}'.format(
+                with open(
+                    os.path.join(targets_dir, instance)
+                ) as inst_handle:
+                    instance_config = inst_handle.read()
+            except IOError:
+                # Most likely this file was deleted, e.g. by a workflow
+                # deleting all node instances of the same deployment
+                # Ignore this file
+                logger.warn(
+                    'File {name} was unreadable. Treating file as '
+                    'deleted by a concurrent workflow'.format(
                         name=instance,
-                    ))
-                    with open(
-                        os.path.join(targets_dir, instance)
-                    ) as inst_handle:
-                        instance_config = inst_handle.read()
-                except IOError:
-                    # Most likely this file was deleted, e.g. by a workflow
-                    # deleting all node instances of the same deployment
-                    # Ignore this file
-                    logger.warn(
-                        'File {name} was unreadable. Treating file as '
-                        'deleted by a concurrent workflow'.format(
-                            name=instance,
-                        )
                     )
-                    continue
-                if this_deployment_hostgroup in instance_config:
-                    this_node_instances_found = True
-                    logger.debug('Instances still exist for node')
-                    break
-
-        if not this_node_instances_found:
-            logger.info(
-                'No instances remaining, removing node for {instance} '
-                'in deployment {deployment} on tenant {tenant}'.format(
-                    instance=instance_id,
-                    deployment=deployment,
-                    tenant=tenant,
-                )
-            )
-            path = get_node_configuration_destination(
-                tenant,
-                deployment,
-                this_node,
-            )
-            logger.debug(
-                'Removing instanceless node configuration from {path}'.format(
-                    path=path,
                 )
+                continue
+            if this_deployment_hostgroup in instance_config:
+                this_node_instances_found = True
+                logger.debug('Instances still exist for node')
+                break
+
+    if not this_node_instances_found:
+        logger.info(
+            'No instances remaining, removing node for {instance} '
+            'in deployment {deployment} on tenant {tenant}'.format(
+                instance=instance_id,
+                deployment=deployment,
+                tenant=tenant,
             )
-            remove_configuration_file(
-                logger,
-                path,
-                reload_service=False,
-                # Don't cause failures on deployment uninstall
-                ignore_missing=True,
-            )
-            logger.debug('Removed node configuration from {path}'.format(
+        )
+        path = get_node_configuration_destination(
+            tenant,
+            deployment,
+            this_node,
+        )
+        logger.debug(
+            'Removing instanceless node configuration from {path}'.format(
                 path=path,
-            ))
-
-            rate_node_path = RATE_NODE_BASE_PATH.format(
-                node=this_node.replace('/', '_'),
             )
-            logger.debug('Removing any rate data from {path}'.format(
-                path=rate_node_path,
-            ))
-            run(['rm', '-rf', rate_node_path])
-
-        nagios_utils.load_nagios_configuration()
-        logger.info('Removing related empty hostgroups')
-        for hostgroup in nagios_utils.NAGIOS_CONFIGURATION.get('hostgroup',
-                                                               []):
-            name = hostgroup['hostgroup_name']
-            members = hostgroup.get('members')
-
-            logger.debug('Group {group} has members: {members}'.format(
-                group=name,
-                members=members,
-            ))
-            if not members:
-                remove_target = None
-                if name == this_deployment_hostgroup:
-                    logger.debug(
-                        'Removing empty deployment hostgroup {group}'.format(
-                            group=name,
-                        ),
-                    )
-                    remove_target = \
-                        get_tenant_deployment_configuration_destination(
-                            tenant=tenant,
-                            deployment=deployment,
-                        )
-                elif name == this_tenant_hostgroup:
-                    logger.debug(
-                        'Removing empty tenant hostgroup {group}'.format(
-                            group=name,
-                        )
-                    )
-                    remove_target = \
-                        get_tenant_configuration_destination(
-                            tenant=tenant,
-                        )
-                elif name.startswith(tenant_target_type_prefix):
-                    logger.debug(
-                        'Removing empty tenant target type hostgroup '
-                        '{group}'.format(group=name),
+        )
+        remove_configuration_file(
+            logger,
+            path,
+            reload_service=False,
+            # Don't cause failures on deployment uninstall
+            ignore_missing=True,
+        )
+        logger.debug('Removed node configuration from {path}'.format(
+            path=path,
+        ))
+
+        rate_node_path = RATE_NODE_BASE_PATH.format(
+            node=this_node.replace('/', '_'),
+        )
+        logger.debug('Removing any rate data from {path}'.format(
+            path=rate_node_path,
+        ))
+        rate_store.purge(rate_node_path)
+        # Remove any data that was never migrated to the rate store
+        run(['rm', '-rf', rate_node_path])
+
+    nagios_utils.load_nagios_configuration()
+    logger.info('Removing related empty hostgroups')
+    for hostgroup in nagios_utils.NAGIOS_CONFIGURATION.get('hostgroup',
+                                                           []):
+        name = hostgroup['hostgroup_name']
+        members = hostgroup.get('members')
+
+        logger.debug('Group {group} has members: {members}'.format(
+            group=name,
+            members=members,
+        ))
+        if not members:
+            remove_target = None
+            if name == this_deployment_hostgroup:
+                logger.debug(
+                    'Removing empty deployment hostgroup {group}'.format(
+                        group=name,
+                    ),
+                )
+                remove_target = \
+                    get_tenant_deployment_configuration_destination(
+                        tenant=tenant,
+                        deployment=deployment,
                     )
-                    # This will cover more than just this instance's
-                    # target type, but should only take effect if the
-                    # hostgroup is empty so this shouldn't cause problems.
-                    target_type = name.split('target_type:')[1]
-                    remove_target = \
-                        get_tenant_target_type_configuration_destination(
-                            tenant=tenant,
-                            target_type=target_type,
-                        )
-                else:
-                    # This isn't a host group we care about, ignore it
-                    logger.debug(
-                        'Host group {group} is not a candidate for '
-                        'cleanup'.format(group=name),
+            elif name == this_tenant_hostgroup:
+                logger.debug(
+                    'Removing empty tenant hostgroup {group}'.format(
+                        group=name,
                     )
-                    remove_target = None
-
-                if remove_target:
-                    logger.debug(
-                        'Group {group} to be removed has path: {path}'.format(
-                            group=name,
-                            path=remove_target,
-                        )
+                )
+                remove_target = \
+                    get_tenant_configuration_destination(
+                        tenant=tenant,
                     )
-                    remove_configuration_file(
-                        logger,
-                        remove_target,
-                        reload_service=False,
-                        # Don't cause failures on deployment uninstall
-                        ignore_missing=True,
+            elif name.startswith(tenant_target_type_prefix):
+                logger.debug(
+                    'Removing empty tenant target type hostgroup '
+                    '{group}'.format(group=name),
+                )
+                # This will cover more than just this instance's
+                # target type, but should only take effect if the
+                # hostgroup is empty so this shouldn't cause problems.
+                target_type = name.split('target_type:')[1]
+                remove_target = \
+                    get_tenant_target_type_configuration_destination(
+                        tenant=tenant,
+                        target_type=target_type,
                     )
-                    logger.info('Removed empty hostgroup {group}'.format(
+            else:
+                # This isn't a host group we care about, ignore it
+                logger.debug(
+                    'Host group {group} is not a candidate for '
+                    'cleanup'.format(group=name),
+                )
+                remove_target = None
+
+            if remove_target:
+                logger.debug(
+                    'Group {group} to be removed has path: {path}'.format(
                         group=name,
-                    ))
+                        path=remove_target,
+                    )
+                )
+                remove_configuration_file(
+                    logger,
+                    remove_target,
+                    reload_service=False,
+                    # Don't cause failures on deployment uninstall
+                    ignore_missing=True,
+                )
+                logger.info('Removed empty hostgroup {group}'.format(
+                    group=name,
+                ))
 
-        logger.debug('Triggering nagios reload')
-        trigger_nagios_reload(set_group=False)
+    logger.debug('Triggering nagios reload')
+    trigger_nagios_reload(set_group=False)
 
-        logger.info(
-            'Deleted {instance_id} from deployment {deployment} on '
-            'tenant {tenant}'.format(
-                method=request.method,
-                instance_id=instance_id,
-                deployment=deployment,
-                tenant=tenant,
-            )
+    logger.info(
+        'Deleted {instance_id} from deployment {deployment} on '
+        'tenant {tenant}'.format(
+            instance_id=instance_id,
+            deployment=deployment,
+            tenant=tenant,
         )
-        return '{instance} deleted\n'.format(instance=instance_id)
+    )
+    return '{instance} deleted\n'.format(instance=instance_id)
@@ -1,18 +1,26 @@
+import errno
 import hashlib
 import json
 import os
 
+from aggregation import validate_window
 from constants import (
     BASE_OBJECTS_DIR,
+    OBJECT_DIR_PERMISSIONS,
 )
+import group_index
 from utils import (
     deploy_configuration_file,
     deploy_file,
+    get_evaluation_parameters,
     make_config_subdir,
     run,
+    trigger_nagios_reload,
 )
 from nagiosrest_tenant import configure_tenant_group
 
+# The parts of a (deployment, node, group type, group name) membership
+MEMBERSHIP_PARTS = ('deployment', 'node', 'group type', 'group name')
 
 def get_group_config_location(group_type):
     return os.path.join(
@@ -114,6 +122,21 @@ def get_group_members_path(group_type,
     )
 
 
+def get_group_children_path(group_type,
+                            group_name,
+                            tenant):
+    return os.path.join(
+        BASE_OBJECTS_DIR,
+        (
+            'groups/children/{tenant}/{group_type}/{group_name}'
+        ).format(
+            tenant=tenant,
+            group_type=group_type,
+            group_name=group_name,
+        )
+    )
+
+
 def get_group_deployment_node_path(tenant, deployment,
                                    group_type, group_name):
     return os.path.join(
@@ -139,7 +162,11 @@ def create_meta_group(logger,
                       high_critical_threshold,
                       reaction_target,
                       low_reaction,
-                      high_reaction):
+                      high_reaction,
+                      window=0,
+                      window_approach='arithmetic_mean',
+                      window_samples=60,
+                      evaluation='active'):
     logger.info(
         'Creating meta group for prefix {prefix} '
         'for group {group_type}'.format(
@@ -210,7 +237,20 @@ def create_meta_group(logger,
         'high_warning_threshold': high_warning_threshold,
         'high_critical_threshold': high_critical_threshold,
         'check_interval': check_interval,
+        'extra_arguments': '',
     }
+    check_config.update(get_evaluation_parameters(evaluation, check_interval))
+    if window:
+        window, window_samples = validate_window(window, window_approach,
+                                                 window_samples)
+        check_config['extra_arguments'] = (
+            '--window={window} --window-approach={approach} '
+            '--window-samples={samples}'.format(
+                window=window,
+                approach=window_approach,
+                samples=window_samples,
+            )
+        )
     logger.debug(
         'Full check configuration: {conf}'.format(conf=str(check_config))
     )
@@ -254,9 +294,11 @@ def create_group_instance(logger,
         destination=reaction_target_path,
         sudo=False,
     )
+    group_index.add_group(tenant, group_type, group_name)
 
+    # Nagios is only reloaded if any of the configuration changed
     logger.info('Creating supporting hostgroups')
-    configure_tenant_group(logger, tenant)
+    changed = configure_tenant_group(logger, tenant)
 
     logger.debug('Deploying group tenant configuration')
     group_config_destination = get_group_host_configuration_destination(
@@ -271,7 +313,7 @@ def create_group_instance(logger,
             )
         )
     )
-    deploy_configuration_file(
+    changed |= deploy_configuration_file(
         logger,
         source='group.template',
         destination=group_config_destination,
@@ -305,20 +347,177 @@ def create_group_instance(logger,
     logger.debug(
         'Full check configuration: {conf}'.format(conf=str(check_config))
     )
-    deploy_configuration_file(
+    changed |= deploy_configuration_file(
         logger,
         source='group_check.template',
         destination=instance_config_destination,
         template_params=check_config,
-        reload_service=True,
+        reload_service=False,
         use_pkg_data=False,
     )
 
+    if changed:
+        trigger_nagios_reload()
+    else:
+        logger.info('Configuration for {name} is unchanged'.format(
+            name=group_name,
+        ))
+
 
 def associate_node_with_group_instance(logger, tenant, deployment, node,
                                        group_type, group_name):
     # TODO: This should check the group type exists
-    path = get_group_deployment_node_path(tenant, deployment,
-                                          group_type, group_name)
+    update_node_group_memberships(
+        logger, tenant,
+        added=[(deployment, node, group_type, group_name)],
+    )
+
+
+def update_node_group_memberships(logger, tenant, added=(), removed=()):
+    """Add and remove the memberships of many nodes in group instances.
+    added and removed are (deployment, node, group type, group name)
+    tuples.
+    """
+    # Checked before anything is written so that a bad membership does not
+    # leave the others partly applied
+    check_group_memberships(added)
+    check_group_memberships(removed)
+    # The member listings are written here rather than with mkdir, chmod
+    # and touch for each node, and each group type's index is rewritten
+    # once for all of its changes
+    index_changes = {}
+    made_dirs = set()
+    for deployment, node, group_type, group_name in added:
+        path = get_group_deployment_node_path(tenant, deployment,
+                                              group_type, group_name)
+        if path not in made_dirs:
+            _make_members_dir(path)
+            made_dirs.add(path)
+        open(os.path.join(path, node), 'a').close()
+        index_changes.setdefault(group_type, ([], []))[0].append(
+            (group_name, deployment, node),
+        )
+    for deployment, node, group_type, group_name in removed:
+        path = get_group_deployment_node_path(tenant, deployment,
+                                              group_type, group_name)
+        try:
+            os.unlink(os.path.join(path, node))
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                raise
+        index_changes.setdefault(group_type, ([], []))[1].append(
+            (group_name, deployment, node),
+        )
+
+    for group_type, (group_added, group_removed) in index_changes.items():
+        logger.debug(
+            'Updating {group_type} index with {added} added and {removed} '
+            'removed members'.format(
+                group_type=group_type,
+                added=len(group_added),
+                removed=len(group_removed),
+            )
+        )
+        group_index.update_group_members(tenant, group_type,
+                                         group_added, group_removed)
+
+
+def _make_members_dir(path):
+    try:
+        os.makedirs(path)
+    except OSError as err:
+        if err.errno != errno.EEXIST:
+            raise
+    os.chmod(path, int(OBJECT_DIR_PERMISSIONS, 8))
+
+
+def check_group_memberships(memberships):
+    # Each part of a membership is used as a directory or file name under
+    # the group members directory, so must not be able to point elsewhere
+    for membership in memberships:
+        for part, value in zip(MEMBERSHIP_PARTS, membership):
+            if (
+                not isinstance(value, basestring)
+                or value in ('', '.', '..') or '/' in value
+            ):
+                raise ValueError(
+                    'Group membership {part} must be a non-empty string '
+                    'without / which is not . or .., but was: '
+                    '{value}'.format(part=part, value=json.dumps(value))
+                )
+
+
+def check_group_pairs(groups, description):
+    if not isinstance(groups, list) or not all(
+        isinstance(group, list) and len(group) == 2
+        and all(isinstance(part, basestring) for part in group)
+        for group in groups
+    ):
+        raise ValueError(
+            '{description} must be a list of [group type, group name] '
+            'lists, but were: {groups}'.format(
+                description=description,
+                groups=json.dumps(groups),
+            )
+        )
+
+
+def check_group_parents(tenant, group_type, group_name, parents):
+    check_group_pairs(parents, 'Parents')
+    for parent_type, parent_name in parents:
+        if parent_name not in group_index.get_group_names(
+            tenant, parent_type, parent_name,
+        ):
+            raise ValueError(
+                'Parent group instance {name} of {group_type} does not '
+                'exist.'.format(
+                    name=parent_name,
+                    group_type=parent_type,
+                )
+            )
+        if group_index.is_group_descendant(tenant, parent_type, parent_name,
+                                           group_type, group_name):
+            raise ValueError(
+                'Group instance {name} of {group_type} cannot be a child of '
+                'its descendant {parent} of {parent_type}.'.format(
+                    name=group_name,
+                    group_type=group_type,
+                    parent=parent_name,
+                    parent_type=parent_type,
+                )
+            )
+
+
+def associate_group_with_parent(logger, tenant, group_type, group_name,
+                                parent_type, parent_name):
+    logger.debug(
+        'Adding {name} of {group_type} to {parent} of {parent_type}'.format(
+            name=group_name,
+            group_type=group_type,
+            parent=parent_name,
+            parent_type=parent_type,
+        )
+    )
+    path = os.path.join(
+        get_group_children_path(parent_type, parent_name, tenant),
+        group_type,
+    )
     make_config_subdir(path)
-    run(['touch', os.path.join(path, node)])
+    run(['touch', os.path.join(path, group_name)])
+    group_index.add_group_child(tenant, parent_type, parent_name,
+                                group_type, group_name)
+
+
+def remove_group_relations(tenant, group_type, group_name):
+    # Remove the group from its parents, and its own children listing
+    for parent_type, parent_name in group_index.get_group_parents(
+        tenant, group_type, group_name,
+    ):
+        run(['rm', '-f', os.path.join(
+            get_group_children_path(parent_type, parent_name, tenant),
+            group_type,
+            group_name,
+        )])
+    run(['rm', '-rf', get_group_children_path(group_type, group_name,
+                                              tenant)])
+    group_index.remove_group(tenant, group_type, group_name)
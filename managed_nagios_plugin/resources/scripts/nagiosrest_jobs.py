@@ -0,0 +1,252 @@
+import json
+import os
+import Queue
+import threading
+import time
+import uuid
+
+from constants import NAGIOSREST_JOBS_PATH
+import logging_utils
+import timing
+from utils import deferred_reloads
+
+# Changes requested asynchronously are queued and applied by a background
+# thread, in batches of whatever has been queued, with one nagios reload
+# for the whole batch rather than one (with its delay) for each change.
+# Changes which need nagios to have loaded them before they can be
+# finished (e.g. setting the state of a new target's checks) are finished
+# after that reload.
+# Job states are kept on disk so that they can be retrieved by any
+# nagiosrest worker, and are removed JOB_EXPIRY seconds after finishing.
+# The queue itself is only kept by the worker process which accepted the
+# jobs, so unfinished jobs of a worker which has exited (e.g. restarted by
+# gunicorn) will never be applied, and are reported as failed.
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+FINISHED_STATES = (SUCCEEDED, FAILED)
+MAX_BATCH_SIZE = 50
+JOB_EXPIRY = 3600
+POLL_INTERVAL = 0.5
+
+# Held while changes are applied, so that synchronous requests handled by
+# this process do not interleave with a batch
+APPLY_LOCK = threading.Lock()
+
+
+def process_running(pid):
+    return pid is not None and os.path.exists(
+        '/proc/{pid}'.format(pid=pid),
+    )
+
+
+def get_result_status(result):
+    # Results are as returned by flask views, i.e. a message or a tuple of
+    # a message and a status code
+    if isinstance(result, tuple):
+        return result[0], result[1]
+    return result, 200
+
+
+class Job(object):
+    def __init__(self, description, apply, finish=None):
+        self.id = str(uuid.uuid4())
+        self.pid = os.getpid()
+        self.description = description
+        self.apply = apply
+        self.finish = finish
+        self.state = QUEUED
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.status_code = None
+        self.message = None
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'pid': self.pid,
+            'description': self.description,
+            'state': self.state,
+            'submitted': self.submitted,
+            'started': self.started,
+            'finished': self.finished,
+            'status_code': self.status_code,
+            'message': self.message,
+        }
+
+
+class JobQueue(object):
+    def __init__(self, jobs_path=NAGIOSREST_JOBS_PATH,
+                 max_batch_size=MAX_BATCH_SIZE):
+        self.jobs_path = jobs_path
+        self.max_batch_size = max_batch_size
+        self._queue = Queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def run_now(self, apply, finish=None):
+        """Apply a change in this request, as without the queue."""
+        with APPLY_LOCK:
+            result = apply()
+            if finish and get_result_status(result)[1] < 400:
+                result = finish()
+        return result
+
+    def submit(self, description, apply, finish=None):
+        job = Job(description, apply, finish)
+        self._save(job)
+        self._queue.put(job)
+        self._start_worker()
+        self._expire_jobs()
+        return job.id
+
+    def get(self, job_id, wait=0):
+        """Get the state of a job, waiting up to wait seconds for it to
+        finish. Returns None if the job is not known.
+        """
+        deadline = time.time() + wait
+        while True:
+            job = self._load(job_id)
+            if job is not None:
+                job = self._fail_if_abandoned(job)
+            if job is None or job['state'] in FINISHED_STATES:
+                return job
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return job
+            time.sleep(min(POLL_INTERVAL, remaining))
+
+    def run_batch(self, block=True):
+        """Apply the next batch of jobs, returning the number applied."""
+        try:
+            batch = [self._queue.get(block=block)]
+        except Queue.Empty:
+            return 0
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except Queue.Empty:
+                break
+
+        logger = logging_utils.Logger('nagiosrest')
+        logger.info('Applying batch of %s changes', len(batch))
+        with APPLY_LOCK:
+            with deferred_reloads():
+                for job in batch:
+                    job.state = RUNNING
+                    job.started = time.time()
+                    self._save(job)
+                    self._run_step(logger, job, job.apply)
+            for job in batch:
+                if job.state == RUNNING and job.finish:
+                    self._run_step(logger, job, job.finish)
+        for job in batch:
+            if job.state == RUNNING:
+                job.state = SUCCEEDED
+            job.finished = time.time()
+            self._save(job)
+        timing.write_summary('nagiosrest')
+        return len(batch)
+
+    def _run_step(self, logger, job, step):
+        try:
+            message, status_code = get_result_status(step())
+        except Exception as err:
+            logger.exception('Job %s (%s) failed', job.id, job.description)
+            message = 'Failed with error {err_type}: {err_msg}'.format(
+                err_type=str(type(err)),
+                err_msg=str(err),
+            )
+            status_code = 500
+        job.message = message
+        job.status_code = status_code
+        if status_code >= 400:
+            job.state = FAILED
+
+    def _start_worker(self):
+        # Started when first needed rather than on import, as gunicorn
+        # imports the application before forking its workers
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._fail_abandoned_jobs()
+                self._worker = threading.Thread(target=self._work)
+                self._worker.daemon = True
+                self._worker.start()
+
+    def _work(self):
+        while True:
+            try:
+                self.run_batch()
+            except Exception:
+                # Keep applying later jobs, e.g. if the jobs dir is full
+                logging_utils.Logger('nagiosrest').exception(
+                    'Failed to apply batch of changes',
+                )
+
+    def _fail_abandoned_jobs(self):
+        for job_file in os.listdir(self.jobs_path):
+            if job_file.endswith('.json'):
+                job = self._load(job_file[:-len('.json')])
+                if job is not None:
+                    self._fail_if_abandoned(job)
+
+    def _fail_if_abandoned(self, job):
+        if (
+            job['state'] in FINISHED_STATES
+            or process_running(job.get('pid'))
+        ):
+            return job
+        logging_utils.Logger('nagiosrest').warn(
+            'Job %s (%s) was abandoned by worker %s',
+            job['id'], job['description'], job.get('pid'),
+        )
+        job.update({
+            'state': FAILED,
+            'finished': time.time(),
+            'status_code': 500,
+            'message': (
+                'The nagiosrest worker which accepted this job exited '
+                'before it was finished, so the change may not have been '
+                'applied. Please retry it.\n'
+            ),
+        })
+        self._write(job)
+        return job
+
+    def _get_job_path(self, job_id):
+        return os.path.join(self.jobs_path, job_id + '.json')
+
+    def _save(self, job):
+        self._write(job.to_dict())
+
+    def _write(self, job):
+        path = self._get_job_path(job['id'])
+        temp_path = '{path}.{pid}.tmp'.format(path=path, pid=os.getpid())
+        with open(temp_path, 'w') as job_handle:
+            json.dump(job, job_handle)
+        os.rename(temp_path, path)
+
+    def _load(self, job_id):
+        try:
+            uuid.UUID(job_id)
+        except ValueError:
+            # Not a job ID, and not to be used in a path
+            return None
+        try:
+            with open(self._get_job_path(job_id)) as job_handle:
+                return json.load(job_handle)
+        except (IOError, ValueError):
+            return None
+
+    def _expire_jobs(self):
+        expired = time.time() - JOB_EXPIRY
+        for job_file in os.listdir(self.jobs_path):
+            path = os.path.join(self.jobs_path, job_file)
+            try:
+                if os.path.getmtime(path) < expired:
+                    os.unlink(path)
+            except OSError:
+                # Expired by another worker
+                pass
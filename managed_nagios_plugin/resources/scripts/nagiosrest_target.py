@@ -1,10 +1,11 @@
 import hashlib
 import os
 
+from nagios_utils import get_node_id
 from utils import (
     deploy_configuration_file,
-    get_node_id,
     make_config_subdir,
+    trigger_nagios_reload,
 )
 from nagiosrest_tenant import configure_tenant_group
 
@@ -41,7 +42,9 @@ def create_target(logger,
                   instance_id, instance_ip,
                   tenant, deployment,
                   target_type):
-    configure_tenant_group(logger, tenant)
+    # Nagios is only reloaded if any of the configuration changed, so that
+    # repeating the creation of an existing target is cheap
+    changed = configure_tenant_group(logger, tenant)
     supporting_hostgroups = [
         {
             'params': {
@@ -76,7 +79,7 @@ def create_target(logger,
 
         make_config_subdir(os.path.dirname(hostgroup_destination))
 
-        deploy_configuration_file(
+        changed |= deploy_configuration_file(
             logger,
             source='hostgroup.template',
             destination=hostgroup_destination,
@@ -97,7 +100,7 @@ def create_target(logger,
     make_config_subdir(os.path.dirname(node_destination))
 
     # Deploy node pseudo host
-    deploy_configuration_file(
+    changed |= deploy_configuration_file(
         logger,
         source='node.template',
         destination=node_destination,
@@ -111,7 +114,7 @@ def create_target(logger,
         use_pkg_data=False,
     )
 
-    deploy_configuration_file(
+    changed |= deploy_configuration_file(
         logger,
         source='target.template',
         destination=get_target_configuration_destination(instance_id),
@@ -122,5 +125,13 @@ def create_target(logger,
             'tenant': tenant,
             'target_type': target_type,
         },
+        reload_service=False,
         use_pkg_data=False,
     )
+
+    if changed:
+        trigger_nagios_reload()
+    else:
+        logger.info('Configuration for {instance} is unchanged'.format(
+            instance=instance_id,
+        ))
@@ -18,7 +18,7 @@ def configure_tenant_group(logger, tenant):
     )
 
     make_config_subdir(os.path.dirname(destination))
-    deploy_configuration_file(
+    return deploy_configuration_file(
         logger,
         source='hostgroup.template',
         destination=destination,
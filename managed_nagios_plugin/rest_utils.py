@@ -1,15 +1,16 @@
 import json
+import threading
 import time
 
-import requests
-
 import nagios_utils as nagios
+import timing
 
 
 MANAGER_CREDS_PATH = '/etc/nagios/cloudify_manager.json'
 MANAGER_CONFIG_PATH = '/etc/nagios/notify_plugin.cfg'
 MANAGER_CERT_PATH = '/etc/nagios/notify_plugin.crt'
 EXECUTION_IN_PROGRESS_STATES = ['pending', 'started']
+ENTITY_PAGE_SIZE = 1000
 
 
 def get_manager_details(logger):
@@ -68,7 +69,7 @@ def run_workflow_for_instance(instance_id, workflow_id, parameters,
 
 
 def run_workflow(tenant, deployment, workflow_id, parameters,
-                 allow_custom_parameters, force, logger):
+                 allow_custom_parameters, force, logger, rate_limiter=None):
     logger.info(
         'Running workflow {workflow} on deployment {deployment} for tenant '
         '{tenant}'.format(
@@ -95,8 +96,9 @@ def run_workflow(tenant, deployment, workflow_id, parameters,
             tenant=tenant,
             request_data=request_data,
             request_parameters=None,
-            method=requests.post,
+            method='post',
             logger=logger,
+            rate_limiter=rate_limiter,
         )
     except ManagerRequestFailed as err:
         logger.error('Starting workflow failed: {error}'.format(
@@ -125,7 +127,7 @@ def get_execution(tenant, execution_id, logger):
             tenant=tenant,
             request_data=None,
             request_parameters=None,
-            method=requests.get,
+            method='get',
             logger=logger,
         )
     except ManagerRequestFailed as err:
@@ -180,7 +182,20 @@ def _get_all(entity):
 
 
 def get_entities(entity_type, tenant, properties, logger,
-                 include=_get_all):
+                 include=_get_all, rate_limiter=None, include_fields=None,
+                 filters=None):
+    return list(iter_entities(entity_type, tenant, properties, logger,
+                              include, rate_limiter, include_fields,
+                              filters))
+
+
+def iter_entities(entity_type, tenant, properties, logger,
+                  include=_get_all, rate_limiter=None, include_fields=None,
+                  filters=None):
+    # Entities are yielded a page at a time rather than gathered into one
+    # list. Only include_fields (or properties, if include_fields is not
+    # set) are requested from the manager; include_fields must contain any
+    # fields that the include function needs.
     logger.debug(
         'Getting entities of type {entity_type}'.format(
             entity_type=entity_type,
@@ -190,13 +205,18 @@ def get_entities(entity_type, tenant, properties, logger,
         logger.debug('Filtering for {properties}'.format(
             properties=', '.join(properties),
         ))
+    if include_fields is None:
+        include_fields = properties
 
-    results = []
     finished = False
     offset = 0
-    size = 1000
+    size = ENTITY_PAGE_SIZE
     while not finished:
         params = {'_offset': offset, '_size': size}
+        if include_fields:
+            params['_include'] = ','.join(include_fields)
+        if filters:
+            params.update(filters)
         logger.debug('Getting {size} results'.format(size=size))
         entities = make_request(
             path='/api/v3.1/{entity_type}'.format(
@@ -205,8 +225,9 @@ def get_entities(entity_type, tenant, properties, logger,
             tenant=tenant,
             request_data=None,
             request_parameters=params,
-            method=requests.get,
+            method='get',
             logger=logger,
+            rate_limiter=rate_limiter,
         ).get('items', [])
         logger.debug('Got {amount} results'.format(amount=len(entities)))
         if entities:
@@ -221,15 +242,15 @@ def get_entities(entity_type, tenant, properties, logger,
                     ]
                     for item in remove:
                         entity.pop(item)
-                results.append(entity)
+                yield entity
             offset += size
             logger.debug('Incrementing offset to {new_offset}'.format(
                 new_offset=offset,
             ))
-        else:
-            logger.debug('No more results, returning gathered entities')
+        if len(entities) < size:
+            # A short page means there are no more results
+            logger.debug('No more results')
             finished = True
-    return results
 
 
 def not_active_manager(result):
@@ -245,6 +266,28 @@ def not_active_manager(result):
         return False
 
 
+class RateLimiter(object):
+    # Spaces out requests so that no more than requests_per_second are made
+    # to the manager by all of the threads sharing this limiter
+    def __init__(self, requests_per_second):
+        if requests_per_second:
+            self.interval = 1.0 / requests_per_second
+        else:
+            self.interval = 0
+        self._next_request = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.time()
+            request_time = max(now, self._next_request)
+            self._next_request = request_time + self.interval
+        if request_time > now:
+            time.sleep(request_time - now)
+
+
 class StartWorkflowFailed(Exception):
     pass
 
@@ -270,7 +313,11 @@ class BadManagerPath(Exception):
 
 
 def make_request(path, tenant, request_data, request_parameters,
-                 method, logger):
+                 method, logger, rate_limiter=None):
+    # requests is slow to import, and notify_cloudify often has nothing to
+    # send to the manager
+    import requests
+
     base_urls, username, password = get_manager_details(logger)
     logger.debug(
         'Making request with base rest args: base_urls: {base_urls}; '
@@ -296,6 +343,8 @@ def make_request(path, tenant, request_data, request_parameters,
         )
         logger.error(message)
         raise BadManagerPath(message)
+    if rate_limiter:
+        rate_limiter.wait()
     for base_url in base_urls:
         url = base_url + path
         logger.debug(
@@ -303,21 +352,22 @@ def make_request(path, tenant, request_data, request_parameters,
             '{headers}; data: {data}, and using certificate '
             '{cert_path}'.format(
                 url=url,
-                call=method.__name__,
+                call=method,
                 headers=request_headers,
                 data=request_data,
                 cert_path=MANAGER_CERT_PATH,
             )
         )
         try:
-            result = method(
-                url=url,
-                headers=request_headers,
-                auth=(username, password),
-                data=request_data,
-                params=request_parameters,
-                verify=MANAGER_CERT_PATH,
-            )
+            with timing.span('rest_call'):
+                result = getattr(requests, method)(
+                    url=url,
+                    headers=request_headers,
+                    auth=(username, password),
+                    data=request_data,
+                    params=request_parameters,
+                    verify=MANAGER_CERT_PATH,
+                )
         except requests.exceptions.ConnectionError:
             # Manager down
             logger.warn('This manager appears to be down, trying next URL')
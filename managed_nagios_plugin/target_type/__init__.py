@@ -4,7 +4,8 @@ import os
 
 from cloudify.exceptions import NonRecoverableError
 
-from managed_nagios_plugin.check import create_check
+from managed_nagios_plugin.aggregation import is_weighted, parse_approach
+from managed_nagios_plugin.check import create_check, get_window_arguments
 from managed_nagios_plugin.constants import (
     BASE_OBJECTS_DIR,
 )
@@ -13,6 +14,7 @@ from managed_nagios_plugin.utils import (
     deploy_configuration_file,
     deploy_file,
     trigger_nagios_reload,
+    update_type_registry,
 )
 
 
@@ -40,6 +42,35 @@ def get_reaction_configuration_destination(name):
     )
 
 
+def get_rate_arguments(props, aggregate=False):
+    if not props['rate_check']:
+        return ''
+    if str(props['counter_bits']) not in ('auto', 'none', '32', '64'):
+        raise NonRecoverableError(
+            'counter_bits must be one of auto, none, 32, 64, but was '
+            '{bits}'.format(bits=props['counter_bits'])
+        )
+    if not 0 <= float(props['rate_smoothing']) <= 1:
+        raise NonRecoverableError(
+            'rate_smoothing must be between 0 and 1, but was '
+            '{smoothing}'.format(smoothing=props['rate_smoothing'])
+        )
+    arguments = (
+        '--rate --counter-bits={bits} --rate-smoothing={smoothing}'.format(
+            bits=props['counter_bits'],
+            smoothing=props['rate_smoothing'],
+        )
+    )
+    if aggregate:
+        if props['rate_mode'] not in ('aggregate', 'instance'):
+            raise NonRecoverableError(
+                'rate_mode must be one of aggregate, instance, but was '
+                '{mode}'.format(mode=props['rate_mode'])
+            )
+        arguments += ' --rate-mode={mode}'.format(mode=props['rate_mode'])
+    return arguments
+
+
 def create_target_type(logger, name, description, check_relationships,
                        instance_failure_reaction, instance_health_check,
                        check_interval, retry_interval, max_check_retries):
@@ -113,13 +144,29 @@ def create_target_type(logger, name, description, check_relationships,
                 'check_interval': props['check_interval'],
                 'retry_interval': props['retry_interval'],
                 'notification_interval': notification_interval,
-                'rate': '--rate' if props['rate_check'] else ''
+                'extra_arguments': ' '.join([
+                    get_rate_arguments(props),
+                    get_window_arguments(props),
+                ]),
             }
             check_type = 'snmp_poll'
             disallowed = []
         elif check.node.type == (
             'cloudify.nagios.nodes.SNMPAggregateValueCheck'
         ):
+            try:
+                parse_approach(props['aggregation_type'])
+            except ValueError as err:
+                raise NonRecoverableError(str(err))
+            if is_weighted(props['aggregation_type']) and len(
+                props['snmp_oids'].split(',')
+            ) != 2:
+                raise NonRecoverableError(
+                    'Aggregation type {approach} requires exactly two OIDs: '
+                    'the value, then its weight.'.format(
+                        approach=props['aggregation_type'],
+                    )
+                )
             params = {
                 'target_type': name,
                 'check_description': props['check_description'],
@@ -134,7 +181,10 @@ def create_target_type(logger, name, description, check_relationships,
                 'check_interval': props['check_interval'],
                 'retry_interval': props['retry_interval'],
                 'notification_interval': notification_interval,
-                'rate': '--rate' if props['rate_check'] else ''
+                'extra_arguments': ' '.join([
+                    get_rate_arguments(props, aggregate=True),
+                    get_window_arguments(props),
+                ]),
             }
             check_type = 'snmp_aggregate'
             disallowed = ['{{instance}}']
@@ -184,6 +234,7 @@ def create_target_type(logger, name, description, check_relationships,
         sudo=True,
     )
 
+    update_type_registry(logger, 'target')
     trigger_nagios_reload(set_group=True)
 
 
@@ -24,6 +24,7 @@ from managed_nagios_plugin.utils import (
     deploy_file,
     remove_configuration_file,
     run,
+    update_type_registry,
 )
 
 
@@ -189,6 +190,7 @@ def delete(ctx):
         ),
         sudo=True,
     )
+    update_type_registry(ctx.logger, 'target')
 
     # Remove connection config
     run(['rm', '-f',
@@ -0,0 +1,137 @@
+import atexit
+from contextlib import contextmanager
+import errno
+import fcntl
+import json
+import os
+import time
+
+from constants import TIMING_CONFIG_PATH, TIMING_SUMMARY_PATH
+
+# Optional timings of the slow phases of the monitoring components, e.g.
+# parsing the nagios status or calling check_snmp. These are only recorded
+# if the timing configuration has been deployed (see component_timing in
+# plugin.yaml), otherwise a span costs one comparison.
+# Check scripts add their timings to their perfdata, and all components can
+# add theirs to a summary file, which keeps the totals for the current and
+# the previous period of summary_interval seconds.
+SPAN_NAMES = (
+    'config_parse',
+    'status_parse',
+    'snmp_call',
+    'rate_store',
+    'rest_call',
+    'lock_wait',
+    'validation',
+    'reload',
+)
+DEFAULT_SUMMARY_INTERVAL = 300
+
+# Seconds spent in each span by this process, and how often it was entered
+SPANS = {}
+_CONFIGURATION = {}
+
+
+def load_configuration(config_path=TIMING_CONFIG_PATH):
+    try:
+        with open(config_path) as config_handle:
+            configuration = json.load(config_handle)
+    except (IOError, ValueError):
+        configuration = {'enabled': False}
+    _CONFIGURATION.clear()
+    _CONFIGURATION.update(configuration)
+    _CONFIGURATION.setdefault('enabled', True)
+    return configuration
+
+
+def is_enabled():
+    if not _CONFIGURATION:
+        load_configuration()
+    return _CONFIGURATION['enabled']
+
+
+@contextmanager
+def span(name):
+    if not is_enabled():
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        record(name, time.time() - start)
+
+
+def record(name, seconds):
+    total, count = SPANS.get(name, (0.0, 0))
+    SPANS[name] = total + seconds, count + 1
+
+
+def get_perfdata():
+    """Get perfdata for the spans recorded by this process, to go before the
+    check's own perfdata, as the last value is the check's result.
+    """
+    return ''.join(
+        ' timing_{name}={seconds:.6f}s'.format(name=name, seconds=total)
+        for name, (total, _) in sorted(SPANS.items())
+    )
+
+
+def write_summary(component, summary_path=TIMING_SUMMARY_PATH):
+    """Add this process' spans to the summary file, then reset them, e.g.
+    for long running processes.
+    """
+    if not is_enabled() or not SPANS:
+        return
+    interval = _CONFIGURATION.get('summary_interval',
+                                  DEFAULT_SUMMARY_INTERVAL)
+    now = time.time()
+    with open(summary_path + '.lock', 'a') as lock_handle:
+        fcntl.flock(lock_handle, fcntl.LOCK_EX)
+        try:
+            summary = load_summary(summary_path)
+            current = summary['current']
+            if now - current.get('start', now) >= interval:
+                current['end'] = now
+                summary['previous'] = current
+                current = summary['current'] = {}
+            current.setdefault('start', now)
+            spans = current.setdefault('spans', {})
+            for name, (total, count) in SPANS.items():
+                key = '{component}/{name}'.format(component=component,
+                                                  name=name)
+                previous_total, previous_count = spans.get(key, (0.0, 0))
+                spans[key] = [previous_total + total, previous_count + count]
+            _write_atomically(summary_path, summary)
+        finally:
+            fcntl.flock(lock_handle, fcntl.LOCK_UN)
+    SPANS.clear()
+
+
+def write_summary_at_exit(component):
+    # For components which exit in several places
+    if is_enabled():
+        atexit.register(write_summary, component)
+
+
+def load_summary(summary_path=TIMING_SUMMARY_PATH):
+    try:
+        with open(summary_path) as summary_handle:
+            return json.load(summary_handle)
+    except (IOError, ValueError):
+        return {'current': {}, 'previous': {}}
+
+
+def _write_atomically(path, data):
+    temp_path = '{path}.{pid}'.format(path=path, pid=os.getpid())
+    try:
+        with open(temp_path, 'w') as temp_handle:
+            json.dump(data, temp_handle)
+        os.rename(temp_path, path)
+    except Exception:
+        try:
+            os.unlink(temp_path)
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                raise
+        raise
@@ -1,18 +1,32 @@
+from contextlib import contextmanager
+import hashlib
+import json
 import os
 import pkgutil
 import re
 import subprocess
 import tempfile
+import threading
 import time
 
-import jinja2
-
 from constants import (
     OBJECT_DIR_PERMISSIONS,
     OBJECT_OWNERSHIP,
     OBJECT_PERMISSIONS,
     BASE_OBJECTS_DIR,
 )
+from nagios_utils import (
+    get_type_registry_path,
+    get_types_from_configuration,
+    NAGIOS_CONFIG_CACHE_FILE,
+    TYPE_PATHS,
+)
+import timing
+
+EVALUATION_MODES = ('active', 'passive')
+# Whether reloads are being deferred on each thread, and whether one has
+# been requested since, see deferred_reloads
+_RELOAD_STATE = threading.local()
 
 
 def yum_install(packages):
@@ -56,7 +70,32 @@ def reload_systemd_configuration():
     run(['systemctl', 'daemon-reload'], sudo=True)
 
 
+@contextmanager
+def deferred_reloads():
+    """Make one reload after several changes, e.g. a batch of nagiosrest
+    requests, rather than one for each change.
+    """
+    _RELOAD_STATE.deferred = True
+    _RELOAD_STATE.requested = None
+    try:
+        yield
+    finally:
+        requested = _RELOAD_STATE.requested
+        _RELOAD_STATE.deferred = False
+        _RELOAD_STATE.requested = None
+    if requested is not None:
+        trigger_nagios_reload(set_group=requested)
+
+
 def trigger_nagios_reload(set_group=False):
+    if getattr(_RELOAD_STATE, 'deferred', False):
+        _RELOAD_STATE.requested = bool(_RELOAD_STATE.requested) or set_group
+        return
+    with timing.span('reload'):
+        _trigger_nagios_reload(set_group)
+
+
+def _trigger_nagios_reload(set_group):
     # We have the trigger file to avoid reloading too quickly when there are a
     # large amount of changes being made at once, as this can upset nagios.
     reload_trigger_file = '/tmp/nagios_reload_triggered'
@@ -112,7 +151,7 @@ def deploy_file(data, destination,
                 permissions=OBJECT_PERMISSIONS,
                 sudo=False, template_params=None):
     if template_params:
-        data = jinja2.Template(data).render(**template_params)
+        data = render_template(data, template_params)
 
     tmpdir = tempfile.mkdtemp(prefix='managed_nagios')
     destination_filename = os.path.split(destination)[-1]
@@ -124,6 +163,39 @@ def deploy_file(data, destination,
                   sudo)
 
 
+def render_template(data, template_params):
+    # Only needed by the plugin, so not imported with the libraries that the
+    # check scripts use
+    import jinja2
+    return jinja2.Template(data).render(**template_params)
+
+
+def file_content_matches(path, data):
+    """Whether the file at path already has the given content. Files which
+    can't be read are treated as not matching.
+    """
+    try:
+        with open(path) as file_handle:
+            existing = file_handle.read()
+    except IOError:
+        return False
+    return hashlib.md5(existing).digest() == hashlib.md5(
+        data.encode('utf-8') if isinstance(data, unicode) else data
+    ).digest()
+
+
+def nagios_has_loaded(path):
+    """Whether nagios has loaded its configuration since the file at path
+    was written. Nagios rewrites its object cache each time it does so.
+    """
+    try:
+        return (
+            os.stat(path).st_mtime < os.stat(NAGIOS_CONFIG_CACHE_FILE).st_mtime
+        )
+    except OSError:
+        return False
+
+
 def relocate_file(source,
                   destination,
                   ownership=OBJECT_OWNERSHIP,
@@ -142,6 +214,14 @@ def deploy_configuration_file(logger, source, destination,
                               template_params=None,
                               validate=True, reload_service=True,
                               sudo=False, use_pkg_data=True):
+    """Deploy a configuration file, returning whether it was deployed.
+    Files which already have the same content are left as they are, without
+    validating the configuration or reloading nagios, as redeploying
+    unchanged objects (e.g. the hostgroups of an existing deployment) is
+    common. This is only done once nagios has loaded the file, so that a
+    retry still reloads nagios if the reload after the file was written
+    failed or never happened.
+    """
     destination = os.path.join(BASE_OBJECTS_DIR, destination)
 
     if use_pkg_data:
@@ -149,10 +229,21 @@ def deploy_configuration_file(logger, source, destination,
     else:
         with open(source) as source_handle:
             source_data = source_handle.read()
+    if template_params:
+        source_data = render_template(source_data, template_params)
+
+    if (
+        file_content_matches(destination, source_data)
+        and nagios_has_loaded(destination)
+    ):
+        logger.debug('{destination} is unchanged, not deploying'.format(
+            destination=destination,
+        ))
+        return False
 
     deploy_file(source_data, destination,
                 OBJECT_OWNERSHIP, OBJECT_PERMISSIONS,
-                sudo=sudo, template_params=template_params)
+                sudo=sudo)
 
     if validate:
         validate_configuration(
@@ -163,6 +254,7 @@ def deploy_configuration_file(logger, source, destination,
 
     if reload_service:
         trigger_nagios_reload(set_group=sudo)
+    return True
 
 
 def remove_configuration_file(logger, configuration_path,
@@ -197,7 +289,8 @@ def remove_configuration_file(logger, configuration_path,
 
 def validate_configuration(logger, rollback, sudo=False):
     try:
-        run(['nagios', '-v', '/etc/nagios/nagios.cfg'], sudo=sudo)
+        with timing.span('validation'):
+            run(['nagios', '-v', '/etc/nagios/nagios.cfg'], sudo=sudo)
     except subprocess.CalledProcessError as err:
         logger.warn(
             'Validation failed with output: "{output}". Rolling back change '
@@ -209,6 +302,26 @@ def validate_configuration(logger, rollback, sudo=False):
         raise
 
 
+def update_type_registry(logger, which_type, sudo=True):
+    """Record the types of one kind which are now configured, after one has
+    been created or deleted.
+    """
+    configuration = run(
+        ['find', TYPE_PATHS[which_type], '-maxdepth', '1', '-name', '*.cfg',
+         '-exec', 'cat', '{}', '+'],
+        sudo=sudo,
+    )
+    types = sorted(set(get_types_from_configuration(
+        which_type, configuration.splitlines(),
+    )))
+    logger.debug('Registering {which} types: {types}'.format(
+        which=which_type,
+        types=', '.join(types),
+    ))
+    deploy_file(json.dumps(types), get_type_registry_path(which_type),
+                sudo=sudo)
+
+
 def make_config_subdir(path, sudo=False):
     absolute_path = os.path.join(BASE_OBJECTS_DIR, path)
     run(['mkdir', '-p', absolute_path], sudo=sudo)
@@ -218,12 +331,21 @@ def make_config_subdir(path, sudo=False):
         run(['chown', OBJECT_OWNERSHIP, absolute_path], sudo=True)
 
 
-def get_node_id(instance_id):
-    if instance_id.startswith('tenant:'):
-        # This is actually a node
-        return instance_id.split('node:')[1]
-    else:
-        return instance_id.rsplit('_', 1)[0]
+def get_evaluation_parameters(evaluation, check_interval):
+    # Passively evaluated group checks have their results submitted by the
+    # evaluate_group_checks plugin. If those results stop arriving, nagios
+    # runs the check itself once the last result is two intervals old.
+    if evaluation not in EVALUATION_MODES:
+        raise ValueError(
+            'Evaluation must be one of {modes}, but was {evaluation}'.format(
+                modes=', '.join(EVALUATION_MODES),
+                evaluation=evaluation,
+            )
+        )
+    return {
+        'passive_evaluation': evaluation == 'passive',
+        'freshness_threshold': int(float(check_interval) * 60 * 2),
+    }
 
 
 def download_and_deploy_file_from_blueprint(source,
@@ -0,0 +1,106 @@
+import argparse
+
+import mock
+import pytest
+
+import aggregation
+
+
+def test_calculate_mean():
+    inputs = 1, 2.0, 3
+    expected = 2.0
+
+    result = aggregation.calculate_mean(inputs)
+    assert result == expected
+
+
+def test_calculate_mean_approach():
+    expected = aggregation.calculate_mean
+    assert aggregation.APPROACHES['arithmetic_mean'] == expected
+
+
+def test_calculate_sum():
+    inputs = 1, 2.0, 3
+    expected = 6.0
+
+    result = aggregation.calculate_sum(inputs)
+    assert result == expected
+
+
+def test_calculate_sum_approach():
+    expected = aggregation.calculate_sum
+    assert aggregation.APPROACHES['sum'] == expected
+
+
+@pytest.mark.parametrize('approach,expected', [
+    ('min', 1.0),
+    ('max', 10.0),
+    ('median', 5.5),
+    ('p90', 9.1),
+    ('stddev', 2.8722813232690143),
+    ('count_over:7', 3.0),
+])
+def test_approaches(approach, expected):
+    values = [float(value) for value in range(10, 0, -1)]
+
+    assert aggregation.aggregate(approach, values) == pytest.approx(expected)
+
+
+def test_approaches_accept_generators():
+    assert aggregation.aggregate(
+        'stddev', (value for value in (2, 4, 4, 4, 5, 5, 7, 9)),
+    ) == 2.0
+
+
+@mock.patch('aggregation.numpy', None)
+def test_percentile_without_numpy():
+    assert aggregation.calculate_percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.5
+    assert aggregation.calculate_percentile([5.0], 99) == 5.0
+
+
+def test_weighted_mean():
+    assert aggregation.aggregate(
+        'weighted_mean', [1.0, 3.0], weights=[3.0, 1.0],
+    ) == 1.5
+
+
+def test_weighted_mean_without_weight():
+    with pytest.raises(aggregation.AggregationError):
+        aggregation.aggregate(
+            'weighted_mean', [1.0, 3.0], weights=[0.0, 0.0],
+        )
+
+
+@pytest.mark.parametrize('approach', [
+    'mode',
+    'count_over',
+    'count_over:many',
+    'sum:5',
+])
+def test_invalid_approaches(approach):
+    with pytest.raises(ValueError):
+        aggregation.parse_approach(approach)
+
+
+def test_unweighted_argument():
+    assert aggregation.approach_argument('weighted_mean') == 'weighted_mean'
+    with pytest.raises(argparse.ArgumentTypeError):
+        aggregation.unweighted_approach_argument('weighted_mean')
+
+
+def test_validate_window():
+    assert aggregation.validate_window('300', 'max', '10') == (300.0, 10)
+
+
+@pytest.mark.parametrize('window,approach,samples', [
+    ('five minutes', 'arithmetic_mean', 60),
+    (-1, 'arithmetic_mean', 60),
+    (300, 'mode', 60),
+    (300, 'weighted_mean', 60),
+    (300, 'arithmetic_mean', 0),
+    (300, 'arithmetic_mean', 'many'),
+    (300, 'arithmetic_mean', None),
+])
+def test_invalid_window(window, approach, samples):
+    with pytest.raises(ValueError):
+        aggregation.validate_window(window, approach, samples)
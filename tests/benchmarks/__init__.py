@@ -0,0 +1,6 @@
+import sys
+
+# Add paths for supporting libs
+sys.path.append('managed_nagios_plugin/resources/scripts')
+sys.path.append('managed_nagios_plugin/')
+sys.path.append('benchmarks/')
@@ -0,0 +1,28 @@
+import fixtures
+import group_index
+import mock
+import nagios_utils
+
+
+def test_fixtures_are_consistent(tmpdir):
+    paths = fixtures.create_fixtures(str(tmpdir), 25)
+
+    configuration = nagios_utils.parse_nagios_data_file(
+        paths['objects_cache'], '\t',
+    )
+    status = nagios_utils.parse_nagios_data_file(paths['status'], '=')
+    # Instances and their nodes
+    assert len(configuration['host']) == 25 + 3
+    # Value and trap checks for each instance, and an aggregate for each
+    # node and group instance
+    assert len(status['servicestatus']) == 2 * 25 + 3 + 10
+    assert [
+        group['members'].count(',') + 1
+        for group in configuration['hostgroup']
+    ] == [10, 10, 5, 25]
+
+    with mock.patch.object(group_index, 'GROUP_INDEX_DIR',
+                           paths['group_index_dir']):
+        assert group_index.get_group_members(
+            fixtures.TENANT, fixtures.GROUP_TYPE, 'group0',
+        ) == set([fixtures.get_node_host_name('dep0')])
@@ -0,0 +1,181 @@
+import os
+
+import mock
+import pytest
+
+from tests.fakes import FakeLogger
+import tests.links.check_monitoring_health as check_monitoring_health
+
+THRESHOLDS = dict(
+    (name, {'warning': warning, 'critical': critical})
+    for name, _, warning, critical in check_monitoring_health.MEASUREMENTS
+)
+
+
+def _service(description, latency='0.1', execution_time='0.2',
+             check_type='0', last_check='0'):
+    return {
+        'host_name': 'host1',
+        'service_description': description,
+        'check_type': check_type,
+        'check_latency': latency,
+        'check_execution_time': execution_time,
+        'last_check': last_check,
+    }
+
+
+def test_check_statistics_only_active_checks():
+    statistics = check_monitoring_health.get_check_statistics([
+        _service('cpu', latency='1.0', execution_time='2.0'),
+        _service('mem', latency='3.0', execution_time='4.0'),
+        _service('type_instances:SNMPTRAP trap', latency='100',
+                 check_type='1'),
+    ])
+
+    assert statistics == {
+        'latency': 2.0,
+        'latency_max': 3.0,
+        'execution_time': 3.0,
+        'execution_time_max': 4.0,
+    }
+
+
+def test_check_statistics_no_checks():
+    statistics = check_monitoring_health.get_check_statistics([])
+
+    assert statistics['latency'] == 0.0
+    assert statistics['execution_time_max'] == 0.0
+
+
+def test_checks_last_minute():
+    assert check_monitoring_health.get_checks_last_minute({
+        'active_scheduled_service_check_stats': '12,60,180',
+    }) == 12
+    assert check_monitoring_health.get_checks_last_minute({}) == 0
+
+
+def test_trap_rate():
+    rate = check_monitoring_health.get_trap_rate(
+        [
+            _service('type_instances:SNMPTRAP trap1', last_check='950',
+                     check_type='1'),
+            _service('type_instances:SNMPTRAP trap2', last_check='500',
+                     check_type='1'),
+            _service('type_instances:SNMPTRAP trap3', last_check='1000',
+                     check_type='1'),
+            _service('type_instances:cpu', last_check='1000'),
+        ],
+        now=1000,
+        window=120,
+    )
+
+    assert rate == 1.0
+
+
+@mock.patch.object(check_monitoring_health, 'process_running')
+def test_reaction_backlog(process_running, tmpdir):
+    lock_base = tmpdir.mkdir('cloudifyreaction')
+    lock_base.join('instance1').write('101')
+    lock_base.join('instance2').write('102')
+    lock_base.join('instance3').write('')
+    coalesce = lock_base.mkdir('coalesce')
+    coalesce.join('abc.pending').write('{"a": 1}\n{"a": 2}\n')
+    coalesce.join('abc.leader').write('101')
+    coalesce.join('def.pending.101').write('{"a": 3}\n')
+    process_running.side_effect = lambda pid: pid == 101
+
+    assert check_monitoring_health.get_reaction_backlog(str(lock_base)) == (
+        1, 2,
+    )
+
+
+def test_reaction_backlog_no_reactions(tmpdir):
+    assert check_monitoring_health.get_reaction_backlog(
+        str(tmpdir.join('missing')),
+    ) == (0, 0)
+
+
+def test_rate_store_size(tmpdir):
+    db_path = str(tmpdir.join('rates.db'))
+    with open(db_path, 'w') as db_handle:
+        db_handle.write('x' * 1024 * 1024)
+    with open(db_path + '-wal', 'w') as wal_handle:
+        wal_handle.write('x' * 512 * 1024)
+
+    assert check_monitoring_health.get_rate_store_size(db_path) == 1.5
+    assert check_monitoring_health.get_rate_store_size(
+        str(tmpdir.join('missing.db')),
+    ) == 0
+
+
+def _measurements(**overrides):
+    measurements = {
+        'latency': 0.5,
+        'execution_time': 1.0,
+        'reaction_backlog': 0,
+        'trap_rate': 3.0,
+        'rate_store_size': 10.0,
+    }
+    measurements.update(overrides)
+    return measurements
+
+
+def test_evaluate_healthy():
+    logger = FakeLogger()
+
+    assert check_monitoring_health.evaluate(
+        _measurements(), THRESHOLDS, logger,
+    ) == ('OK', [])
+
+
+@pytest.mark.parametrize('overrides,expected_state,expected_problems', [
+    ({'latency': 15}, 'WARNING', ['average check latency (s) is 15.00']),
+    ({'latency': 15, 'reaction_backlog': 150}, 'CRITICAL', [
+        'average check latency (s) is 15.00',
+        'reaction backlog is 150.00',
+    ]),
+    ({'trap_rate': 100000}, 'OK', []),
+])
+def test_evaluate_thresholds(overrides, expected_state, expected_problems):
+    logger = FakeLogger()
+
+    assert check_monitoring_health.evaluate(
+        _measurements(**overrides), THRESHOLDS, logger,
+    ) == (expected_state, expected_problems)
+
+
+def test_perfdata():
+    perfdata = check_monitoring_health.format_perfdata(
+        {'latency': 0.5, 'reactions_pending': 2},
+        THRESHOLDS,
+    )
+
+    assert perfdata == 'latency=0.5;10;60 reactions_pending=2;;'
+
+
+@mock.patch.object(check_monitoring_health, 'get_rate_store_size',
+                   return_value=600.0)
+@mock.patch.object(check_monitoring_health, 'get_reaction_backlog',
+                   return_value=(1, 2))
+@mock.patch.object(check_monitoring_health.nagios_utils,
+                   'get_nagios_status')
+@mock.patch.object(check_monitoring_health.logging_utils, 'Logger')
+def test_main(logger, get_status, get_backlog, get_size, capsys):
+    get_status.return_value = {
+        'programstatus': [{
+            'active_scheduled_service_check_stats': '5,20,60',
+        }],
+        'servicestatus': [_service('cpu')],
+    }
+
+    with pytest.raises(SystemExit) as exit_info:
+        check_monitoring_health.main([])
+
+    assert exit_info.value.code == 1
+    output = capsys.readouterr()[0]
+    assert output.startswith(
+        'MONITORING HEALTH WARNING - rate store size (MB) is 600.00 |'
+    )
+    assert '|checks_last_minute=5;; ' in output
+    assert ' reaction_backlog=3;20;100 ' in output
+    assert os.linesep not in output.rstrip()
@@ -0,0 +1,60 @@
+import functools
+
+import mock
+
+import rate_store
+
+from tests.fakes import FakeLogger
+import tests.links.check_snmp_aggregate as check_snmp_aggregate
+
+
+def _calculate(db_path, now, instance_values):
+    update_values = functools.partial(rate_store.update_values,
+                                      db_path=db_path)
+    with mock.patch('nagios_plugin_utils.rate_store.update_values',
+                    side_effect=update_values):
+        with mock.patch('nagios_plugin_utils.time.time', return_value=now):
+            return check_snmp_aggregate.calculate_instance_rates(
+                FakeLogger(), 'tenant:t/deployment:d/node:n', 'sum(oid)',
+                instance_values, 'auto', 0,
+            )
+
+
+def test_first_run_has_no_rates(tmpdir):
+    db_path = str(tmpdir.join('rates.db'))
+
+    assert _calculate(db_path, 90, [('host1', [10.0], True)]) == []
+
+
+def test_instance_churn(tmpdir):
+    db_path = str(tmpdir.join('rates.db'))
+
+    _calculate(db_path, 90, [
+        ('host1', [10.0], True),
+        ('host2', [1000.0], True),
+    ])
+    # host2 removed and host3 added: neither should affect the rates
+    rates = _calculate(db_path, 100, [
+        ('host1', [20.0], True),
+        ('host3', [5000.0], True),
+    ])
+
+    assert rates == [1.0]
+
+    # host2 returning is treated as a new instance
+    rates = _calculate(db_path, 110, [
+        ('host1', [30.0], True),
+        ('host2', [3000.0], True),
+        ('host3', [5100.0], True),
+    ])
+
+    assert rates == [1.0, 10.0]
+
+
+def test_instance_counter_wrap(tmpdir):
+    db_path = str(tmpdir.join('rates.db'))
+
+    _calculate(db_path, 90, [('host1', [2.0 ** 32 - 5, 10.0], True)])
+    rates = _calculate(db_path, 100, [('host1', [5.0, 20.0], True)])
+
+    assert rates == [1.0, 1.0]
@@ -1,5 +1,7 @@
 import mock
 
+import aggregation
+
 from nagios_plugin_utils import STATUS_UNKNOWN
 
 from tests.fakes import FakeLogger
@@ -18,8 +20,7 @@ import tests.links.check_snmp_aggregate as check_snmp_aggregate
             'get_host_address')
 @mock.patch('tests.links.check_snmp_aggregate.'
             'get_instance_addresses')
-@mock.patch('tests.links.check_snmp_aggregate.'
-            'calculate_mean')
+@mock.patch('aggregation.calculate_mean')
 @mock.patch('tests.links.check_snmp_aggregate.'
             'store_value_and_calculate_rate')
 @mock.patch('tests.links.check_snmp_aggregate.'
@@ -54,8 +55,8 @@ def test_rate(mock_print, exit, thresholds, run_check,
 
     mean = 1.75
     calculate_mean.return_value = mean
-    old_calculate_mean = calculate_mean.APPROACHES['arithmetic_mean']
-    check_snmp_aggregate.APPROACHES['arithmetic_mean'] = calculate_mean
+    old_calculate_mean = aggregation.APPROACHES['arithmetic_mean']
+    aggregation.APPROACHES['arithmetic_mean'] = calculate_mean
 
     rate_result = 1.75
     calculate_rate.return_value = rate_result
@@ -109,14 +110,15 @@ def test_rate(mock_print, exit, thresholds, run_check,
     get_node_rate_path.assert_called_once_with(node, check_identifier)
 
     calculate_rate.assert_called_once_with(
-        logger, mean, instance_rate_storage_path
+        logger, mean, instance_rate_storage_path,
+        counter_bits=None, smoothing=0.0,
     )
 
     check_thresholds_and_exit.assert_called_once_with(
         rate_result, returned_thresholds, perfdata, True,
     )
 
-    check_snmp_aggregate.APPROACHES['arithmetic_mean'] = old_calculate_mean
+    aggregation.APPROACHES['arithmetic_mean'] = old_calculate_mean
 
 
 @mock.patch('tests.links.check_snmp_aggregate.'
@@ -131,8 +133,7 @@ def test_rate(mock_print, exit, thresholds, run_check,
             'get_host_address')
 @mock.patch('tests.links.check_snmp_aggregate.'
             'get_instance_addresses')
-@mock.patch('tests.links.check_snmp_aggregate.'
-            'calculate_mean')
+@mock.patch('aggregation.calculate_mean')
 @mock.patch('tests.links.check_snmp_aggregate.'
             'get_floats_from_result')
 @mock.patch('tests.links.check_snmp_aggregate.'
@@ -160,8 +161,8 @@ def test_non_rate(mock_print, exit, thresholds, run_check,
 
     mean = 1.75
     calculate_mean.return_value = mean
-    old_calculate_mean = calculate_mean.APPROACHES['arithmetic_mean']
-    check_snmp_aggregate.APPROACHES['arithmetic_mean'] = calculate_mean
+    old_calculate_mean = aggregation.APPROACHES['arithmetic_mean']
+    aggregation.APPROACHES['arithmetic_mean'] = calculate_mean
 
     instance_addresses = '192.0.2.5', '192.0.2.6'
     get_instance_addresses.return_value = instance_addresses
@@ -212,7 +213,7 @@ def test_non_rate(mock_print, exit, thresholds, run_check,
         mean, returned_thresholds, perfdata, False,
     )
 
-    check_snmp_aggregate.APPROACHES['arithmetic_mean'] = old_calculate_mean
+    aggregation.APPROACHES['arithmetic_mean'] = old_calculate_mean
 
 
 @mock.patch('tests.links.check_snmp_aggregate.'
@@ -227,8 +228,7 @@ def test_non_rate(mock_print, exit, thresholds, run_check,
             'get_host_address')
 @mock.patch('tests.links.check_snmp_aggregate.'
             'get_instance_addresses')
-@mock.patch('tests.links.check_snmp_aggregate.'
-            'calculate_mean')
+@mock.patch('aggregation.calculate_mean')
 @mock.patch('tests.links.check_snmp_aggregate.'
             'get_floats_from_result')
 @mock.patch('tests.links.check_snmp_aggregate.'
@@ -253,8 +253,8 @@ def test_no_thresholds(mock_print, exit, thresholds, run_check,
 
     mean = 1.75
     calculate_mean.return_value = mean
-    old_calculate_mean = calculate_mean.APPROACHES['arithmetic_mean']
-    check_snmp_aggregate.APPROACHES['arithmetic_mean'] = calculate_mean
+    old_calculate_mean = aggregation.APPROACHES['arithmetic_mean']
+    aggregation.APPROACHES['arithmetic_mean'] = calculate_mean
 
     instance_addresses = '192.0.2.5', '192.0.2.6'
     get_instance_addresses.return_value = instance_addresses
@@ -279,7 +279,7 @@ def test_no_thresholds(mock_print, exit, thresholds, run_check,
 
     thresholds.assert_called_once_with("", "", "", "", logger)
 
-    check_snmp_aggregate.APPROACHES['arithmetic_mean'] = old_calculate_mean
+    aggregation.APPROACHES['arithmetic_mean'] = old_calculate_mean
 
 
 @mock.patch('tests.links.check_snmp_aggregate.'
@@ -294,8 +294,7 @@ def test_no_thresholds(mock_print, exit, thresholds, run_check,
             'get_host_address')
 @mock.patch('tests.links.check_snmp_aggregate.'
             'get_instance_addresses')
-@mock.patch('tests.links.check_snmp_aggregate.'
-            'calculate_mean')
+@mock.patch('aggregation.calculate_mean')
 @mock.patch('tests.links.check_snmp_aggregate.'
             'get_floats_from_result')
 @mock.patch('tests.links.check_snmp_aggregate.'
@@ -320,8 +319,8 @@ def test_thresholds(mock_print, exit, thresholds, run_check,
 
     mean = 1.75
     calculate_mean.return_value = mean
-    old_calculate_mean = calculate_mean.APPROACHES['arithmetic_mean']
-    check_snmp_aggregate.APPROACHES['arithmetic_mean'] = calculate_mean
+    old_calculate_mean = aggregation.APPROACHES['arithmetic_mean']
+    aggregation.APPROACHES['arithmetic_mean'] = calculate_mean
 
     instance_addresses = '192.0.2.5', '192.0.2.6'
     get_instance_addresses.return_value = instance_addresses
@@ -357,7 +356,7 @@ def test_thresholds(mock_print, exit, thresholds, run_check,
         low_warn, low_crit, high_warn, high_crit, logger,
     )
 
-    check_snmp_aggregate.APPROACHES['arithmetic_mean'] = old_calculate_mean
+    aggregation.APPROACHES['arithmetic_mean'] = old_calculate_mean
 
 
 def test_generate_perfdata():
@@ -392,8 +391,7 @@ def test_generate_check_id():
             'get_host_address')
 @mock.patch('tests.links.check_snmp_aggregate.'
             'get_instance_addresses')
-@mock.patch('tests.links.check_snmp_aggregate.'
-            'calculate_mean')
+@mock.patch('aggregation.calculate_mean')
 @mock.patch('tests.links.check_snmp_aggregate.'
             'get_floats_from_result')
 @mock.patch('tests.links.check_snmp_aggregate.'
@@ -421,8 +419,8 @@ def test_no_result(mock_print, exit, thresholds, run_check,
 
     mean = 1.75
     calculate_mean.return_value = mean
-    old_calculate_mean = calculate_mean.APPROACHES['arithmetic_mean']
-    check_snmp_aggregate.APPROACHES['arithmetic_mean'] = calculate_mean
+    old_calculate_mean = aggregation.APPROACHES['arithmetic_mean']
+    aggregation.APPROACHES['arithmetic_mean'] = calculate_mean
 
     instance_addresses = '192.0.2.5', '192.0.2.6'
     get_instance_addresses.return_value = instance_addresses
@@ -453,4 +451,18 @@ def test_no_result(mock_print, exit, thresholds, run_check,
 
     exit.assert_called_once_with(STATUS_UNKNOWN)
 
-    check_snmp_aggregate.APPROACHES['arithmetic_mean'] = old_calculate_mean
+    aggregation.APPROACHES['arithmetic_mean'] = old_calculate_mean
+
+
+@mock.patch('tests.links.check_snmp_aggregate.sys.exit')
+@mock.patch('tests.links.check_snmp_aggregate.print')
+def test_no_weight(mock_print, exit):
+    logger = FakeLogger()
+    # Each instance's value is followed by its weight
+    values = [5.0, 0.0, 7.0, 0.0]
+
+    check_snmp_aggregate.get_aggregate(logger, 'weighted_mean', values)
+
+    assert logger.string_appears_in('warn', 'total weight')
+    assert 'weight' in mock_print.call_args_list[0][0][0]
+    exit.assert_called_once_with(STATUS_UNKNOWN)
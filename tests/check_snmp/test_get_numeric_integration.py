@@ -68,7 +68,8 @@ def test_rate(mock_print, exit, thresholds, run_check, get_perfdata,
     get_instance_rate_path.assert_called_once_with(hostname, oid)
 
     calculate_rate.assert_called_once_with(
-        logger, float_value, instance_rate_storage_path
+        logger, float_value, instance_rate_storage_path,
+        counter_bits=None, smoothing=0.0,
     )
 
     check_thresholds_and_exit.assert_called_once_with(
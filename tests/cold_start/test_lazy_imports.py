@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+PLUGIN_DIR = os.path.abspath('managed_nagios_plugin')
+SCRIPTS_DIR = os.path.join(PLUGIN_DIR, 'resources', 'scripts')
+# Loads a script as nagios would run it, without running main, then lists
+# the modules that were imported
+LOADER = (
+    'import imp, sys\n'
+    'sys.path[0:0] = sys.argv[2:]\n'
+    'imp.load_source("script", sys.argv[1])\n'
+    'sys.stdout.write(" ".join(sys.modules))\n'
+)
+
+
+@pytest.mark.parametrize('script', [
+    'check_group_aggregate',
+    'check_group_meta_aggregate',
+    'check_monitoring_health',
+    'check_snmp_aggregate',
+    'check_snmp_numeric',
+    'check_snmptrap_checks',
+    'cloudify_nagios_snmp_trap_handler',
+    'notify_cloudify',
+])
+def test_heavy_modules_not_imported(script):
+    modules = subprocess.check_output([
+        sys.executable, '-c', LOADER,
+        os.path.join(SCRIPTS_DIR, script), SCRIPTS_DIR, PLUGIN_DIR,
+    ]).split()
+
+    for heavy in ('jinja2', 'requests', 'sqlite3', 'logging.config'):
+        assert heavy not in modules
@@ -0,0 +1,340 @@
+import mock
+
+from nagios_plugin_utils import STATUS_CRITICAL, STATUS_OK, STATUS_UNKNOWN
+
+from tests.fakes import FakeLogger
+import tests.links.evaluate_group_checks as evaluate_group_checks
+
+PSEUDO_HOST = 'tenant:t1/group_type:web'
+MEMBERS = {
+    'tenant:t1/deployment:dep1/node:node1',
+    'tenant:t1/deployment:dep2/node:node1',
+}
+
+
+def _group_service(group, extra='', active='0', interval='1.000000',
+                   group_type='web'):
+    return {
+        'host_name': 'tenant:t1/group_type:{group_type}'.format(
+            group_type=group_type,
+        ),
+        'service_description': (
+            'Instance {group} of group {group_type} for tenant t1'.format(
+                group=group,
+                group_type=group_type,
+            )
+        ),
+        'check_command': (
+            'check_group_aggregate!{group_type}!{group}!t1!abort!sum!!!!'
+            '20!{extra}'.format(
+                group=group,
+                group_type=group_type,
+                extra=extra,
+            )
+        ),
+        'active_checks_enabled': active,
+        'check_interval': interval,
+    }
+
+
+def _meta_service():
+    return {
+        'host_name': PSEUDO_HOST,
+        'service_description': (
+            'Meta group check for prefix g for group web for tenant t1'
+        ),
+        'check_command': (
+            'check_group_meta_aggregate!web!g!t1!abort!max!!!!!'
+        ),
+        'active_checks_enabled': '0',
+        'check_interval': '1.000000',
+    }
+
+
+def _status(host, description, perfdata, state='0', last_check='0'):
+    return {
+        'host_name': host,
+        'service_description': description,
+        'performance_data': perfdata,
+        'current_state': state,
+        'last_check': last_check,
+    }
+
+
+def _member_statuses():
+    return [
+        _status('tenant:t1/deployment:dep1/node:node1', 'check:conns',
+                'mean(conns)=5'),
+        _status('tenant:t1/deployment:dep2/node:node1', 'check:conns',
+                'mean(conns)=7'),
+        _status('tenant:t1/deployment:dep2/node:node1', 'check:other',
+                'mean(other)=100'),
+        _status('tenant:t1/deployment:dep3/node:node1', 'check:conns',
+                'mean(conns)=100'),
+    ]
+
+
+def test_get_passive_group_checks():
+    configuration = {
+        'service': [
+            _group_service('g1', extra='--window=60.0 --window-samples=5'),
+            _group_service('g2', active='1'),
+            _meta_service(),
+            {
+                'host_name': 'localhost',
+                'service_description': 'Current Load',
+                'check_command': 'check_local_load!2.0!4.0',
+                'active_checks_enabled': '0',
+            },
+        ],
+    }
+
+    checks = evaluate_group_checks.get_passive_group_checks(
+        FakeLogger(), configuration,
+    )
+
+    assert len(checks) == 2
+    assert checks[0]['meta'] is False
+    assert checks[0]['arguments'] == [
+        '--group-type=web', '--group-instance=g1', '--tenant=t1',
+        '--unknown=abort', '--approach=sum', '--low-warning=',
+        '--low-critical=', '--high-warning=', '--high-critical=20',
+        '--window=60.0', '--window-samples=5',
+    ]
+    assert checks[1]['meta'] is True
+
+
+def test_is_due():
+    check = {'check_interval': 5.0}
+
+    assert evaluate_group_checks.is_due(check, None, 1000)
+    assert not evaluate_group_checks.is_due(check, {'last_check': '800'},
+                                            1000)
+    assert evaluate_group_checks.is_due(check, {'last_check': '720'}, 1000)
+
+
+def _index(members, children=None):
+    return {
+        'members': members,
+        'names': sorted(members),
+        'children': children or {},
+        'parents': {},
+    }
+
+
+def _evaluate(group_services, statuses, now=1000, signatures=None):
+    group_checks = evaluate_group_checks.get_passive_group_checks(
+        FakeLogger(), {'service': group_services},
+    )
+    evaluator = evaluate_group_checks.GroupCheckEvaluator(
+        FakeLogger(), statuses, group_checks, now, signatures=signatures,
+    )
+    return evaluator, evaluator.evaluate_all()
+
+
+def _command(service, status, output):
+    return 'PROCESS_SERVICE_CHECK_RESULT;{host};{service};{status};' \
+        '{output}'.format(
+            host=service['host_name'],
+            service=service['service_description'],
+            status=status,
+            output=output,
+        )
+
+
+@mock.patch('tests.links.evaluate_group_checks.load_group_checks')
+@mock.patch('group_index.load_group_index')
+def test_evaluate_group(mock_load_index, mock_load_checks):
+    mock_load_index.return_value = _index({'g1': sorted(MEMBERS)})
+    mock_load_checks.return_value = {'conns'}
+    service = _group_service('g1')
+
+    _, commands = _evaluate([service], _member_statuses())
+
+    assert commands == [
+        _command(service, STATUS_OK, "GROUP OK - 12.0 | 'sum(web/g1)'=12.0"),
+    ]
+
+
+@mock.patch('tests.links.evaluate_group_checks.load_group_checks')
+@mock.patch('group_index.load_group_index')
+def test_evaluate_group_unknown_member(mock_load_index, mock_load_checks):
+    mock_load_index.return_value = _index({'g1': sorted(MEMBERS)})
+    mock_load_checks.return_value = {'conns'}
+    statuses = _member_statuses()
+    statuses[0]['current_state'] = '3'
+
+    _, commands = _evaluate([_group_service('g1')], statuses)
+
+    assert len(commands) == 1
+    assert ';{status};'.format(status=STATUS_UNKNOWN) in commands[0]
+    assert 'unknown' in commands[0]
+
+
+@mock.patch('tests.links.evaluate_group_checks.load_group_checks')
+@mock.patch('group_index.load_group_index')
+def test_nested_groups_evaluated_bottom_up(mock_load_index,
+                                          mock_load_checks):
+    indexes = {
+        ('t1', 'web'): _index({
+            'g1': sorted(MEMBERS),
+            'g2': ['tenant:t1/deployment:dep3/node:node1'],
+        }),
+        ('t1', 'region'): _index(
+            {'eu': []},
+            children={'eu': [['web', 'g1'], ['web', 'g2']]},
+        ),
+    }
+    mock_load_index.side_effect = lambda *key: indexes[key]
+    mock_load_checks.return_value = {'conns'}
+    region = _group_service('eu', group_type='region')
+    g1 = _group_service('g1')
+    g2 = _group_service('g2')
+    statuses = _member_statuses() + [
+        _status(g1['host_name'], g1['service_description'],
+                ' sum(web/g1)=1'),
+    ]
+
+    _, commands = _evaluate([region, g1, g2], statuses)
+
+    # Children first, with the parent using their new results
+    assert commands == [
+        _command(g1, STATUS_OK, "GROUP OK - 12.0 | 'sum(web/g1)'=12.0"),
+        _command(g2, STATUS_CRITICAL,
+                 "GROUP HIGH CRITICAL - *100.0* | 'sum(web/g2)'=100.0"),
+        _command(region, STATUS_CRITICAL,
+                 "GROUP HIGH CRITICAL - *112.0* | 'sum(region/eu)'=112.0"),
+    ]
+
+
+@mock.patch('tests.links.evaluate_group_checks.load_group_checks')
+@mock.patch('group_index.load_group_index')
+def test_unchanged_inputs_reuse_result(mock_load_index, mock_load_checks):
+    indexes = {
+        ('t1', 'web'): _index({'g1': sorted(MEMBERS)}),
+        ('t1', 'region'): _index(
+            {'eu': []},
+            children={'eu': [['web', 'g1']]},
+        ),
+    }
+    mock_load_index.side_effect = lambda *key: indexes[key]
+    mock_load_checks.return_value = {'conns'}
+    services = [
+        _group_service('eu', group_type='region'), _group_service('g1'),
+    ]
+    evaluator, commands = _evaluate(services, _member_statuses())
+    previous_statuses = [
+        dict(evaluator.statuses[evaluate_group_checks.get_service_key(
+            service,
+        )])
+        for service in services
+    ]
+
+    with mock.patch('tests.links.evaluate_group_checks.'
+                    'calculate_group_value') as mock_calculate:
+        _, commands = _evaluate(
+            services,
+            _member_statuses() + [
+                dict(status) for status in previous_statuses
+            ],
+            now=1100, signatures=evaluator.signatures,
+        )
+        assert not mock_calculate.called
+
+    assert commands == [
+        _command(services[1], STATUS_OK,
+                 "GROUP OK - 12.0 | 'sum(web/g1)'=12.0"),
+        _command(services[0], STATUS_OK,
+                 "GROUP OK - 12.0 | 'sum(region/eu)'=12.0"),
+    ]
+
+    # A changed member result changes only its group and their ancestors
+    statuses = _member_statuses() + [
+        dict(status) for status in previous_statuses
+    ]
+    statuses[0]['performance_data'] = 'mean(conns)=6'
+    _, commands = _evaluate(services, statuses, now=1100,
+                            signatures=evaluator.signatures)
+
+    assert commands == [
+        _command(services[1], STATUS_OK,
+                 "GROUP OK - 13.0 | 'sum(web/g1)'=13.0"),
+        _command(services[0], STATUS_OK,
+                 "GROUP OK - 13.0 | 'sum(region/eu)'=13.0"),
+    ]
+
+
+def test_signatures_saved(tmpdir):
+    path = str(tmpdir.join('signatures.json'))
+    group_checks = evaluate_group_checks.get_passive_group_checks(
+        FakeLogger(), {'service': [_group_service('g1')]},
+    )
+    key = '\n'.join(evaluate_group_checks.get_service_key(group_checks[0]))
+
+    assert evaluate_group_checks.load_signatures(path) == {}
+
+    evaluate_group_checks.save_signatures(
+        {key: 'abc', 'removed\ncheck': 'def'}, group_checks, path,
+    )
+
+    assert evaluate_group_checks.load_signatures(path) == {key: 'abc'}
+
+
+@mock.patch('tests.links.evaluate_group_checks.save_signatures')
+@mock.patch('tests.links.evaluate_group_checks.load_signatures')
+@mock.patch('tests.links.evaluate_group_checks.time.time')
+@mock.patch('tests.links.evaluate_group_checks.nagios_utils')
+@mock.patch('tests.links.evaluate_group_checks.logging_utils')
+@mock.patch('tests.links.evaluate_group_checks.load_group_checks')
+@mock.patch('group_index.load_group_index')
+def test_main_submits_all_results(mock_load_index, mock_load_checks,
+                                  mock_logging, mock_nagios_utils,
+                                  mock_time, mock_load_signatures,
+                                  mock_save_signatures):
+    mock_logging.Logger.return_value = FakeLogger()
+    mock_load_index.return_value = _index({
+        'g1': sorted(MEMBERS),
+        'g2': ['tenant:t1/deployment:dep3/node:node1'],
+        'h1': [],
+    })
+    mock_load_checks.return_value = {'conns'}
+    mock_load_signatures.return_value = {}
+    mock_time.return_value = 1000
+    group_services = [
+        _meta_service(), _group_service('g1'), _group_service('g2'),
+    ]
+    mock_nagios_utils.NAGIOS_CONFIGURATION = {'service': group_services}
+    statuses = _member_statuses() + [
+        # g2 has a stale result, which the meta group must not use
+        _status(PSEUDO_HOST, group_services[2]['service_description'],
+                ' sum(web/g2)=1', last_check='0'),
+        # Not matched by the meta group's prefix
+        _status(PSEUDO_HOST, 'Instance h1 of group web for tenant t1',
+                ' sum(web/h1)=1000', last_check='990'),
+        # The meta group was recently evaluated
+        _status(PSEUDO_HOST, group_services[0]['service_description'],
+                ' max(web/g*)=1', last_check='990'),
+    ]
+    mock_nagios_utils.get_nagios_status.return_value = {
+        'servicestatus': statuses,
+    }
+
+    with mock.patch('sys.exit') as mock_exit:
+        evaluate_group_checks.main([])
+        mock_exit.assert_called_once_with(STATUS_OK)
+    commands = mock_nagios_utils.send_nagios_commands.call_args[0][0]
+    assert commands == [
+        _command(group_services[1], STATUS_OK,
+                 "GROUP OK - 12.0 | 'sum(web/g1)'=12.0"),
+        _command(group_services[2], STATUS_CRITICAL,
+                 "GROUP HIGH CRITICAL - *100.0* | 'sum(web/g2)'=100.0"),
+    ]
+    assert mock_save_signatures.called
+
+    # With the meta group due, it uses the new group results
+    mock_time.return_value = 1100
+    with mock.patch('sys.exit'):
+        evaluate_group_checks.main([])
+    commands = mock_nagios_utils.send_nagios_commands.call_args[0][0]
+    assert commands[-1] == _command(group_services[0], STATUS_OK,
+                                    "GROUP OK - 100.0 | 'max(web/g*)'=100.0")
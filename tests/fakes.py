@@ -1,6 +1,8 @@
 from contextlib import contextmanager
 from pprint import pprint
 
+import mock
+
 
 class FakeLogger(object):
     def __init__(self):
@@ -12,20 +14,29 @@ class FakeLogger(object):
             'exception': [],
         }
 
-    def debug(self, message):
-        self.messages['debug'].append(message)
+    def is_debug_enabled(self):
+        return True
+
+    def _log(self, level, message, args):
+        # As the real logger, arguments are formatted into the message
+        if args:
+            message = message % args
+        self.messages[level].append(message)
+
+    def debug(self, message, *args):
+        self._log('debug', message, args)
 
-    def info(self, message):
-        self.messages['info'].append(message)
+    def info(self, message, *args):
+        self._log('info', message, args)
 
-    def warn(self, message):
-        self.messages['warn'].append(message)
+    def warn(self, message, *args):
+        self._log('warn', message, args)
 
-    def error(self, message):
-        self.messages['error'].append(message)
+    def error(self, message, *args):
+        self._log('error', message, args)
 
-    def exception(self, message):
-        self.messages['exception'].append(message)
+    def exception(self, message, *args):
+        self._log('exception', message, args)
 
     def string_appears_in(self, level, search_string):
         """
@@ -110,3 +121,14 @@ class FakeOpener(object):
 
     def write(self, *args):
         pass
+
+
+def patch_group_dirs(base_dir):
+    # Put the group index under base_dir, laid out as under BASE_OBJECTS_DIR
+    groups = base_dir.join('groups')
+    return mock.patch.multiple(
+        'group_index',
+        GROUP_INDEX_DIR=str(groups.join('index')),
+        GROUP_MEMBERS_DIR=str(groups.join('members')),
+        GROUP_CHILDREN_DIR=str(groups.join('children')),
+    )
@@ -0,0 +1,159 @@
+import group_index
+from tests.fakes import patch_group_dirs
+
+
+def test_add_and_get_members(tmpdir):
+    with patch_group_dirs(tmpdir):
+        group_index.add_group_member('t1', 'web', 'g1', 'dep1', 'node1')
+        group_index.add_group_member('t1', 'web', 'g1', 'dep2', 'node1')
+        group_index.add_group_member('t1', 'web', 'g1', 'dep1', 'node1')
+        group_index.add_group_member('t1', 'web', 'g2', 'dep1', 'node2')
+
+        assert group_index.get_group_members('t1', 'web', 'g1') == {
+            'tenant:t1/deployment:dep1/node:node1',
+            'tenant:t1/deployment:dep2/node:node1',
+        }
+        assert group_index.get_group_members('t1', 'web', 'g2') == {
+            'tenant:t1/deployment:dep1/node:node2',
+        }
+        assert group_index.get_group_members('t2', 'web', 'g1') is None
+
+
+def test_group_without_members(tmpdir):
+    with patch_group_dirs(tmpdir):
+        group_index.add_group('t1', 'web', 'g1')
+
+        assert group_index.get_group_members('t1', 'web', 'g1') is None
+        assert group_index.get_group_names('t1', 'web') == ['g1']
+
+
+def test_remove_group(tmpdir):
+    with patch_group_dirs(tmpdir):
+        group_index.add_group_member('t1', 'web', 'g1', 'dep1', 'node1')
+        group_index.add_group_member('t1', 'web', 'g2', 'dep1', 'node2')
+
+        group_index.remove_group('t1', 'web', 'g1')
+        group_index.remove_group('t1', 'web', 'g3')
+
+        assert group_index.get_group_members('t1', 'web', 'g1') is None
+        assert group_index.get_group_members('t1', 'web', 'g2') == {
+            'tenant:t1/deployment:dep1/node:node2',
+        }
+        assert group_index.get_group_names('t1', 'web') == ['g2']
+
+
+def test_get_group_names_with_prefix(tmpdir):
+    with patch_group_dirs(tmpdir):
+        for name in ('web-b2', 'db-1', 'web-a1', 'web-a10', 'web', 'wex'):
+            group_index.add_group('t1', 'web', name)
+        index = group_index.load_group_index('t1', 'web')
+
+        assert group_index.get_group_names('t1', 'web', 'web-a') == [
+            'web-a1', 'web-a10',
+        ]
+        assert group_index.get_group_names('t1', 'web', 'web',
+                                           index=index) == [
+            'web', 'web-a1', 'web-a10', 'web-b2',
+        ]
+        assert group_index.get_group_names('t1', 'web', 'x') == []
+        assert len(group_index.get_group_names('t1', 'web')) == 6
+
+
+def test_index_built_from_members_directory(tmpdir):
+    members = tmpdir.join('groups', 'members', 't1', 'web')
+    members.join('g1', 'dep1', 'node1').ensure()
+    members.join('g1', 'dep2', 'node3').ensure()
+    members.join('g1_target').ensure()
+    members.join('g2_target').ensure()
+    members.join('meta', 'g_target').ensure()
+
+    with patch_group_dirs(tmpdir):
+        assert group_index.get_group_members('t1', 'web', 'g1') == {
+            'tenant:t1/deployment:dep1/node:node1',
+            'tenant:t1/deployment:dep2/node:node3',
+        }
+        assert group_index.get_group_names('t1', 'web') == ['g1', 'g2']
+
+        # Existing groups are kept when the index is first written
+        group_index.add_group_member('t1', 'web', 'g1', 'dep1', 'node2')
+        tmpdir.join('groups', 'members').remove()
+
+        assert group_index.get_group_members('t1', 'web', 'g1') == {
+            'tenant:t1/deployment:dep1/node:node1',
+            'tenant:t1/deployment:dep1/node:node2',
+            'tenant:t1/deployment:dep2/node:node3',
+        }
+        assert group_index.get_group_names('t1', 'web') == ['g1', 'g2']
+
+
+def test_group_children(tmpdir):
+    with patch_group_dirs(tmpdir):
+        group_index.add_group('t1', 'web', 'g1')
+        group_index.add_group_child('t1', 'cluster', 'c1', 'web', 'g1')
+        group_index.add_group_child('t1', 'cluster', 'c1', 'web', 'g2')
+        group_index.add_group_child('t1', 'region', 'eu', 'cluster', 'c1')
+        group_index.add_group_child('t1', 'region', 'eu', 'cluster', 'c1')
+
+        assert group_index.get_group_children('t1', 'cluster', 'c1') == [
+            ['web', 'g1'], ['web', 'g2'],
+        ]
+        assert group_index.get_group_children('t1', 'region', 'eu') == [
+            ['cluster', 'c1'],
+        ]
+        assert group_index.get_group_parents('t1', 'web', 'g2') == [
+            ['cluster', 'c1'],
+        ]
+        assert group_index.is_group_descendant('t1', 'web', 'g1',
+                                               'region', 'eu')
+        assert not group_index.is_group_descendant('t1', 'region', 'eu',
+                                                   'web', 'g1')
+
+        group_index.remove_group('t1', 'cluster', 'c1')
+
+        assert group_index.get_group_children('t1', 'region', 'eu') == []
+        assert group_index.get_group_parents('t1', 'web', 'g1') == []
+        assert group_index.get_group_names('t1', 'web') == ['g1', 'g2']
+
+
+def test_children_built_from_directory(tmpdir):
+    children = tmpdir.join('groups', 'children', 't1')
+    children.join('cluster', 'c1', 'web', 'g1').ensure()
+    children.join('region', 'eu', 'cluster', 'c1').ensure()
+    tmpdir.join('groups', 'members', 't1', 'cluster', 'c1_target').ensure()
+
+    with patch_group_dirs(tmpdir):
+        assert group_index.get_group_children('t1', 'cluster', 'c1') == [
+            ['web', 'g1'],
+        ]
+        assert group_index.get_group_parents('t1', 'cluster', 'c1') == [
+            ['region', 'eu'],
+        ]
+
+
+def test_update_group_members(tmpdir):
+    with patch_group_dirs(tmpdir):
+        group_index.add_group_member('t1', 'web', 'g1', 'dep1', 'node1')
+        group_index.add_group('t1', 'web', 'g3')
+
+        group_index.update_group_members(
+            't1', 'web',
+            added=[
+                ('g1', 'dep1', 'node2'),
+                ('g2', 'dep1', 'node1'),
+                ('g2', 'dep2', 'node1'),
+            ],
+            removed=[
+                ('g1', 'dep1', 'node1'),
+                ('g3', 'dep1', 'node1'),
+                ('g4', 'dep1', 'node1'),
+            ],
+        )
+
+        assert group_index.get_group_members('t1', 'web', 'g1') == {
+            'tenant:t1/deployment:dep1/node:node2',
+        }
+        assert group_index.get_group_members('t1', 'web', 'g2') == {
+            'tenant:t1/deployment:dep1/node:node1',
+            'tenant:t1/deployment:dep2/node:node1',
+        }
+        assert group_index.get_group_names('t1', 'web') == ['g1', 'g2', 'g3']
@@ -0,0 +1 @@
+../../managed_nagios_plugin/resources/scripts/check_monitoring_health
\ No newline at end of file
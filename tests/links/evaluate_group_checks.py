@@ -0,0 +1 @@
+../../managed_nagios_plugin/resources/scripts/evaluate_group_checks
\ No newline at end of file
@@ -0,0 +1,66 @@
+import json
+import logging
+import os
+
+import mock
+import pytest
+
+import logging_utils
+
+
+@pytest.fixture
+def config_path(tmpdir):
+    path = str(tmpdir.join('logging.cfg'))
+    with open(path, 'w') as config_handle:
+        json.dump({'version': 1, 'disable_existing_loggers': False},
+                  config_handle)
+    yield path
+    logging_utils._APPLIED_CONFIGURATIONS.clear()
+    logging.disable(logging.NOTSET)
+
+
+@mock.patch('logging.config.dictConfig')
+def test_configuration_applied_once(dict_config, config_path):
+    logging_utils.Logger('first', config_location=config_path)
+    logging_utils.Logger('second', config_location=config_path)
+
+    dict_config.assert_called_once_with(
+        {'version': 1, 'disable_existing_loggers': False},
+    )
+
+
+@mock.patch('logging.config.dictConfig')
+def test_changed_configuration_applied_again(dict_config, config_path):
+    logging_utils.Logger('first', config_location=config_path)
+    os.utime(config_path, (0, 0))
+    logging_utils.Logger('second', config_location=config_path)
+
+    assert dict_config.call_count == 2
+
+
+@mock.patch('logging.config.dictConfig')
+def test_disabled_configuration(dict_config, config_path):
+    with open(config_path, 'w') as config_handle:
+        json.dump({'disabled': True}, config_handle)
+
+    logger = logging_utils.Logger('disabled', config_location=config_path)
+
+    assert not dict_config.called
+    assert not logger.is_debug_enabled()
+    with mock.patch.object(logger._logger, 'error') as error:
+        logger.error('Not logged %s', 'at all')
+    assert not error.called
+
+
+def test_arguments_formatted_lazily(config_path):
+    logger = logging_utils.Logger('lazy', config_location=config_path)
+    logger._logger.setLevel(logging.INFO)
+    argument = mock.MagicMock()
+
+    with mock.patch.object(logger._logger, 'handle') as handle:
+        logger.debug('Not logged: %s', argument)
+        logger.info('Logged: %s', 'value')
+
+    assert not argument.__str__.called
+    record = handle.call_args[0][0]
+    assert record.getMessage() == 'Logged: value'
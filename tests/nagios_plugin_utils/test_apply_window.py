@@ -0,0 +1,42 @@
+import functools
+
+import mock
+
+import nagios_plugin_utils
+import rate_store
+from tests.fakes import FakeLogger
+
+
+def _apply(db_path, now, value, window, approach='arithmetic_mean'):
+    append_sample = functools.partial(rate_store.append_sample,
+                                      db_path=db_path)
+    with mock.patch('nagios_plugin_utils.rate_store.append_sample',
+                    side_effect=append_sample):
+        with mock.patch('nagios_plugin_utils.time.time', return_value=now):
+            return nagios_plugin_utils.apply_window(
+                FakeLogger(), value, 'key', window, approach,
+            )
+
+
+def test_no_window():
+    with mock.patch('nagios_plugin_utils.rate_store') as store:
+        assert nagios_plugin_utils.apply_window(
+            FakeLogger(), 5.0, 'key', 0, 'arithmetic_mean',
+        ) == 5.0
+    assert store.append_sample.call_count == 0
+
+
+def test_windowed_mean(tmpdir):
+    db_path = str(tmpdir.join('rates.db'))
+
+    assert _apply(db_path, 100, 10.0, 120) == 10.0
+    assert _apply(db_path, 160, 20.0, 120) == 15.0
+    # The first result is now outside the window
+    assert _apply(db_path, 230, 60.0, 120) == 40.0
+
+
+def test_windowed_max(tmpdir):
+    db_path = str(tmpdir.join('rates.db'))
+
+    _apply(db_path, 100, 30.0, 300, 'max')
+    assert _apply(db_path, 160, 20.0, 300, 'max') == 30.0
@@ -0,0 +1,111 @@
+import pytest
+
+import nagios_plugin_utils
+
+
+def _previous(value, timestamp=90):
+    return {'timestamp': timestamp, 'result': value}
+
+
+def test_increase():
+    assert nagios_plugin_utils.calculate_counter_rate(
+        _previous(32), 100, 42, 32,
+    ) == 1.0
+
+
+def test_sub_second_interval():
+    assert nagios_plugin_utils.calculate_counter_rate(
+        _previous(32, timestamp=99.5), 100, 42,
+    ) == 20.0
+
+
+def test_decrease_not_counter():
+    assert nagios_plugin_utils.calculate_counter_rate(
+        _previous(42), 100, 32,
+    ) == -1.0
+
+
+def test_32_bit_wrap():
+    assert nagios_plugin_utils.calculate_counter_rate(
+        _previous(2 ** 32 - 5), 100, 5, 32,
+    ) == 1.0
+
+
+def test_64_bit_wrap():
+    assert nagios_plugin_utils.calculate_counter_rate(
+        _previous(2 ** 64 - 5), 100, 5, 64,
+    ) == 1.0
+
+
+@pytest.mark.parametrize('previous,value,bits', [
+    # Wrap would be more than half of the counter's range
+    (2 ** 31 - 5, 5, 32),
+    # 64 bit counter reset while treated as 32 bit
+    (2 ** 40, 5, 32),
+    (2 ** 40, 5, 64),
+    # Width unknown
+    (2 ** 32 - 5, 5, 0),
+])
+def test_reset(previous, value, bits):
+    with pytest.raises(nagios_plugin_utils.RateUnavailable):
+        nagios_plugin_utils.calculate_counter_rate(
+            _previous(previous), 100, value, bits,
+        )
+
+
+def test_too_recent():
+    with pytest.raises(nagios_plugin_utils.RateUnavailable):
+        nagios_plugin_utils.calculate_counter_rate(
+            _previous(32, timestamp=100), 100, 42,
+        )
+
+
+def test_counter_detected_from_perfdata():
+    assert nagios_plugin_utils.result_is_counter(
+        'SNMP OK - 1234 | iso.3.6.1.2.1.2.2.1.10.1=1234c\n'
+    )
+    assert not nagios_plugin_utils.result_is_counter(
+        'SNMP OK - 1234 | iso.3.6.1.2.1.25.1.1.0=1234;;\n'
+    )
+    assert not nagios_plugin_utils.result_is_counter('SNMP OK - 1234')
+
+
+def test_get_counter_bits():
+    assert nagios_plugin_utils.get_counter_bits('auto', True) == (
+        nagios_plugin_utils.AUTO_COUNTER_BITS
+    )
+    assert nagios_plugin_utils.get_counter_bits('auto', False) is None
+    assert nagios_plugin_utils.get_counter_bits('none', True) is None
+    assert nagios_plugin_utils.get_counter_bits('64', False) == 64
+
+
+@pytest.mark.parametrize('previous,value,rate', [
+    (2 ** 32 - 5, 5, 1.0),
+    (2 ** 64 - 5, 5, 1.0),
+    # Increases across the 32 bit range
+    (2 ** 32 - 5, 2 ** 32 + 5, 1.0),
+    # A reset of a 64 bit counter which was below 2^32 can't be told apart
+    # from a 32 bit counter wrapping
+    (3 * 2 ** 30, 10, (2 ** 30 + 10) / 10.0),
+])
+def test_auto_counter_bits(previous, value, rate):
+    assert nagios_plugin_utils.calculate_counter_rate(
+        _previous(previous), 100, value,
+        nagios_plugin_utils.AUTO_COUNTER_BITS,
+    ) == rate
+
+
+@pytest.mark.parametrize('previous,value', [
+    # Previous value must have been from a 64 bit counter
+    (2 ** 32, 5),
+    (2 ** 32 + 2 ** 31, 2 ** 31),
+    (2 ** 40, 5),
+    # Wrap would be more than half of the 32 bit range
+    (2 ** 31 - 5, 5),
+])
+def test_auto_counter_bits_reset(previous, value):
+    with pytest.raises(nagios_plugin_utils.RateUnavailable):
+        nagios_plugin_utils.calculate_counter_rate(
+            _previous(previous), 100, value,
+            nagios_plugin_utils.AUTO_COUNTER_BITS,
+        )
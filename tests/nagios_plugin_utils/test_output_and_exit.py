@@ -75,3 +75,19 @@ def test_output_and_exit_bad_state(mock_print, exit):
     assert not result.startswith('SNMP RATE')
 
     exit.assert_called_once_with(nagios_plugin_utils.STATUS_UNKNOWN)
+
+
+@mock.patch('nagios_plugin_utils.timing.write_summary')
+@mock.patch('nagios_plugin_utils.timing.get_perfdata')
+@mock.patch('nagios_plugin_utils.sys.exit')
+@mock.patch('nagios_plugin_utils.print')
+def test_output_and_exit_with_timings(mock_print, exit, get_perfdata,
+                                      write_summary):
+    get_perfdata.return_value = ' timing_snmp_call=0.010000s'
+
+    nagios_plugin_utils.output_and_exit(42, ' value=42', 'OK', None, False)
+
+    mock_print_arg = mock_print.call_args_list[0][0][0]
+    # The check's own value stays last
+    assert mock_print_arg.endswith('| timing_snmp_call=0.010000s value=42')
+    assert write_summary.called
@@ -2,24 +2,30 @@ import mock
 import pytest
 
 import nagios_plugin_utils
-from tests.fakes import FakeOpener, FakeLogger
+from tests.fakes import FakeLogger
 
 
-@mock.patch('nagios_plugin_utils.run')
+def _previous(previous, stored):
+    def update_value(key, update):
+        new_entry, outcome = update(previous)
+        stored.append((key, new_entry))
+        return outcome
+    return update_value
+
+
+@mock.patch('nagios_plugin_utils.rate_store.update_value')
 @mock.patch('nagios_plugin_utils.time.time')
 @mock.patch('nagios_plugin_utils.sys.exit',
             side_effect=SystemExit)
 @mock.patch('nagios_plugin_utils.print')
-def test_ioerror_opening_previous(mock_print, mock_exit, mock_time, run):
+def test_no_previous(mock_print, mock_exit, mock_time, mock_update):
     mock_time.return_value = 100
     logger = FakeLogger()
 
     value = 42
     path = 'something'
-
-    opener = FakeOpener(read_error=IOError)
-    opener.write = mock.Mock()
-    nagios_plugin_utils.open = opener.open
+    stored = []
+    mock_update.side_effect = _previous(None, stored)
 
     with pytest.raises(SystemExit):
         nagios_plugin_utils.store_value_and_calculate_rate(
@@ -31,23 +37,26 @@ def test_ioerror_opening_previous(mock_print, mock_exit, mock_time, run):
     assert 'previous' in mock_print_arg
 
     mock_exit.assert_called_once_with(nagios_plugin_utils.STATUS_UNKNOWN)
+    # The value must still be stored for the next check
+    assert stored == [
+        (path, {'timestamp': 100, 'result': value, 'smoothed': None}),
+    ]
 
 
-@mock.patch('nagios_plugin_utils.run')
+@mock.patch('nagios_plugin_utils.rate_store.update_value')
 @mock.patch('nagios_plugin_utils.time.time')
 @mock.patch('nagios_plugin_utils.sys.exit',
             side_effect=SystemExit)
 @mock.patch('nagios_plugin_utils.print')
-def test_valueerror_opening_previous(mock_print, mock_exit, mock_time, run):
+def test_incomplete_opening_previous(mock_print, mock_exit, mock_time,
+                                     mock_update):
     mock_time.return_value = 100
     logger = FakeLogger()
 
     value = 42
     path = 'something'
 
-    opener = FakeOpener(read_error=ValueError)
-    opener.write = mock.Mock()
-    nagios_plugin_utils.open = opener.open
+    mock_update.side_effect = _previous({}, [])
 
     with pytest.raises(SystemExit):
         nagios_plugin_utils.store_value_and_calculate_rate(
@@ -55,32 +64,29 @@ def test_valueerror_opening_previous(mock_print, mock_exit, mock_time, run):
         )
 
     mock_print_arg = mock_print.call_args_list[0][0][0].lower()
-    assert 'previous data' in mock_print_arg
-    assert 'unknown' in mock_print_arg
+    assert 'previous' in mock_print_arg
+    assert 'incomplete' in mock_print_arg
     assert 'cannot calculate' in mock_print_arg
 
     mock_exit.assert_called_once_with(nagios_plugin_utils.STATUS_UNKNOWN)
 
 
-@mock.patch('nagios_plugin_utils.json')
-@mock.patch('nagios_plugin_utils.run')
+@mock.patch('nagios_plugin_utils.rate_store.update_value')
 @mock.patch('nagios_plugin_utils.time.time')
 @mock.patch('nagios_plugin_utils.sys.exit',
             side_effect=SystemExit)
 @mock.patch('nagios_plugin_utils.print')
-def test_incomplete_opening_previous(mock_print, mock_exit, mock_time, run,
-                                     mock_json):
+def test_too_fast(mock_print, mock_exit, mock_time, mock_update):
     mock_time.return_value = 100
     logger = FakeLogger()
 
     value = 42
     path = 'something'
 
-    opener = FakeOpener()
-    opener.write = mock.Mock()
-    nagios_plugin_utils.open = opener.open
-
-    mock_json.load.return_value = {}
+    mock_update.side_effect = _previous({
+        'timestamp': 100,
+        'result': 52,
+    }, [])
 
     with pytest.raises(SystemExit):
         nagios_plugin_utils.store_value_and_calculate_rate(
@@ -88,68 +94,54 @@ def test_incomplete_opening_previous(mock_print, mock_exit, mock_time, run,
         )
 
     mock_print_arg = mock_print.call_args_list[0][0][0].lower()
-    assert 'previous' in mock_print_arg
-    assert 'incomplete' in mock_print_arg
+    assert 'too recently' in mock_print_arg
     assert 'cannot calculate' in mock_print_arg
 
     mock_exit.assert_called_once_with(nagios_plugin_utils.STATUS_UNKNOWN)
 
 
-@mock.patch('nagios_plugin_utils.json')
-@mock.patch('nagios_plugin_utils.run')
+@mock.patch('nagios_plugin_utils.rate_store.update_value')
 @mock.patch('nagios_plugin_utils.time.time')
 @mock.patch('nagios_plugin_utils.sys.exit',
             side_effect=SystemExit)
 @mock.patch('nagios_plugin_utils.print')
-def test_too_fast(mock_print, mock_exit, mock_time, run, mock_json):
+def test_counter_reset(mock_print, mock_exit, mock_time, mock_update):
     mock_time.return_value = 100
     logger = FakeLogger()
 
-    value = 42
-    path = 'something'
-
-    opener = FakeOpener()
-    opener.write = mock.Mock()
-    nagios_plugin_utils.open = opener.open
-
-    mock_json.load.return_value = {
-        'timestamp': 100,
-        'result': 52,
-    }
+    mock_update.side_effect = _previous({
+        'timestamp': 90,
+        'result': 3000000000,
+    }, [])
 
     with pytest.raises(SystemExit):
         nagios_plugin_utils.store_value_and_calculate_rate(
-            logger, value, path,
+            logger, 5, 'something', counter_bits=64,
         )
 
     mock_print_arg = mock_print.call_args_list[0][0][0].lower()
-    assert 'too recently' in mock_print_arg
+    assert 'reset' in mock_print_arg
     assert 'cannot calculate' in mock_print_arg
 
     mock_exit.assert_called_once_with(nagios_plugin_utils.STATUS_UNKNOWN)
 
 
-@mock.patch('nagios_plugin_utils.json')
-@mock.patch('nagios_plugin_utils.run')
+@mock.patch('nagios_plugin_utils.rate_store.update_value')
 @mock.patch('nagios_plugin_utils.time.time')
 @mock.patch('nagios_plugin_utils.sys.exit',
             side_effect=SystemExit)
 @mock.patch('nagios_plugin_utils.print')
-def test_get_good_rate(mock_print, mock_exit, mock_time, run, mock_json):
+def test_get_good_rate(mock_print, mock_exit, mock_time, mock_update):
     mock_time.return_value = 100
     logger = FakeLogger()
 
     value = 42
     path = 'something'
 
-    opener = FakeOpener()
-    opener.write = mock.Mock()
-    nagios_plugin_utils.open = opener.open
-
-    mock_json.load.return_value = {
+    mock_update.side_effect = _previous({
         'timestamp': 90,
         'result': 32,
-    }
+    }, [])
 
     expected = 1.0
 
@@ -161,3 +153,29 @@ def test_get_good_rate(mock_print, mock_exit, mock_time, run, mock_json):
     assert mock_print.call_count == 0
 
     assert result == expected
+
+
+@mock.patch('nagios_plugin_utils.rate_store.update_value')
+@mock.patch('nagios_plugin_utils.time.time')
+@mock.patch('nagios_plugin_utils.sys.exit',
+            side_effect=SystemExit)
+@mock.patch('nagios_plugin_utils.print')
+def test_smoothed_rate(mock_print, mock_exit, mock_time, mock_update):
+    mock_time.return_value = 100
+    logger = FakeLogger()
+
+    path = 'something'
+    stored = []
+    mock_update.side_effect = _previous({
+        'timestamp': 90,
+        'result': 32,
+        'smoothed': 3.0,
+    }, stored)
+
+    result = nagios_plugin_utils.store_value_and_calculate_rate(
+        logger, 42, path, smoothing=0.25,
+    )
+
+    # 0.25 * 1.0 + 0.75 * 3.0
+    assert result == 2.5
+    assert stored[0][1]['smoothed'] == 2.5
@@ -0,0 +1,32 @@
+import nagios_utils
+
+
+def test_statuses_for_several_hosts():
+    status = {
+        'hoststatus': [
+            {'host_name': 'a', 'current_state': '0'},
+            {'host_name': 'b', 'current_state': '1'},
+            {'host_name': 'c', 'current_state': '0'},
+        ],
+        'servicestatus': [
+            {'host_name': 'a', 'service_description': 'ok',
+             'current_state': '0'},
+            {'host_name': 'a', 'service_description': 'bad',
+             'current_state': '2'},
+            {'host_name': 'b', 'service_description': 'ok',
+             'current_state': '0'},
+            {'host_name': 'c', 'service_description': 'bad',
+             'current_state': '2'},
+        ],
+    }
+
+    result = nagios_utils.get_host_statuses_with_services(['a', 'b'], status)
+
+    assert result == {
+        'a': {'host_state': '0', 'healthy': ['ok'], 'failing': ['bad']},
+        'b': {'host_state': '1', 'healthy': ['ok'], 'failing': []},
+    }
+    for host in 'a', 'b':
+        assert result[host] == nagios_utils.get_host_status_with_services(
+            host, status,
+        )
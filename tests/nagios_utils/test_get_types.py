@@ -0,0 +1,76 @@
+import json
+import os
+
+import mock
+import pytest
+
+import nagios_utils
+from tests.fakes import FakeLogger
+
+TARGET_TYPE_CONFIGURATION = (
+    'define hostgroup {{\n'
+    '  hostgroup_name target_type:{name}\n'
+    '  alias {name}\n'
+    '}}\n'
+)
+
+
+@pytest.fixture
+def types_path(tmpdir):
+    with mock.patch.dict(nagios_utils.TYPE_PATHS, {'target': str(tmpdir)}):
+        yield tmpdir
+    nagios_utils.TYPE_REGISTRY_CACHE.clear()
+
+
+def _write_registry(types_path, types, mtime):
+    registry = types_path.join(nagios_utils.TYPE_REGISTRY_FILE)
+    registry.write(json.dumps(types))
+    os.utime(str(registry), (mtime, mtime))
+
+
+def test_types_from_registry(types_path):
+    _write_registry(types_path, ['web', 'db'], 1000)
+    logger = FakeLogger()
+
+    assert nagios_utils.get_types('target', logger) == ['db', 'web']
+    assert nagios_utils.type_exists('target', 'web', logger)
+    assert not nagios_utils.type_exists('target', 'cache', logger)
+
+
+def test_registry_loaded_on_change(types_path):
+    _write_registry(types_path, ['web'], 1000)
+    logger = FakeLogger()
+
+    with mock.patch('nagios_utils.json.load',
+                    wraps=nagios_utils.json.load) as load:
+        assert nagios_utils.type_exists('target', 'web', logger)
+        assert nagios_utils.type_exists('target', 'web', logger)
+        assert load.call_count == 1
+
+        _write_registry(types_path, ['web', 'db'], 1010)
+        assert nagios_utils.type_exists('target', 'db', logger)
+        assert load.call_count == 2
+
+
+def test_types_found_without_registry(types_path):
+    for name in ('web', 'db'):
+        types_path.join(name + '.cfg').write(
+            TARGET_TYPE_CONFIGURATION.format(name=name),
+        )
+    types_path.join('web.json').write('{}')
+    logger = FakeLogger()
+
+    assert nagios_utils.get_types('target', logger) == ['db', 'web']
+    assert nagios_utils.type_exists('target', 'db', logger)
+
+
+def test_types_from_configuration():
+    assert nagios_utils.get_types_from_configuration('group', [
+        'define hostgroup {',
+        '  hostgroup_name group_type:web_servers',
+        '}',
+    ]) == ['web_servers']
+    assert nagios_utils.get_types_from_configuration(
+        'target',
+        TARGET_TYPE_CONFIGURATION.format(name='web').splitlines(),
+    ) == ['web']
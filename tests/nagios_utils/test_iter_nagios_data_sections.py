@@ -0,0 +1,72 @@
+import nagios_utils
+
+
+STATUS = (
+    'info {\n'
+    '\tversion=4.3.4\n'
+    '\t}\n'
+    '\n'
+    'hoststatus {\n'
+    '\thost_name=host1\n'
+    '\tcurrent_state=0\n'
+    '\t}\n'
+    '\n'
+    'servicestatus {\n'
+    '\thost_name=host1\n'
+    '\tservice_description=svc:a\n'
+    '\tperformance_data=a=1;2=3\n'
+    '\t}\n'
+    '\n'
+    'servicestatus {\n'
+    '\thost_name=host2\n'
+    '\tservice_description=svc:b\n'
+    '\t}\n'
+)
+
+
+def test_only_requested_sections(tmpdir):
+    status = tmpdir.join('status.dat')
+    status.write(STATUS)
+
+    sections = list(nagios_utils.iter_nagios_data_sections(
+        str(status), '=', 'servicestatus',
+    ))
+
+    assert sections == [
+        {
+            'host_name': 'host1',
+            'service_description': 'svc:a',
+            'performance_data': 'a=1;2=3',
+        },
+        {'host_name': 'host2', 'service_description': 'svc:b'},
+    ]
+    assert sections == nagios_utils.parse_nagios_data_file(
+        str(status), '=',
+    )['servicestatus']
+
+
+def test_filter_by_host(tmpdir):
+    status = tmpdir.join('status.dat')
+    status.write(STATUS)
+
+    sections = list(nagios_utils.iter_nagios_data_sections(
+        str(status), '=', 'servicestatus', host_names={'host2', 'host3'},
+    ))
+
+    assert sections == [
+        {'host_name': 'host2', 'service_description': 'svc:b'},
+    ]
+
+
+def test_filter_by_service(tmpdir):
+    status = tmpdir.join('status.dat')
+    status.write(STATUS)
+
+    sections = list(nagios_utils.iter_nagios_data_sections(
+        str(status), '=', 'servicestatus', host_names={'host1', 'host2'},
+        service_descriptions={'svc:b'},
+    ))
+
+    assert sections == [
+        {'host_name': 'host2', 'service_description': 'svc:b'},
+    ]
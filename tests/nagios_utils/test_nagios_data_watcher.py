@@ -0,0 +1,161 @@
+import os
+
+import mock
+
+import nagios_utils
+
+
+STATUS_TEMPLATE = (
+    'hoststatus {{\n'
+    '\thost_name=host1\n'
+    '\tcurrent_state={state}\n'
+    '\t}}\n'
+)
+
+
+def _write_status(path, state, mtime):
+    path.write(STATUS_TEMPLATE.format(state=state))
+    os.utime(str(path), (mtime, mtime))
+
+
+def test_refresh_parses_only_on_change(tmpdir):
+    status = tmpdir.join('status.dat')
+    _write_status(status, '0', 1000)
+    watcher = nagios_utils.NagiosDataWatcher(str(status), separator='=')
+
+    with mock.patch('nagios_utils.parse_nagios_data_file',
+                    wraps=nagios_utils.parse_nagios_data_file) as parse:
+        assert watcher.refresh()
+        assert not watcher.refresh()
+        assert parse.call_count == 1
+
+        _write_status(status, '1', 1010)
+        assert watcher.refresh()
+        assert parse.call_count == 2
+
+    assert watcher.data['hoststatus'][0]['current_state'] == '1'
+
+
+@mock.patch('nagios_utils.time.sleep')
+def test_wait_for_change_times_out(mock_sleep, tmpdir):
+    status = tmpdir.join('status.dat')
+    _write_status(status, '0', 1000)
+    watcher = nagios_utils.NagiosDataWatcher(str(status), separator='=')
+    watcher.refresh()
+
+    times = iter([0, 0, 0.5, 1.5, 2.5])
+    with mock.patch('nagios_utils.time.time', side_effect=lambda: next(times)):
+        assert not watcher.wait_for_change(2)
+
+
+@mock.patch('nagios_utils.time.sleep')
+def test_wait_for_change_wakes(mock_sleep, tmpdir):
+    status = tmpdir.join('status.dat')
+    _write_status(status, '0', 1000)
+    watcher = nagios_utils.NagiosDataWatcher(str(status), separator='=')
+    watcher.refresh()
+
+    mock_sleep.side_effect = lambda _: _write_status(status, '1', 1010)
+
+    assert watcher.wait_for_change(30)
+    assert mock_sleep.call_count == 1
+    assert watcher.data['hoststatus'][0]['current_state'] == '1'
+
+
+def _write_objects_cache(path, hosts, mtime):
+    path.write(''.join(
+        'define host {{\n'
+        '\thost_name\t{host}\n'
+        '\t}}\n'
+        'define service {{\n'
+        '\thost_name\t{host}\n'
+        '\tservice_description\ttype_instances:SNMPTRAP trap\n'
+        '\t}}\n'.format(host=host)
+        for host in hosts
+    ))
+    os.utime(str(path), (mtime, mtime))
+
+
+@mock.patch('nagios_utils.time.sleep')
+def test_wait_for_host_configuration(mock_sleep, tmpdir):
+    objects_cache = tmpdir.join('objects.cache')
+    _write_objects_cache(objects_cache, ['host1'], 1000)
+    # Nagios loads the new host during the second wait
+    loads = iter([
+        lambda: None,
+        lambda: _write_objects_cache(objects_cache, ['host1', 'host2'], 1010),
+    ])
+    mock_sleep.side_effect = lambda _: next(loads)()
+
+    with mock.patch.object(nagios_utils, 'NAGIOS_CONFIG_CACHE_FILE',
+                           str(objects_cache)):
+        with mock.patch.object(nagios_utils, 'NAGIOS_CONFIGURATION',
+                               {'host': []}):
+            assert nagios_utils.wait_for_host_configuration('host2', 30)
+            services = nagios_utils.get_configured_services_for_host('host2')
+
+    assert mock_sleep.call_count == 2
+    assert [service['service_description'] for service in services] == [
+        'type_instances:SNMPTRAP trap',
+    ]
+
+
+@mock.patch('nagios_utils.time.sleep')
+def test_wait_for_host_configuration_times_out(mock_sleep, tmpdir):
+    objects_cache = tmpdir.join('objects.cache')
+    _write_objects_cache(objects_cache, ['host1'], 1000)
+    configuration = {'host': []}
+
+    times = iter([0, 0, 1, 2, 3])
+    with mock.patch.object(nagios_utils, 'NAGIOS_CONFIG_CACHE_FILE',
+                           str(objects_cache)):
+        with mock.patch.object(nagios_utils, 'NAGIOS_CONFIGURATION',
+                               configuration):
+            with mock.patch('nagios_utils.time.time',
+                            side_effect=lambda: next(times)):
+                assert not nagios_utils.wait_for_host_configuration(
+                    'host2', 2,
+                )
+            assert nagios_utils.NAGIOS_CONFIGURATION is configuration
+
+
+def test_refresh_shares_snapshot(tmpdir):
+    status = tmpdir.join('status.dat')
+    snapshot = tmpdir.join('status_snapshot.json')
+    _write_status(status, '0', 1000)
+    # As the watchers of two separate notify_cloudify processes
+    first, second = [
+        nagios_utils.NagiosDataWatcher(str(status), separator='=',
+                                       snapshot_path=str(snapshot))
+        for _ in range(2)
+    ]
+
+    with mock.patch('nagios_utils.parse_nagios_data_file',
+                    wraps=nagios_utils.parse_nagios_data_file) as parse:
+        assert first.refresh()
+        assert second.refresh()
+        assert parse.call_count == 1
+        assert second.data == first.data
+
+        _write_status(status, '1', 1010)
+        assert second.refresh()
+        assert first.refresh()
+        assert parse.call_count == 2
+
+    assert first.data['hoststatus'][0]['current_state'] == '1'
+    # No temporary snapshot files are left behind
+    assert sorted(path.basename for path in tmpdir.listdir()) == [
+        'status.dat', 'status_snapshot.json',
+    ]
+
+
+def test_refresh_without_writable_snapshot(tmpdir):
+    status = tmpdir.join('status.dat')
+    _write_status(status, '0', 1000)
+    watcher = nagios_utils.NagiosDataWatcher(
+        str(status), separator='=',
+        snapshot_path=str(tmpdir.join('missing', 'status_snapshot.json')),
+    )
+
+    assert watcher.refresh()
+    assert watcher.data['hoststatus'][0]['current_state'] == '0'
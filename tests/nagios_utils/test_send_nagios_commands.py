@@ -0,0 +1,33 @@
+import mock
+
+import nagios_utils
+
+
+@mock.patch('nagios_utils.time.time', return_value=123)
+def test_commands_batched(mock_time, tmpdir):
+    command_file = tmpdir.join('nagios.cmd')
+
+    with mock.patch('nagios_utils.NAGIOS_EXTERNAL_COMMAND_FILE',
+                    str(command_file)):
+        nagios_utils.recheck_all_failing_checks_for_hosts({
+            'a': {'host_state': '1', 'healthy': [], 'failing': ['x']},
+            'b': {'host_state': '0', 'healthy': [], 'failing': ['y', 'z']},
+        })
+
+    lines = command_file.read().splitlines()
+    assert sorted(lines) == sorted([
+        '[123] SCHEDULE_HOST_CHECK;a;126',
+        '[123] SCHEDULE_SVC_CHECK;a;x;126',
+        '[123] SCHEDULE_SVC_CHECK;b;y;126',
+        '[123] SCHEDULE_SVC_CHECK;b;z;126',
+    ])
+
+
+def test_no_commands_no_write(tmpdir):
+    command_file = tmpdir.join('nagios.cmd')
+
+    with mock.patch('nagios_utils.NAGIOS_EXTERNAL_COMMAND_FILE',
+                    str(command_file)):
+        nagios_utils.send_nagios_commands([])
+
+    assert not command_file.check()
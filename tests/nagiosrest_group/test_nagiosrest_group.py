@@ -0,0 +1,140 @@
+import json
+import os
+
+import mock
+import pytest
+
+import group_index
+import nagiosrest_group
+from tests.fakes import FakeLogger, patch_group_dirs
+
+
+@mock.patch('nagiosrest_group.run')
+def test_update_node_group_memberships(run, tmpdir):
+    logger = FakeLogger()
+    members = tmpdir.join('groups', 'members')
+
+    with patch_group_dirs(tmpdir):
+        with mock.patch.object(nagiosrest_group, 'BASE_OBJECTS_DIR',
+                               str(tmpdir)):
+            nagiosrest_group.update_node_group_memberships(
+                logger, 't1',
+                added=[
+                    ('dep1', 'node1', 'web', 'g1'),
+                    ('dep1', 'node2', 'web', 'g1'),
+                    ('dep1', 'node1', 'db', 'g2'),
+                ],
+            )
+            nagiosrest_group.update_node_group_memberships(
+                logger, 't1',
+                removed=[
+                    ('dep1', 'node1', 'web', 'g1'),
+                    ('dep1', 'node3', 'web', 'g1'),
+                ],
+            )
+
+        assert not run.called
+        assert members.join('t1', 'web', 'g1', 'dep1').listdir() == [
+            members.join('t1', 'web', 'g1', 'dep1', 'node2'),
+        ]
+        assert oct(os.stat(
+            str(members.join('t1', 'db', 'g2', 'dep1')),
+        ).st_mode & 0o777) == '0750'
+        assert group_index.get_group_members('t1', 'web', 'g1') == {
+            'tenant:t1/deployment:dep1/node:node2',
+        }
+        assert group_index.get_group_members('t1', 'db', 'g2') == {
+            'tenant:t1/deployment:dep1/node:node1',
+        }
+
+
+@pytest.mark.parametrize('tenant_changed,deployed,reloaded', [
+    (False, [False, False], False),
+    (True, [False, False], True),
+    (False, [True, False], True),
+    (False, [False, True], True),
+])
+@mock.patch.object(nagiosrest_group, 'trigger_nagios_reload')
+@mock.patch.object(nagiosrest_group, 'deploy_configuration_file')
+@mock.patch.object(nagiosrest_group, 'configure_tenant_group')
+@mock.patch.object(nagiosrest_group, 'group_index')
+@mock.patch.object(nagiosrest_group, 'deploy_file')
+@mock.patch.object(nagiosrest_group, 'make_config_subdir')
+def test_group_reload_only_when_changed(make_config_subdir, deploy_file,
+                                        index, configure_tenant_group,
+                                        deploy, trigger_reload, tmpdir,
+                                        tenant_changed, deployed, reloaded):
+    group_config = tmpdir.join('web.json')
+    group_config.write(json.dumps({'check_configuration': {}}))
+    configure_tenant_group.return_value = tenant_changed
+    deploy.side_effect = deployed
+
+    with mock.patch.object(nagiosrest_group, 'get_group_config_location',
+                           return_value=str(group_config)):
+        nagiosrest_group.create_group_instance(FakeLogger(), 'g1', 'web',
+                                               't1', 'dep1')
+
+    assert deploy.call_count == 2
+    for call in deploy.call_args_list:
+        assert call[1]['reload_service'] is False
+    assert trigger_reload.called == reloaded
+
+
+@pytest.mark.parametrize('parents', [
+    'web',
+    5,
+    None,
+    ['web'],
+    [['web']],
+    [['web', 'g1', 'extra']],
+    [['web', 5]],
+    [{'web': 'g1'}],
+])
+def test_check_group_parents_malformed(parents, tmpdir):
+    with patch_group_dirs(tmpdir):
+        with pytest.raises(ValueError) as err:
+            nagiosrest_group.check_group_parents('t1', 'db', 'g2', parents)
+
+    assert 'Parents must be a list of [group type, group name]' in str(
+        err.value)
+
+
+def test_check_group_parents(tmpdir):
+    with patch_group_dirs(tmpdir):
+        group_index.add_group('t1', 'web', 'g1')
+
+        nagiosrest_group.check_group_parents('t1', 'db', 'g2', [])
+        nagiosrest_group.check_group_parents('t1', 'db', 'g2',
+                                             [['web', 'g1']])
+        with pytest.raises(ValueError) as err:
+            nagiosrest_group.check_group_parents('t1', 'db', 'g2',
+                                                 [['web', 'g3']])
+    assert 'does not exist' in str(err.value)
+
+
+@pytest.mark.parametrize('membership', [
+    ('dep1', 'node1', 'web', '.'),
+    ('dep1', '.', 'web', 'g1'),
+    ('..', 'node1', 'web', 'g1'),
+    ('dep1', 'node1', '', 'g1'),
+    ('dep1', 'node1', 'web', 'g1/g2'),
+    ('dep1', 5, 'web', 'g1'),
+])
+def test_bad_memberships_rejected(membership, tmpdir):
+    with patch_group_dirs(tmpdir):
+        with mock.patch.object(nagiosrest_group, 'BASE_OBJECTS_DIR',
+                               str(tmpdir)):
+            with pytest.raises(ValueError):
+                nagiosrest_group.update_node_group_memberships(
+                    FakeLogger(), 't1',
+                    added=[('dep1', 'node1', 'web', 'g1'), membership],
+                )
+
+    # Nothing is applied if any membership is bad
+    assert tmpdir.listdir() == []
+
+
+def test_dotted_names_allowed():
+    nagiosrest_group.check_group_memberships([
+        ('dep..1', 'node.1', 'web..1', '..g1'),
+    ])
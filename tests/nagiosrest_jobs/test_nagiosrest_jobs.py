@@ -0,0 +1,169 @@
+import json
+
+import mock
+import pytest
+
+import nagiosrest_jobs
+import utils
+
+
+@pytest.fixture
+def queue(tmpdir):
+    with mock.patch.object(nagiosrest_jobs, 'logging_utils'):
+        with mock.patch.object(nagiosrest_jobs.JobQueue, '_start_worker'):
+            yield nagiosrest_jobs.JobQueue(jobs_path=str(tmpdir))
+
+
+@mock.patch('utils._trigger_nagios_reload')
+def test_deferred_reloads(trigger_reload):
+    with utils.deferred_reloads():
+        utils.trigger_nagios_reload()
+        utils.trigger_nagios_reload(set_group=True)
+        utils.trigger_nagios_reload()
+        assert not trigger_reload.called
+
+    trigger_reload.assert_called_once_with(True)
+    utils.trigger_nagios_reload()
+    assert trigger_reload.call_count == 2
+
+
+@mock.patch('utils._trigger_nagios_reload')
+def test_no_reload_without_changes(trigger_reload):
+    with utils.deferred_reloads():
+        pass
+
+    assert not trigger_reload.called
+
+
+def test_run_now():
+    queue = nagiosrest_jobs.JobQueue(jobs_path='/nonexistent')
+    finish = mock.Mock(return_value='finished')
+
+    assert queue.run_now(lambda: 'applied', finish) == 'finished'
+    assert queue.run_now(lambda: ('invalid', 400), finish) == (
+        'invalid', 400,
+    )
+    assert finish.call_count == 1
+
+
+def test_unknown_job(queue):
+    assert queue.get('4e1243bd-22c6-4f8f-a8a7-34cb6ad9b6a1') is None
+    assert queue.get('../../etc/passwd') is None
+
+
+@mock.patch('utils._trigger_nagios_reload')
+def test_batch_reloads_once(trigger_reload, queue):
+    order = []
+
+    def change(name):
+        def apply():
+            order.append(name)
+            utils.trigger_nagios_reload()
+            return '{name} applied\n'.format(name=name)
+        return apply
+
+    def finish():
+        # Only once nagios has been reloaded
+        order.append('finish')
+        assert trigger_reload.called
+        return 'finished\n'
+
+    first = queue.submit('first', change('first'), finish)
+    second = queue.submit('second', change('second'))
+    assert queue.get(first)['state'] == nagiosrest_jobs.QUEUED
+
+    assert queue.run_batch() == 2
+
+    assert order == ['first', 'second', 'finish']
+    trigger_reload.assert_called_once_with(False)
+    first_job = queue.get(first)
+    assert first_job['state'] == nagiosrest_jobs.SUCCEEDED
+    assert first_job['status_code'] == 200
+    assert first_job['message'] == 'finished\n'
+    assert queue.get(second)['message'] == 'second applied\n'
+    assert queue.run_batch(block=False) == 0
+
+
+@mock.patch('utils._trigger_nagios_reload')
+def test_failed_jobs(trigger_reload, queue):
+    finish = mock.Mock()
+
+    def broken():
+        raise RuntimeError('broken')
+
+    invalid = queue.submit('invalid', lambda: ('Not valid\n', 400), finish)
+    failed = queue.submit('failed', broken, finish)
+    succeeded = queue.submit('succeeded', lambda: 'done\n')
+
+    assert queue.run_batch() == 3
+
+    assert not finish.called
+    invalid_job = queue.get(invalid)
+    assert invalid_job['state'] == nagiosrest_jobs.FAILED
+    assert invalid_job['status_code'] == 400
+    failed_job = queue.get(failed)
+    assert failed_job['state'] == nagiosrest_jobs.FAILED
+    assert failed_job['status_code'] == 500
+    assert 'broken' in failed_job['message']
+    assert queue.get(succeeded)['state'] == nagiosrest_jobs.SUCCEEDED
+
+
+def test_batch_size(queue):
+    queue.max_batch_size = 2
+    for number in range(3):
+        queue.submit(str(number), lambda: 'done\n')
+
+    assert queue.run_batch() == 2
+    assert queue.run_batch() == 1
+
+
+@mock.patch.object(nagiosrest_jobs, 'JOB_EXPIRY', -1)
+def test_finished_jobs_expire(queue):
+    old = queue.submit('old', lambda: 'done\n')
+
+    queue.submit('new', lambda: 'done\n')
+
+    assert queue.get(old) is None
+
+
+def test_abandoned_jobs_fail(queue):
+    finished_id = queue.submit('finished', lambda: 'done\n')
+    queue.run_batch()
+    job_id = queue.submit('lost', lambda: 'done\n')
+
+    # As if queued by a worker process which has since exited
+    with mock.patch.object(nagiosrest_jobs, 'process_running',
+                           return_value=False):
+        job = queue.get(job_id)
+
+    assert job['state'] == nagiosrest_jobs.FAILED
+    assert job['status_code'] == 500
+    assert 'retry' in job['message']
+    assert queue.get(finished_id)['state'] == nagiosrest_jobs.SUCCEEDED
+
+
+def test_abandoned_jobs_fail_when_worker_starts(tmpdir):
+    with mock.patch.object(nagiosrest_jobs, 'logging_utils'):
+        with mock.patch.object(nagiosrest_jobs.threading, 'Thread'):
+            old_queue = nagiosrest_jobs.JobQueue(jobs_path=str(tmpdir))
+            abandoned = old_queue.submit('abandoned', lambda: 'done\n')
+            with mock.patch.object(nagiosrest_jobs.os, 'getpid',
+                                   return_value=-1):
+                current = old_queue.submit('current', lambda: 'done\n')
+            new_queue = nagiosrest_jobs.JobQueue(jobs_path=str(tmpdir))
+
+            with open(str(tmpdir.join(abandoned + '.json'))) as job_file:
+                old_pid = json.load(job_file)['pid']
+
+            with mock.patch.object(nagiosrest_jobs, 'process_running',
+                                   side_effect=lambda pid: pid != old_pid):
+                new_queue._start_worker()
+
+    states = dict(
+        (job_file.purebasename, json.loads(job_file.read())['state'])
+        for job_file in tmpdir.listdir()
+    )
+    assert states == {
+        abandoned: nagiosrest_jobs.FAILED,
+        current: nagiosrest_jobs.QUEUED,
+    }
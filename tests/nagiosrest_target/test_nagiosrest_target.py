@@ -0,0 +1,29 @@
+import mock
+import pytest
+
+import nagiosrest_target
+from tests.fakes import FakeLogger
+
+
+@pytest.mark.parametrize('tenant_changed,deployed,reloaded', [
+    (False, [False, False, False, False], False),
+    (True, [False, False, False, False], True),
+    (False, [False, False, False, True], True),
+])
+@mock.patch.object(nagiosrest_target, 'trigger_nagios_reload')
+@mock.patch.object(nagiosrest_target, 'make_config_subdir')
+@mock.patch.object(nagiosrest_target, 'deploy_configuration_file')
+@mock.patch.object(nagiosrest_target, 'configure_tenant_group')
+def test_reload_only_when_changed(configure_tenant_group, deploy,
+                                  make_config_subdir, trigger_reload,
+                                  tenant_changed, deployed, reloaded):
+    configure_tenant_group.return_value = tenant_changed
+    deploy.side_effect = deployed
+
+    nagiosrest_target.create_target(FakeLogger(), 'node1_abc123',
+                                    '192.0.2.1', 't1', 'dep1', 'web')
+
+    assert deploy.call_count == 4
+    for call in deploy.call_args_list:
+        assert call[1]['reload_service'] is False
+    assert trigger_reload.called == reloaded
@@ -0,0 +1,186 @@
+from contextlib import contextmanager
+import os
+
+import mock
+
+import tests.links.notify_cloudify as notify_cloudify
+
+
+from tests.fakes import FakeLogger
+
+
+def _reaction(tmpdir, target, service='svc'):
+    return {
+        'target': target,
+        'service': service,
+        'output': 'HIGH CRITICAL',
+        'oid': None,
+        'lockfile_path': str(tmpdir.join('{}_{}'.format(target, service))),
+    }
+
+
+def _patch_paths(tmpdir):
+    base = str(tmpdir.join('coalesce'))
+    return (
+        mock.patch.object(notify_cloudify, 'COALESCE_BASE', base),
+        mock.patch.object(notify_cloudify, 'COALESCE_LEADER_PATH',
+                          os.path.join(base, '{key}.leader')),
+        mock.patch.object(notify_cloudify, 'COALESCE_PENDING_PATH',
+                          os.path.join(base, '{key}.pending')),
+        mock.patch.object(notify_cloudify, 'COALESCE_LOCK_PATH',
+                          os.path.join(base, '{key}.lock')),
+        # Every process in these tests is still running
+        mock.patch.object(notify_cloudify, 'pid_from_lockfile_is_running',
+                          return_value=True),
+    )
+
+
+@contextmanager
+def _coalescing(tmpdir):
+    patches = _patch_paths(tmpdir)
+    with patches[0], patches[1], patches[2], patches[3], patches[4]:
+        yield
+
+
+def _as_process(pid):
+    return mock.patch.object(notify_cloudify.os, 'getpid', return_value=pid)
+
+
+def _register(reaction, pid=100):
+    # As a notify_cloudify process reacting to a check
+    with _as_process(pid):
+        notify_cloudify.acquire_lock(reaction['lockfile_path'])
+        return notify_cloudify.register_for_coalescing('key', reaction)
+
+
+def test_first_registration_leads(tmpdir):
+    with _coalescing(tmpdir):
+        assert _register(_reaction(tmpdir, 'a'))
+        # The leader is still running, so later reactions are followers
+        follower = _reaction(tmpdir, 'b')
+        assert not _register(follower, pid=101)
+        # which hand their reaction over to the leader
+        assert not os.path.exists(follower['lockfile_path'])
+
+        with _as_process(100):
+            collected = notify_cloudify.collect_coalesced_reactions('key')
+
+    assert [item['target'] for item in collected] == ['a', 'b']
+
+
+def test_collect_deduplicates(tmpdir):
+    with _coalescing(tmpdir):
+        _register(_reaction(tmpdir, 'a'))
+        # e.g. left by a leader which crashed before collecting it
+        duplicate = _reaction(tmpdir, 'a')
+        duplicate['lockfile_path'] += '_old'
+        _register(duplicate, pid=101)
+        _register(_reaction(tmpdir, 'a', 'x'), pid=102)
+
+        with _as_process(100):
+            collected = notify_cloudify.collect_coalesced_reactions('key')
+
+    assert [(item['target'], item['service']) for item in collected] == [
+        ('a', 'svc'), ('a', 'x'),
+    ]
+
+
+def test_collect_releases_leadership(tmpdir):
+    with _coalescing(tmpdir):
+        _register(_reaction(tmpdir, 'a'))
+        with _as_process(100):
+            notify_cloudify.collect_coalesced_reactions('key')
+
+        # A reaction arriving after collection must lead a new round
+        assert _register(_reaction(tmpdir, 'b'), pid=101)
+        with _as_process(101):
+            collected = notify_cloudify.collect_coalesced_reactions('key')
+
+    assert [item['target'] for item in collected] == ['b']
+
+
+def test_collect_already_claimed(tmpdir):
+    with _coalescing(tmpdir):
+        _register(_reaction(tmpdir, 'a'))
+        os.unlink(notify_cloudify.COALESCE_PENDING_PATH.format(key='key'))
+
+        with _as_process(100):
+            assert notify_cloudify.collect_coalesced_reactions('key') == []
+        # Leadership is still given up
+        assert _register(_reaction(tmpdir, 'b'), pid=101)
+
+
+def test_two_leaders(tmpdir):
+    first, second, third, repeat = [
+        _reaction(tmpdir, target) for target in ('a', 'b', 'c', 'b')
+    ]
+    logger = FakeLogger()
+
+    with _coalescing(tmpdir):
+        assert _register(first, pid=100)
+        assert not _register(second, pid=101)
+        with _as_process(100):
+            first_batch = notify_cloudify.collect_coalesced_reactions('key')
+
+        # Before the first leader takes over the lock for the second
+        # reaction, another process reacts to the same check, and another
+        # leads a new round.
+        with _as_process(102):
+            notify_cloudify.acquire_lock(repeat['lockfile_path'])
+        assert _register(third, pid=103)
+
+        with _as_process(100):
+            with mock.patch.object(notify_cloudify,
+                                   'collect_coalesced_reactions',
+                                   return_value=first_batch):
+                claimed = notify_cloudify.claim_coalesced_reactions(
+                    logger, 'key', first['lockfile_path'],
+                )
+        with _as_process(102):
+            assert not notify_cloudify.register_for_coalescing('key', repeat)
+        with _as_process(103):
+            second_claimed = notify_cloudify.claim_coalesced_reactions(
+                logger, 'key', third['lockfile_path'],
+            )
+
+    assert [item['target'] for item in first_batch] == ['a', 'b']
+    # Each check's reaction is run exactly once
+    assert [item['target'] for item in claimed] == ['a']
+    assert logger.string_appears_in('info', ('reaction for b handed back',
+                                             'process 102'))
+    assert [item['target'] for item in second_claimed] == ['c', 'b']
+    assert notify_cloudify.get_pid_from_lockfile(
+        repeat['lockfile_path']) == 103
+
+
+def test_claim_takes_over_handed_over_locks(tmpdir):
+    leader, follower = _reaction(tmpdir, 'a'), _reaction(tmpdir, 'b')
+
+    with _coalescing(tmpdir):
+        _register(leader, pid=100)
+        _register(follower, pid=101)
+        with _as_process(100):
+            claimed = notify_cloudify.claim_coalesced_reactions(
+                FakeLogger(), 'key', leader['lockfile_path'],
+            )
+
+    assert [item['target'] for item in claimed] == ['a', 'b']
+    assert notify_cloudify.get_pid_from_lockfile(
+        follower['lockfile_path']) == 100
+
+
+def test_group_reactions_by_workflow():
+    def reaction(target, parameters):
+        return {
+            'target': target,
+            'workflow': {'workflow_id': 'heal', 'parameters': parameters},
+        }
+
+    first = reaction('node_1', {'node_instance_id': 'node_1'})
+    second = reaction('node_2', {'node_instance_id': 'node_2'})
+    scale_a = reaction('node_3', {'node': 'node', 'delta': 1})
+    scale_b = reaction('node_4', {'delta': 1, 'node': 'node'})
+
+    assert notify_cloudify.group_reactions_by_workflow(
+        [first, scale_a, second, scale_b],
+    ) == [[first], [scale_a, scale_b], [second]]
@@ -0,0 +1,45 @@
+import tests.links.notify_cloudify as notify_cloudify
+
+
+def _workflow(workflow_id='scale', parameters=None):
+    return {
+        'workflow_id': workflow_id,
+        'parameters': parameters or {'delta': 1},
+        'allow_custom_parameters': False,
+        'force': False,
+    }
+
+
+def test_same_reaction_same_key():
+    first = notify_cloudify.get_coalescing_key('tenant', 'dep', _workflow())
+    second = notify_cloudify.get_coalescing_key('tenant', 'dep', _workflow())
+
+    assert first == second
+
+
+def test_parameter_order_ignored():
+    first = notify_cloudify.get_coalescing_key(
+        'tenant', 'dep', _workflow(parameters={'a': 1, 'b': 2}),
+    )
+    second = notify_cloudify.get_coalescing_key(
+        'tenant', 'dep', _workflow(parameters={'b': 2, 'a': 1}),
+    )
+
+    assert first == second
+
+
+def test_different_reactions_different_keys():
+    base = notify_cloudify.get_coalescing_key('tenant', 'dep', _workflow())
+
+    assert base != notify_cloudify.get_coalescing_key(
+        'other', 'dep', _workflow(),
+    )
+    assert base != notify_cloudify.get_coalescing_key(
+        'tenant', 'other', _workflow(),
+    )
+    assert base != notify_cloudify.get_coalescing_key(
+        'tenant', 'dep', _workflow(workflow_id='heal'),
+    )
+    assert base != notify_cloudify.get_coalescing_key(
+        'tenant', 'dep', _workflow(parameters={'delta': 2}),
+    )
@@ -0,0 +1,110 @@
+import json
+import os
+
+import mock
+
+import tests.links.notify_cloudify as notify_cloudify
+
+
+REACTION_CONFIGURATION = {
+    'checks': {
+        'cpu': {
+            'high': {
+                'workflow': {
+                    'workflow_id': 'heal',
+                    'parameters': {
+                        'node_instance_id': '{{instance}}',
+                        'description': '{{node}} in {{deployment}}',
+                        'untouched': 'plain',
+                    },
+                },
+            },
+        },
+    },
+}
+
+
+def _write_configuration(tmpdir, configuration, mtime=1000):
+    path = tmpdir.join('reactions.json')
+    path.write(json.dumps(configuration))
+    os.utime(str(path), (mtime, mtime))
+    return str(path)
+
+
+def test_substitutions(tmpdir):
+    path = _write_configuration(tmpdir, REACTION_CONFIGURATION)
+
+    result = notify_cloudify.load_reaction_configuration(
+        path, 'mynode_abc123', 'mydep',
+    )
+
+    parameters = result['checks']['cpu']['high']['workflow']['parameters']
+    assert parameters == {
+        'node_instance_id': 'mynode_abc123',
+        'description': 'mynode in mydep',
+        'untouched': 'plain',
+    }
+
+
+def test_values_are_not_interpreted_as_json(tmpdir):
+    path = _write_configuration(tmpdir, REACTION_CONFIGURATION)
+
+    result = notify_cloudify.load_reaction_configuration(
+        path, 'node_x', 'dep"with"quotes',
+    )
+
+    parameters = result['checks']['cpu']['high']['workflow']['parameters']
+    assert parameters['description'] == 'node in dep"with"quotes'
+
+
+def test_file_parsed_once(tmpdir):
+    path = _write_configuration(tmpdir, REACTION_CONFIGURATION)
+
+    with mock.patch('tests.links.notify_cloudify.json.loads',
+                    wraps=json.loads) as loads:
+        first = notify_cloudify.load_reaction_configuration(
+            path, 'node_1', 'dep',
+        )
+        second = notify_cloudify.load_reaction_configuration(
+            path, 'node_2', 'dep',
+        )
+        assert loads.call_count == 1
+
+    # Each caller gets its own copy to modify
+    first['checks']['cpu']['high']['deployment'] = 'changed'
+    assert 'deployment' not in second['checks']['cpu']['high']
+    assert second['checks']['cpu']['high']['workflow']['parameters'][
+        'node_instance_id'] == 'node_2'
+
+
+def test_changed_file_reloaded(tmpdir):
+    path = _write_configuration(tmpdir, REACTION_CONFIGURATION)
+    notify_cloudify.load_reaction_configuration(path, 'node_1', 'dep')
+
+    _write_configuration(tmpdir, {'host': {'workflow': '{{node}}'}},
+                         mtime=2000)
+    result = notify_cloudify.load_reaction_configuration(
+        path, 'node_1', 'dep',
+    )
+
+    assert result == {'host': {'workflow': 'node'}}
+
+
+def test_configured_reaction_keeps_placeholders(tmpdir):
+    path = _write_configuration(tmpdir, REACTION_CONFIGURATION)
+
+    first = notify_cloudify.load_reaction_configuration(
+        path, 'mynode_abc123', 'mydep', substitute=False,
+    )
+    second = notify_cloudify.load_reaction_configuration(
+        path, 'mynode_def456', 'mydep', substitute=False,
+    )
+
+    workflow = first['checks']['cpu']['high']['workflow']
+    assert workflow['parameters']['node_instance_id'] == '{{instance}}'
+    # Reactions for different instances of a node are coalesced
+    assert notify_cloudify.get_coalescing_key(
+        'tenant', 'mydep', workflow,
+    ) == notify_cloudify.get_coalescing_key(
+        'tenant', 'mydep', second['checks']['cpu']['high']['workflow'],
+    )
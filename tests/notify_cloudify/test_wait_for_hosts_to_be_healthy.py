@@ -0,0 +1,57 @@
+import mock
+import pytest
+
+from tests.fakes import FakeLogger
+import tests.links.notify_cloudify as notify_cloudify
+
+
+def _status(states):
+    return {
+        'hoststatus': [
+            {'host_name': host, 'current_state': state}
+            for host, state in states.items()
+        ],
+        'servicestatus': [],
+    }
+
+
+@mock.patch('tests.links.notify_cloudify.nagios.send_nagios_commands')
+@mock.patch('tests.links.notify_cloudify.nagios.get_nagios_status_watcher')
+def test_waits_until_all_healthy(get_watcher, send_commands):
+    watcher = get_watcher.return_value
+    updates = iter([
+        _status({'a': '1', 'b': '1'}),
+        _status({'a': '0', 'b': '1'}),
+        _status({'a': '0', 'b': '0'}),
+    ])
+    watcher.data = next(updates)
+
+    def change(timeout):
+        watcher.data = next(updates)
+        return True
+    watcher.wait_for_change.side_effect = change
+
+    notify_cloudify.wait_for_hosts_to_be_healthy(['a', 'b'], FakeLogger())
+
+    assert watcher.wait_for_change.call_count == 2
+    # Both hosts were rechecked together in one write
+    recheck = send_commands.call_args_list[0][0][0]
+    assert len(recheck) == 2
+
+
+@mock.patch('tests.links.notify_cloudify.time.time')
+@mock.patch('tests.links.notify_cloudify.nagios.send_nagios_commands')
+@mock.patch('tests.links.notify_cloudify.nagios.get_nagios_status_watcher')
+def test_times_out(get_watcher, send_commands, mock_time):
+    watcher = get_watcher.return_value
+    watcher.data = _status({'a': '0', 'b': '1'})
+    watcher.wait_for_change.return_value = False
+    mock_time.side_effect = [0, 0, 30, 60]
+
+    with pytest.raises(notify_cloudify.HostNotHealthy) as err:
+        notify_cloudify.wait_for_hosts_to_be_healthy(
+            ['a', 'b'], FakeLogger(), max_checks=6, check_interval=10,
+        )
+
+    assert 'b' in str(err.value)
+    assert 'a,' not in str(err.value)
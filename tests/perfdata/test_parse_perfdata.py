@@ -0,0 +1,99 @@
+import pytest
+
+import group_check_utils
+import perfdata
+
+
+def test_simple_value():
+    assert perfdata.parse_perfdata(' sum(oid)=1.5') == [
+        ('sum(oid)', 1.5, '', None, None, None, None),
+    ]
+
+
+def test_full_entry():
+    result = perfdata.parse_perfdata("time=0.002s;0.5;1:2;0;10.5")
+
+    assert result == [('time', 0.002, 's', '0.5', '1:2', 0.0, 10.5)]
+    assert result[0].uom == 's'
+    assert result[0].crit == '1:2'
+
+
+def test_multiple_entries():
+    result = perfdata.parse_perfdata(
+        "iso.3.6.1.2.1.2.2.1.10.1=1234c "
+        "'disk used'=80%;~:90;@95:100;; "
+        "load=-1.5e1\n"
+    )
+
+    assert [entry.label for entry in result] == [
+        'iso.3.6.1.2.1.2.2.1.10.1', 'disk used', 'load',
+    ]
+    assert [entry.value for entry in result] == [1234.0, 80.0, -15.0]
+    assert [entry.uom for entry in result] == ['c', '%', '']
+    assert result[1].warn == '~:90'
+    assert result[1].crit == '@95:100'
+    assert result[1].min is None
+
+
+def test_quoted_label_with_quote_and_equals():
+    result = perfdata.parse_perfdata("'it''s = here'=3")
+
+    assert result[0].label == "it's = here"
+    assert result[0].value == 3.0
+
+
+def test_undetermined_value():
+    assert perfdata.parse_perfdata('value=U')[0].value is None
+
+
+@pytest.mark.parametrize('value,expected', [
+    ('nan', 'nan'),
+    ('inf', 'inf'),
+    ('-inf', '-inf'),
+    ('NaN', 'nan'),
+])
+def test_non_finite_value(value, expected):
+    result = perfdata.parse_perfdata('stddev(oid)=' + value)
+
+    assert repr(result[0].value) == expected
+
+
+def test_empty():
+    assert perfdata.parse_perfdata('  ') == []
+
+
+@pytest.mark.parametrize('data', [
+    'novalue',
+    'label=',
+    'label=abc',
+    'label=1;2;3;4;5;6',
+    'label=1 garbage',
+])
+def test_malformed(data):
+    with pytest.raises(perfdata.PerfdataError):
+        perfdata.parse_perfdata(data)
+
+
+def test_get_last_value():
+    assert perfdata.get_last_value('a=1 b=2;3;4') == 2.0
+
+
+@pytest.mark.parametrize('data', ['', 'a=U'])
+def test_get_last_value_missing(data):
+    with pytest.raises(perfdata.PerfdataError):
+        perfdata.get_last_value(data)
+
+
+@pytest.mark.parametrize('group_name', [
+    'eu west',
+    "o'brien's group",
+    "it's = here",
+])
+def test_group_perfdata_round_trip(group_name):
+    # Group checks report their result in the perfdata of the checks that
+    # meta groups and parent groups aggregate
+    check_identifier = 'arithmetic_mean(web/{name})'.format(name=group_name)
+    result = group_check_utils.generate_perfdata(check_identifier, 1.5)
+
+    assert perfdata.get_last_value(result) == 1.5
+    assert perfdata.parse_perfdata(result)[-1].label == check_identifier
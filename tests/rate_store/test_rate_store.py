@@ -0,0 +1,124 @@
+import json
+import os
+import sqlite3
+
+import rate_store
+
+
+def _swap(key, timestamp, value, db_path):
+    return rate_store.update_value(
+        key,
+        lambda previous: (
+            {'timestamp': timestamp, 'result': value, 'smoothed': value * 2},
+            previous,
+        ),
+        db_path,
+    )
+
+
+def test_update_returns_previous(tmpdir):
+    db_path = str(tmpdir.join('rates.db'))
+    key = str(tmpdir.join('instances', 'host', 'oid'))
+
+    assert _swap(key, 90, 32, db_path) is None
+    assert _swap(key, 100, 42, db_path) == {
+        'timestamp': 90,
+        'result': 32,
+        'smoothed': 64,
+    }
+    assert _swap(key, 110.5, 52, db_path) == {
+        'timestamp': 100,
+        'result': 42,
+        'smoothed': 84,
+    }
+
+
+def test_failed_update_not_stored(tmpdir):
+    db_path = str(tmpdir.join('rates.db'))
+    key = 'somekey'
+    _swap(key, 90, 32, db_path)
+
+    def fail(previous):
+        raise RuntimeError('failed')
+
+    try:
+        rate_store.update_value(key, fail, db_path)
+        raise AssertionError('RuntimeError was not raised')
+    except RuntimeError:
+        pass
+
+    assert _swap(key, 100, 42, db_path)['result'] == 32
+
+
+def test_migrate_legacy_file(tmpdir):
+    db_path = str(tmpdir.join('rates.db'))
+    legacy = tmpdir.join('legacy')
+    legacy.write(json.dumps({'timestamp': 90, 'result': 32}))
+
+    result = _swap(str(legacy), 100, 42, db_path)
+
+    assert result == {'timestamp': 90, 'result': 32, 'smoothed': None}
+    assert not os.path.exists(str(legacy))
+    assert _swap(str(legacy), 110, 52, db_path)['result'] == 42
+
+
+def test_bad_legacy_file(tmpdir):
+    db_path = str(tmpdir.join('rates.db'))
+    legacy = tmpdir.join('legacy')
+    legacy.write('not json')
+
+    assert _swap(str(legacy), 100, 42, db_path) is None
+    assert not os.path.exists(str(legacy))
+
+
+def test_upgrade_from_version_1(tmpdir):
+    db_path = str(tmpdir.join('rates.db'))
+    connection = sqlite3.connect(db_path)
+    connection.execute(
+        'CREATE TABLE rates (key TEXT PRIMARY KEY, '
+        'timestamp REAL NOT NULL, value REAL NOT NULL)'
+    )
+    connection.execute("INSERT INTO rates VALUES ('somekey', 90, 32)")
+    connection.commit()
+    connection.close()
+
+    assert _swap('somekey', 100, 42, db_path) == {
+        'timestamp': 90,
+        'result': 32,
+        'smoothed': None,
+    }
+
+
+def test_purge_prefix(tmpdir):
+    db_path = str(tmpdir.join('rates.db'))
+    for key in ('/rates/instances/host1/a',
+                '/rates/instances/host1/b',
+                '/rates/instances/host10/a',
+                '/rates/instances/host2/a'):
+        _swap(key, 90, 1, db_path)
+
+    assert rate_store.purge('/rates/instances/host1', db_path) == 2
+
+    assert _swap('/rates/instances/host1/a', 100, 1, db_path) is None
+    assert _swap('/rates/instances/host10/a', 100, 1, db_path) is not None
+    assert _swap('/rates/instances/host2/a', 100, 1, db_path) is not None
+
+
+def test_update_values_removes_stale(tmpdir):
+    db_path = str(tmpdir.join('rates.db'))
+    updates = {
+        key: lambda previous: ({'timestamp': 90, 'result': 1}, previous)
+        for key in ('/node/check/host1/0', '/node/check/host2/0')
+    }
+    rate_store.update_values(updates, db_path)
+    _swap('/node/other/host1/0', 90, 1, db_path)
+
+    outcomes = rate_store.update_values(
+        {'/node/check/host1/0': updates['/node/check/host1/0']},
+        db_path,
+        stale_prefix='/node/check',
+    )
+
+    assert outcomes['/node/check/host1/0']['result'] == 1
+    assert _swap('/node/check/host2/0', 100, 1, db_path) is None
+    assert _swap('/node/other/host1/0', 100, 1, db_path) is not None
@@ -0,0 +1,52 @@
+import rate_store
+
+
+def test_ring_keeps_latest_samples():
+    ring = rate_store.SampleRing(3)
+    for timestamp in range(5):
+        ring.append(timestamp, timestamp * 10.0)
+
+    assert list(ring) == [(2, 20.0), (3, 30.0), (4, 40.0)]
+    assert len(ring) == 3
+
+
+def test_values_since():
+    ring = rate_store.SampleRing(5)
+    for timestamp in range(4):
+        ring.append(timestamp, timestamp * 10.0)
+
+    assert ring.values_since(2) == [20.0, 30.0]
+
+
+def test_append_sample_persists(tmpdir):
+    db_path = str(tmpdir.join('rates.db'))
+
+    for timestamp in range(4):
+        ring = rate_store.append_sample('key', timestamp, timestamp * 10.0,
+                                        3, db_path)
+
+    assert list(ring) == [(1, 10.0), (2, 20.0), (3, 30.0)]
+
+
+def test_append_sample_resizes(tmpdir):
+    db_path = str(tmpdir.join('rates.db'))
+
+    for timestamp in range(4):
+        rate_store.append_sample('key', timestamp, timestamp * 10.0, 4,
+                                 db_path)
+    ring = rate_store.append_sample('key', 4, 40.0, 2, db_path)
+
+    assert list(ring) == [(3, 30.0), (4, 40.0)]
+
+
+def test_purge_removes_history(tmpdir):
+    db_path = str(tmpdir.join('rates.db'))
+    rate_store.append_sample('/groups/t/type/group', 1, 10.0, 3, db_path)
+    rate_store.append_sample('/groups/t/type/group2', 1, 10.0, 3, db_path)
+
+    assert rate_store.purge('/groups/t/type/group', db_path) == 1
+
+    assert len(rate_store.append_sample('/groups/t/type/group', 2, 20.0, 3,
+                                        db_path)) == 1
+    assert len(rate_store.append_sample('/groups/t/type/group2', 2, 20.0, 3,
+                                        db_path)) == 2
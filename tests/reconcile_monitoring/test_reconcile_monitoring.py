@@ -0,0 +1,133 @@
+import mock
+import pytest
+
+# The plugin operations can only be loaded where cloudify is installed
+pytest.importorskip('cloudify')
+
+from cloudify.mocks import MockCloudifyContext  # noqa: E402
+from cloudify.state import current_ctx  # noqa: E402
+
+from managed_nagios_plugin.nagios import tasks  # noqa: E402
+from tests.fakes import FakeLogger  # noqa: E402
+
+MONITORED_NODES = {
+    't1': [('dep1', 'node1'), ('dep1', 'node2'), ('dep2', 'node1')],
+    't2': [('dep3', 'node1')],
+}
+
+
+@pytest.fixture
+def ctx():
+    context = MockCloudifyContext(
+        node_id='nagios_1',
+        runtime_properties={},
+    )
+    context._logger = FakeLogger()
+    current_ctx.set(context)
+    yield context
+    current_ctx.clear()
+
+
+@pytest.fixture
+def manager():
+    with mock.patch.object(tasks, 'get_entities') as get_entities:
+        with mock.patch.object(tasks, 'iter_entities') as iter_entities:
+            with mock.patch.object(tasks, 'run_workflow') as run_workflow:
+                get_entities.return_value = [
+                    {'name': tenant} for tenant in sorted(MONITORED_NODES)
+                ]
+                iter_entities.side_effect = lambda tenant, **kwargs: [
+                    {'deployment_id': deployment, 'id': node}
+                    for deployment, node in MONITORED_NODES[tenant]
+                ]
+                yield run_workflow
+
+
+def _started(run_workflow):
+    return sorted(
+        (call[1]['tenant'], call[1]['deployment'],
+         sorted(call[1]['parameters']['node_ids']))
+        for call in run_workflow.call_args_list
+    )
+
+
+def test_reconcile_fans_out(ctx, manager):
+    with mock.patch.object(tasks, 'ThreadPool',
+                           wraps=tasks.ThreadPool) as pool:
+        tasks.reconcile_monitoring(ctx=ctx, concurrency=3)
+
+    pool.assert_called_once_with(3)
+    assert _started(manager) == [
+        ('t1', 'dep1', ['node1', 'node2']),
+        ('t1', 'dep2', ['node1']),
+        ('t2', 'dep3', ['node1']),
+    ]
+    assert (tasks.RECONCILE_CHECKPOINT_PROPERTY
+            not in ctx.instance.runtime_properties)
+
+
+def test_reconcile_checkpoints_problems(ctx, manager):
+    def run_workflow(deployment, **kwargs):
+        if deployment == 'dep2':
+            raise tasks.StartWorkflowFailed('Manager unavailable')
+    manager.side_effect = run_workflow
+
+    tasks.reconcile_monitoring(ctx=ctx)
+
+    checkpoint = ctx.instance.runtime_properties[
+        tasks.RECONCILE_CHECKPOINT_PROPERTY]
+    assert dict(
+        (tenant, sorted(deployments))
+        for tenant, deployments in checkpoint.items()
+    ) == {'t1': ['dep1'], 't2': ['dep3']}
+    assert ctx.logger.string_appears_in('warn', ('t1', 'dep2'))
+
+
+def test_reconcile_resumes_from_checkpoint(ctx, manager):
+    ctx.instance.runtime_properties[tasks.RECONCILE_CHECKPOINT_PROPERTY] = {
+        't1': ['dep1'],
+        't2': ['dep3'],
+    }
+
+    tasks.reconcile_monitoring(ctx=ctx, resume=True)
+
+    assert _started(manager) == [('t1', 'dep2', ['node1'])]
+    # Cleared once everything has been started
+    assert (tasks.RECONCILE_CHECKPOINT_PROPERTY
+            not in ctx.instance.runtime_properties)
+
+
+def test_reconcile_ignores_checkpoint_without_resume(ctx, manager):
+    ctx.instance.runtime_properties[tasks.RECONCILE_CHECKPOINT_PROPERTY] = {
+        't1': ['dep1'],
+    }
+
+    tasks.reconcile_monitoring(ctx=ctx)
+
+    assert len(_started(manager)) == 3
+    assert ctx.logger.string_appears_in('info', 'ignoring checkpoint')
+
+
+def test_reconcile_checkpoints_on_error(ctx, manager):
+    def run_workflow(deployment, **kwargs):
+        if deployment == 'dep3':
+            raise RuntimeError('Connection lost')
+    manager.side_effect = run_workflow
+
+    # With one thread, the deployments of t1 are started before dep3
+    with pytest.raises(RuntimeError):
+        tasks.reconcile_monitoring(ctx=ctx, concurrency=1)
+
+    checkpoint = ctx.instance.runtime_properties[
+        tasks.RECONCILE_CHECKPOINT_PROPERTY]
+    assert dict(
+        (tenant, sorted(deployments))
+        for tenant, deployments in checkpoint.items()
+    ) == {'t1': ['dep1', 'dep2']}
+
+
+def test_reconcile_only_tenants(ctx, manager):
+    tasks.reconcile_monitoring(ctx=ctx, only_tenants=['t2'])
+
+    assert _started(manager) == [('t2', 'dep3', ['node1'])]
+    assert ctx.logger.string_appears_in('info', 'skipping tenant t1')
@@ -0,0 +1,66 @@
+import mock
+
+import rest_utils
+
+from tests.fakes import FakeLogger
+
+
+def _pages(*pages):
+    return [{'items': page} for page in pages]
+
+
+@mock.patch('rest_utils.ENTITY_PAGE_SIZE', 2)
+@mock.patch('rest_utils.make_request')
+def test_stops_after_short_page(mock_make_request):
+    mock_make_request.side_effect = _pages(
+        [{'id': 'a'}, {'id': 'b'}],
+        [{'id': 'c'}],
+    )
+
+    result = rest_utils.get_entities('nodes', 'tenant', ['id'], FakeLogger())
+
+    assert [entity['id'] for entity in result] == ['a', 'b', 'c']
+    assert mock_make_request.call_count == 2
+
+
+@mock.patch('rest_utils.make_request')
+def test_projection_and_filters_sent(mock_make_request):
+    mock_make_request.side_effect = _pages([])
+
+    list(rest_utils.iter_entities(
+        'nodes', 'tenant', ['id'], FakeLogger(),
+        include_fields=['id', 'properties'],
+        filters={'deployment_id': ['dep1', 'dep2']},
+    ))
+
+    params = mock_make_request.call_args[1]['request_parameters']
+    assert params['_include'] == 'id,properties'
+    assert params['deployment_id'] == ['dep1', 'dep2']
+
+
+@mock.patch('rest_utils.make_request')
+def test_properties_used_as_default_projection(mock_make_request):
+    mock_make_request.side_effect = _pages([])
+
+    list(rest_utils.iter_entities('nodes', 'tenant', ['id', 'deployment_id'],
+                                  FakeLogger()))
+
+    params = mock_make_request.call_args[1]['request_parameters']
+    assert params['_include'] == 'id,deployment_id'
+    assert 'deployment_id' not in params
+
+
+@mock.patch('rest_utils.make_request')
+def test_include_and_property_trimming(mock_make_request):
+    mock_make_request.side_effect = _pages([
+        {'id': 'a', 'properties': {'nagiosrest_monitoring': {}}},
+        {'id': 'b', 'properties': {}},
+    ])
+
+    result = list(rest_utils.iter_entities(
+        'nodes', 'tenant', ['id'], FakeLogger(),
+        include=lambda node: 'nagiosrest_monitoring' in node['properties'],
+        include_fields=['id', 'properties'],
+    ))
+
+    assert result == [{'id': 'a'}]
@@ -0,0 +1,24 @@
+import mock
+
+import rest_utils
+
+
+@mock.patch('rest_utils.time.sleep')
+@mock.patch('rest_utils.time.time', return_value=100.0)
+def test_requests_spaced_out(mock_time, mock_sleep):
+    limiter = rest_utils.RateLimiter(4)
+
+    for _ in range(3):
+        limiter.wait()
+
+    assert [call[0][0] for call in mock_sleep.call_args_list] == [0.25, 0.5]
+
+
+@mock.patch('rest_utils.time.sleep')
+def test_unlimited(mock_sleep):
+    limiter = rest_utils.RateLimiter(0)
+
+    for _ in range(3):
+        limiter.wait()
+
+    assert mock_sleep.call_count == 0
@@ -0,0 +1,69 @@
+import json
+
+import mock
+import pytest
+
+import timing
+
+
+@pytest.fixture
+def enabled(tmpdir):
+    config_path = tmpdir.join('timing.json')
+    config_path.write(json.dumps({'summary_interval': 60}))
+    timing.load_configuration(str(config_path))
+    yield
+    timing._CONFIGURATION.clear()
+    timing.SPANS.clear()
+
+
+def test_disabled_without_configuration(tmpdir):
+    timing.load_configuration(str(tmpdir.join('missing.json')))
+    try:
+        with timing.span('status_parse'):
+            pass
+        assert timing.SPANS == {}
+        assert timing.get_perfdata() == ''
+    finally:
+        timing._CONFIGURATION.clear()
+
+
+@mock.patch('timing.time.time')
+def test_spans_recorded(mock_time, enabled):
+    mock_time.side_effect = [10, 10.5, 20, 20.25]
+
+    with timing.span('status_parse'):
+        pass
+    with timing.span('status_parse'):
+        pass
+
+    assert timing.SPANS == {'status_parse': (0.75, 2)}
+    assert timing.get_perfdata() == ' timing_status_parse=0.750000s'
+
+
+@mock.patch('timing.time.time')
+def test_summary_periods(mock_time, enabled, tmpdir):
+    summary_path = str(tmpdir.join('summary.json'))
+
+    mock_time.return_value = 100
+    timing.record('snmp_call', 1.5)
+    timing.write_summary('check', summary_path)
+    timing.record('snmp_call', 0.5)
+    timing.write_summary('check', summary_path)
+    assert timing.SPANS == {}
+    assert timing.load_summary(summary_path) == {
+        'current': {'start': 100, 'spans': {'check/snmp_call': [2.0, 2]}},
+        'previous': {},
+    }
+
+    # A new period starts once the interval has passed
+    mock_time.return_value = 170
+    timing.record('rest_call', 1)
+    timing.write_summary('notify', summary_path)
+    assert timing.load_summary(summary_path) == {
+        'current': {'start': 170, 'spans': {'notify/rest_call': [1, 1]}},
+        'previous': {
+            'start': 100,
+            'end': 170,
+            'spans': {'check/snmp_call': [2.0, 2]},
+        },
+    }
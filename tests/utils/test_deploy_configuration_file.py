@@ -0,0 +1,79 @@
+import os
+
+import mock
+import pytest
+
+import utils
+from tests.fakes import FakeLogger
+
+
+@pytest.fixture
+def deploy(tmpdir):
+    template = tmpdir.join('hostgroup.template')
+    template.write('define hostgroup {\n  hostgroup_name {{ name }}\n}\n')
+    with mock.patch.object(utils, 'BASE_OBJECTS_DIR', str(tmpdir)):
+        with mock.patch.multiple(
+            utils,
+            NAGIOS_CONFIG_CACHE_FILE=str(tmpdir.join('objects.cache')),
+            deploy_file=mock.DEFAULT,
+            validate_configuration=mock.DEFAULT,
+            trigger_nagios_reload=mock.DEFAULT,
+        ) as mocks:
+            def deploy_configuration(name):
+                return utils.deploy_configuration_file(
+                    FakeLogger(),
+                    source=str(template),
+                    destination='hostgroup.cfg',
+                    template_params={'name': name},
+                    use_pkg_data=False,
+                )
+            yield deploy_configuration, mocks
+
+
+def test_deploys_new_configuration(deploy):
+    deploy_configuration, mocks = deploy
+
+    assert deploy_configuration('tenant:t1')
+
+    data, destination = mocks['deploy_file'].call_args[0][:2]
+    assert data == 'define hostgroup {\n  hostgroup_name tenant:t1\n}'
+    assert destination.endswith('/hostgroup.cfg')
+    assert mocks['validate_configuration'].called
+    assert mocks['trigger_nagios_reload'].called
+
+
+def _write(path, data, mtime):
+    path.write(data)
+    os.utime(str(path), (mtime, mtime))
+
+
+def test_unchanged_configuration_not_deployed(deploy, tmpdir):
+    deploy_configuration, mocks = deploy
+    _write(tmpdir.join('hostgroup.cfg'),
+           'define hostgroup {\n  hostgroup_name tenant:t1\n}', 1000)
+    # Nagios has loaded the configuration since
+    _write(tmpdir.join('objects.cache'), '', 1010)
+
+    assert not deploy_configuration('tenant:t1')
+    assert not mocks['deploy_file'].called
+    assert not mocks['validate_configuration'].called
+    assert not mocks['trigger_nagios_reload'].called
+
+    assert deploy_configuration('tenant:t2')
+    assert mocks['trigger_nagios_reload'].called
+
+
+@pytest.mark.parametrize('cache_mtime', [None, 990, 1000])
+def test_unchanged_configuration_reloaded_until_loaded(deploy, tmpdir,
+                                                       cache_mtime):
+    deploy_configuration, mocks = deploy
+    # As if the reload after writing the file failed
+    _write(tmpdir.join('hostgroup.cfg'),
+           'define hostgroup {\n  hostgroup_name tenant:t1\n}', 1000)
+    if cache_mtime:
+        _write(tmpdir.join('objects.cache'), '', cache_mtime)
+
+    assert deploy_configuration('tenant:t1')
+    assert mocks['deploy_file'].called
+    assert mocks['validate_configuration'].called
+    assert mocks['trigger_nagios_reload'].called